@@ -1,7 +1,8 @@
-import json
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Mapping
 from .schemas import TraceData
+from .fastjson import LazyArgs
+from .lazytext import TextRef, materialize
 
 '''
 仅凭 Trajectories, 我们会丢失了以下系统级维度，分析时必须忽略或设置为默认值：
@@ -22,11 +23,24 @@ try:
 
     def count_tokens(text: str) -> int:
         return len(ENCODER.encode(text or ""))
+
+
+    def count_tokens_batch(texts: List[str], num_threads: int = 8) -> List[int]:
+        """批量计数：tiktoken 在其内部线程池中编码，并释放 GIL"""
+        return [len(tokens) for tokens in ENCODER.encode_batch([t or "" for t in texts], num_threads=num_threads)]
 except ImportError:
     def count_tokens(text: str) -> int:
         return len(text or "") // 4
 
 
+    def count_tokens_batch(texts: List[str], num_threads: int = 8) -> List[int]:
+        return [count_tokens(t) for t in texts]
+
+
+# 所有 assistant 回复的 output_token_count 之和 (即导出的 assistant 消息正文的 token 数，供 SequencePacker 复用)
+RESPONSE_TOKENS_METRIC = "gemini_cli.response.output_token.count"
+
+
 class OpenAIAdapter:
     """
     将原始 OpenAI 格式对话转换为内部 TraceData 对象。
@@ -34,12 +48,12 @@ class OpenAIAdapter:
     """
 
     @staticmethod
-    def infer_lines_changed(function_name: str, args: Dict) -> int:
-        """从工具参数中推断代码变更行数"""
+    def infer_lines_changed(function_name: str, args: Mapping) -> int:
+        """从工具参数中推断代码变更行数 (只有写入类工具才会触发 LazyArgs 解析)"""
         # 常见的文件写入/修改工具名
         write_tools = ['write_file', 'create_file', 'update_file', 'apply_diff', 'replace_string']
 
-        if any(t in function_name.lower() for t in write_tools):
+        if function_name and any(t in function_name.lower() for t in write_tools):
             content = args.get('content') or args.get('code') or args.get('diff') or ""
             if isinstance(content, str):
                 return len(content.splitlines())
@@ -47,6 +61,46 @@ class OpenAIAdapter:
 
     @staticmethod
     def to_trace_data(trace_id: str, messages: List[Dict[str, Any]]) -> TraceData:
+        trace, texts, slots = OpenAIAdapter._build(trace_id, messages)
+        OpenAIAdapter._fill_token_counts(trace, slots, [count_tokens(t) for t in texts])
+        return trace
+
+    @staticmethod
+    def to_trace_data_batch(items: List[Tuple[str, List[Dict[str, Any]]]], num_threads: int = 8) -> List[TraceData]:
+        """
+        批量转换：先收集一批轨迹中所有待计数的文本，再用一次 batch 调用多线程计数。
+        结果与逐条调用 to_trace_data 完全一致。
+        :param items: [(trace_id, messages), ...]
+        """
+        built = [OpenAIAdapter._build(trace_id, messages) for trace_id, messages in items]
+
+        all_texts = [t for _, texts, _ in built for t in texts]
+        counts = count_tokens_batch(all_texts, num_threads=num_threads)
+
+        traces = []
+        offset = 0
+        for trace, texts, slots in built:
+            OpenAIAdapter._fill_token_counts(trace, slots, counts[offset:offset + len(texts)])
+            offset += len(texts)
+            traces.append(trace)
+        return traces
+
+    @staticmethod
+    def _fill_token_counts(trace: TraceData, slots: List[Dict[str, Any]], counts: List[int]):
+        """回填 token 计数：写入对应 api_response 事件的 output_token_count，并汇总到指标中"""
+        for slot, cnt in zip(slots, counts):
+            slot["output_token_count"] = cnt
+        trace.metrics[RESPONSE_TOKENS_METRIC] = sum(counts)
+
+    @staticmethod
+    def _build(trace_id: str, messages: List[Dict[str, Any]]):
+        """
+        构建 TraceData，但不做 token 计数。
+        返回 (trace, 待计数文本, 对应的回填位置)
+        """
+        texts: List[str] = []
+        slots: List[Dict[str, Any]] = []
+
         metrics = {
             "gemini_cli.lines.changed": 0,
             "gemini_cli.file.operation.count": 0,
@@ -54,6 +108,7 @@ class OpenAIAdapter:
             "gemini_cli.tool.call.count": 0,
             "gemini_cli.agent.recovery_attempt.count": 0,
             "gemini_cli.exit.fail.count": 0,  # 无法得知，默认为0
+            RESPONSE_TOKENS_METRIC: 0,  # 由 _fill_token_counts 回填
         }
 
         events = []
@@ -67,6 +122,9 @@ class OpenAIAdapter:
         for i, msg in enumerate(messages):
             role = msg.get('role')
             content = msg.get('content')
+            if role != 'tool':
+                # 零拷贝模式下 Prompt / 回复在此解码；工具输出保持 TextRef，只按需解码开头
+                content = materialize(content)
 
             # 1. User Prompt
             if role == 'user':
@@ -88,13 +146,17 @@ class OpenAIAdapter:
                     # 极其简化的提取逻辑，实际需正则
                     pass
 
+                response_attrs = {
+                    "response_text": content,
+                    "output_token_count": 0,  # 由 _fill_token_counts 回填
+                    "thoughts_token_count": thoughts_tokens  # 可能为0
+                }
+                texts.append(content)
+                slots.append(response_attrs)
+
                 events.append({
                     "name": "gemini_cli.api_response",
-                    "attributes": {
-                        "response_text": content,
-                        "output_token_count": count_tokens(content),
-                        "thoughts_token_count": thoughts_tokens  # 可能为0
-                    }
+                    "attributes": response_attrs
                 })
 
                 # 处理 Tool Calls
@@ -102,10 +164,9 @@ class OpenAIAdapter:
                 for tc in tool_calls:
                     func = tc.get('function', {})
                     fname = func.get('name')
-                    try:
-                        fargs = json.loads(func.get('arguments', '{}'))
-                    except:
-                        fargs = {}
+                    raw_args = func.get('arguments', '{}')
+                    # 参数保持原始字符串，只有真正读取字段时才解析 (大文件写入的参数往往占解析时间的大头)
+                    fargs = LazyArgs(raw_args) if isinstance(raw_args, (str, TextRef)) else (raw_args or {})
 
                     metrics["gemini_cli.tool.call.count"] += 1
 
@@ -130,9 +191,10 @@ class OpenAIAdapter:
                 # 寻找对应的 tool call 事件来回填 success 状态
                 call_id = msg.get('tool_call_id')
                 is_error = False
+                head = content.prefix(200) if isinstance(content, TextRef) else str(content)
 
                 # 简单的错误检测逻辑
-                content_lower = str(content).lower()[:200]  # 只看开头
+                content_lower = head.lower()[:200]  # 只看开头
                 if "error" in content_lower or "exception" in content_lower or "failed" in content_lower:
                     is_error = True
                     metrics["gemini_cli.agent.recovery_attempt.count"] += 1  # 视为发生了一次错误，需要恢复
@@ -144,7 +206,7 @@ class OpenAIAdapter:
                             event['attributes'].get('tool_call_id') == call_id:
                         event['attributes']['success'] = not is_error
                         if is_error:
-                            event['attributes']['error'] = str(content)[:100]
+                            event['attributes']['error'] = head[:100]
                         break
 
-        return TraceData(trace_id=trace_id, metrics=metrics, events=events)
\ No newline at end of file
+        return TraceData(trace_id=trace_id, metrics=metrics, events=events), texts, slots
\ No newline at end of file
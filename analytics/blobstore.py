@@ -0,0 +1,238 @@
+"""
+内容寻址的去重存储 (Blob Store)
+
+大量轨迹中反复出现相同的大段文本：同一文件的 read_file 结果、系统提示词、样板代码等。
+导出数据集时把超过 min_bytes 的消息正文按 sha256 只存一份，样本中以引用代替：
+
+    {"role": "tool", "content": {"$blob": "<sha256>"}, ...}
+
+    store = BlobStore("dataset/blobs")
+    with JsonlDatasetSink("dataset", blob_store=store) as sink:
+        ...
+    for sample in iter_expanded("dataset/sft.jsonl", BlobStore("dataset/blobs")):
+        sample["openai_messages"]  # 已还原为完整文本
+
+    python -m analytics.blobstore expand --store dataset/blobs --in dataset/sft.jsonl --out sft.full.jsonl
+
+存储格式：
+    blobs.dat   所有 blob 的 UTF-8 原文顺序追加
+    blobs.idx   每行 "<sha256> <offset> <length>"
+先写数据再写索引，中断时末尾不完整的索引行会在下次打开时被忽略。
+同一目录同一时间只允许一个写入者。
+"""
+import argparse
+import hashlib
+import json
+import os
+from typing import List, Dict, Any, Iterator
+
+DATA_FILE = "blobs.dat"
+INDEX_FILE = "blobs.idx"
+REF_KEY = "$blob"
+
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and REF_KEY in value
+
+
+class BlobStore:
+    """按内容哈希去重的追加式存储"""
+
+    def __init__(self, root_dir: str, min_bytes: int = 1024):
+        """
+        :param root_dir: 存储目录，已存在时复用其中的 blob (跨多次导出去重)
+        :param min_bytes: 不小于该字节数的文本才放入存储，短文本直接内联
+        """
+        self.root_dir = root_dir
+        self.min_bytes = min_bytes
+        os.makedirs(root_dir, exist_ok=True)
+
+        self._index: Dict[str, tuple] = {}  # digest -> (offset, length)
+        self._data_w = None
+        self._index_w = None
+        self._data_r = None
+        self._size = 0
+
+        # 统计
+        self.refs = 0
+        self.blobs_written = 0
+        self.bytes_written = 0
+        self.bytes_deduped = 0
+
+        self._load_index()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root_dir, name)
+
+    def _load_index(self):
+        data_path = self._path(DATA_FILE)
+        self._size = os.path.getsize(data_path) if os.path.exists(data_path) else 0
+        if not os.path.exists(self._path(INDEX_FILE)):
+            return
+        with open(self._path(INDEX_FILE), encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 3:
+                    continue
+                digest, offset, length = parts[0], int(parts[1]), int(parts[2])
+                if offset + length <= self._size:
+                    self._index[digest] = (offset, length)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._index
+
+    # ---------------- 写入 ----------------
+
+    def put(self, text: str) -> str:
+        """存入文本 (已存在则只计数)，返回 sha256"""
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        self.refs += 1
+        if digest in self._index:
+            self.bytes_deduped += len(data)
+            return digest
+
+        if self._data_w is None:
+            self._data_w = open(self._path(DATA_FILE), 'ab')
+            self._index_w = open(self._path(INDEX_FILE), 'a', encoding='utf-8')
+        offset = self._size
+        self._data_w.write(data)
+        self._index_w.write(f"{digest} {offset} {len(data)}\n")
+        self._size += len(data)
+        self._index[digest] = (offset, len(data))
+        self.blobs_written += 1
+        self.bytes_written += len(data)
+        return digest
+
+    def _maybe_ref(self, value: Any) -> Any:
+        # 按字符数先做一次廉价判断，避免对每个短字符串编码
+        if isinstance(value, str) and len(value) * 4 >= self.min_bytes and \
+                len(value.encode('utf-8')) >= self.min_bytes:
+            return {REF_KEY: self.put(value)}
+        return value
+
+    def dedupe_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """把 content 与工具调用 arguments 中的大段文本替换为引用，返回新列表 (不修改输入)"""
+        out = []
+        for msg in messages:
+            msg = dict(msg)
+            if 'content' in msg:
+                msg['content'] = self._maybe_ref(msg['content'])
+            if msg.get('tool_calls'):
+                calls = []
+                for call in msg['tool_calls']:
+                    fn = call.get('function')
+                    if isinstance(fn, dict) and 'arguments' in fn:
+                        call = dict(call)
+                        call['function'] = dict(fn, arguments=self._maybe_ref(fn['arguments']))
+                    calls.append(call)
+                msg['tool_calls'] = calls
+            out.append(msg)
+        return out
+
+    def flush(self):
+        if self._data_w is not None:
+            self._data_w.flush()
+            self._index_w.flush()
+
+    # ---------------- 读取 ----------------
+
+    def get(self, digest: str) -> str:
+        loc = self._index.get(digest)
+        if loc is None:
+            raise KeyError(f"Blob {digest} not found in {self.root_dir}")
+        self.flush()
+        if self._data_r is None:
+            self._data_r = open(self._path(DATA_FILE), 'rb')
+        offset, length = loc
+        self._data_r.seek(offset)
+        return self._data_r.read(length).decode('utf-8')
+
+    def expand(self, value: Any) -> Any:
+        return self.get(value[REF_KEY]) if is_ref(value) else value
+
+    def expand_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """dedupe_messages 的逆操作"""
+        out = []
+        for msg in messages:
+            msg = dict(msg)
+            if 'content' in msg:
+                msg['content'] = self.expand(msg['content'])
+            if msg.get('tool_calls'):
+                calls = []
+                for call in msg['tool_calls']:
+                    fn = call.get('function')
+                    if isinstance(fn, dict) and is_ref(fn.get('arguments')):
+                        call = dict(call)
+                        call['function'] = dict(fn, arguments=self.expand(fn['arguments']))
+                    calls.append(call)
+                msg['tool_calls'] = calls
+            out.append(msg)
+        return out
+
+    # ---------------- 生命周期 ----------------
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "blobs": len(self._index),
+            "refs": self.refs,
+            "blobs_written": self.blobs_written,
+            "bytes_written": self.bytes_written,
+            "bytes_deduped": self.bytes_deduped
+        }
+
+    def close(self):
+        for f in (self._data_w, self._index_w, self._data_r):
+            if f is not None:
+                f.close()
+        self._data_w = self._index_w = self._data_r = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def iter_expanded(path: str, store: BlobStore) -> Iterator[Dict[str, Any]]:
+    """读取 Sink 写出的样本文件，还原 openai_messages 中的引用"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            sample = json.loads(line)
+            if sample.get('openai_messages'):
+                sample['openai_messages'] = store.expand_messages(sample['openai_messages'])
+            yield sample
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Content-addressed blob store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_expand = sub.add_parser("expand", help="restore full openai_messages in a dataset file")
+    p_expand.add_argument("--store", required=True)
+    p_expand.add_argument("--in", dest="input", required=True)
+    p_expand.add_argument("--out", required=True)
+    p_stats = sub.add_parser("stats", help="show blob store size")
+    p_stats.add_argument("--store", required=True)
+    args = parser.parse_args(argv)
+
+    with BlobStore(args.store) as store:
+        if args.command == "expand":
+            count = 0
+            with open(args.out, 'w', encoding='utf-8') as out:
+                for sample in iter_expanded(args.input, store):
+                    out.write(json.dumps(sample, ensure_ascii=False) + "\n")
+                    count += 1
+            print(f"📦 Expanded {count} samples -> {args.out}")
+        else:
+            size = os.path.getsize(os.path.join(args.store, DATA_FILE)) \
+                if os.path.exists(os.path.join(args.store, DATA_FILE)) else 0
+            print(f"📦 {len(store)} blobs, {size / 1024 / 1024:.2f} MB in {args.store}")
+
+
+if __name__ == "__main__":
+    main()
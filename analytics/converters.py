@@ -2,6 +2,7 @@ import json
 import pandas as pd
 from typing import List, Dict, Any
 from .schemas import AnalysisResult, TraceData
+from .fastjson import LazyArgs
 
 
 class OpenAIConverter:
@@ -31,6 +32,9 @@ class OpenAIConverter:
             elif name == 'gemini_cli.tool_call':
                 # 构造 Tool Call
                 call_id = f"call_{attrs.get('function_name')}_{hash(str(attrs))}"[:10]
+                fargs = attrs.get('function_args')
+                # LazyArgs 直接复用原始字符串，省去 loads + dumps 往返
+                arguments = fargs.to_json() if isinstance(fargs, LazyArgs) else json.dumps(fargs)
                 tool_msg = {
                     "role": "assistant",
                     "content": None,
@@ -39,7 +43,7 @@ class OpenAIConverter:
                         "type": "function",
                         "function": {
                             "name": attrs.get('function_name'),
-                            "arguments": json.dumps(attrs.get('function_args'))
+                            "arguments": arguments
                         }
                     }]
                 }
@@ -60,7 +64,12 @@ class ReportGenerator:
     """生成 HTML 排行榜报告"""
 
     @staticmethod
-    def generate_html(results: List[AnalysisResult], filename="report.html"):
+    def generate_html(results: List[AnalysisResult], filename="report.html", profiler=None):
+        if profiler is not None:
+            # 可选的内存分析 (MemoryProfiler)
+            with profiler.measure("report_generator"):
+                return ReportGenerator.generate_html(results, filename)
+
         data = []
         for res in results:
             # 提取第一句 Prompt 作为摘要
@@ -0,0 +1,115 @@
+import json
+import re
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .lazytext import materialize
+
+'''
+可插拔的 JSON 解码器：优先 orjson，其次 msgspec，最后回退到标准库 json。
+三者对合法 JSON 的解析结果一致；非法输入统一抛出 ValueError (json.JSONDecodeError / orjson.JSONDecodeError
+均为其子类，msgspec 的异常在此被转换)。
+'''
+
+
+def _stdlib_loads(data):
+    return json.loads(data)
+
+
+_DECODERS: Dict[str, Callable[[Any], Any]] = {"json": _stdlib_loads}
+
+try:
+    import orjson
+
+    _DECODERS["orjson"] = orjson.loads
+except ImportError:
+    pass
+
+try:
+    import msgspec
+
+    _msgspec_decoder = msgspec.json.Decoder()
+
+
+    def _msgspec_loads(data):
+        try:
+            return _msgspec_decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e))
+
+
+    _DECODERS["msgspec"] = _msgspec_loads
+except ImportError:
+    pass
+
+DECODER_NAME = next(name for name in ("orjson", "msgspec", "json") if name in _DECODERS)
+loads = _DECODERS[DECODER_NAME]
+
+
+def set_decoder(name: str):
+    """切换全局解码器：'orjson' / 'msgspec' / 'json'"""
+    global loads, DECODER_NAME
+    if name not in _DECODERS:
+        raise ValueError(f"JSON decoder '{name}' is not available, installed: {sorted(_DECODERS)}")
+    DECODER_NAME = name
+    loads = _DECODERS[name]
+
+
+def decode(data) -> Any:
+    """使用当前解码器解析 (供需要晚绑定 set_decoder 的调用方使用)"""
+    return loads(data)
+
+
+_EMPTY_OBJECT = re.compile(r"\{\s*\}")
+
+
+class LazyArgs(Mapping):
+    """
+    延迟解析的工具参数
+    保留原始 arguments 字符串，只有在真正读取字段时 (如 infer_lines_changed 处理写文件工具) 才解析。
+    解析失败时视为空参数，与 Adapter 原有的容错逻辑一致。
+    """
+
+    __slots__ = ("raw", "_parsed")
+
+    def __init__(self, raw):
+        """:param raw: 原始 arguments 字符串，或零拷贝模式下的 TextRef"""
+        self.raw = raw if raw is not None else "{}"
+        self._parsed: Optional[Dict[str, Any]] = None
+
+    @property
+    def parsed(self) -> Dict[str, Any]:
+        if self._parsed is None:
+            try:
+                value = decode(materialize(self.raw))
+            except (ValueError, TypeError):
+                value = {}
+            self._parsed = value if isinstance(value, dict) else {}
+        return self._parsed
+
+    @property
+    def is_parsed(self) -> bool:
+        return self._parsed is not None
+
+    def to_json(self) -> str:
+        """
+        导出 arguments 字符串：形如非空 JSON 对象 ({...}) 的原文直接复用，不做解析也不 dumps 往返；
+        否则 (空、空对象或不是对象) 导出 "{}"。只看原文的外形，结果与之前是否被解析过无关。
+        注意：花括号包住的非法 JSON 会原样导出，而不是像旧逻辑那样变成 "{}"
+        """
+        raw = materialize(self.raw).strip()
+        if raw[:1] == "{" and raw[-1:] == "}" and not _EMPTY_OBJECT.fullmatch(raw):
+            return raw
+        return "{}"
+
+    def __getitem__(self, key):
+        return self.parsed[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.parsed)
+
+    def __len__(self) -> int:
+        return len(self.parsed)
+
+    def __repr__(self):
+        return f"LazyArgs({self.raw!r})"
@@ -0,0 +1,284 @@
+"""
+打分特征存储 (Feature Store)
+
+处理时记录每条轨迹的 Scorer 原始特征与各 Filter 结论，调整 ScenarioConfig 权重后
+直接在存储的特征上重新打分，无需重新解析、适配、tokenize 和过滤全量数据。
+
+    pipeline = TracePipeline("swe_bench", feature_store=FeatureStoreWriter("features/"))
+    ...
+    python -m analytics.features rescore --store features/ --scenario swe_bench --out rescored.jsonl
+    python -m analytics.features rescore --store features/ --scenario my_module:MY_SCENARIO
+    python -m analytics.features rescore --store features/ --scenario scenarios/swe_strict.json
+
+存储格式为按列分文件的二进制数组 (array 模块)，过滤结论做字典编码：
+    meta.json           行数、特征列、过滤器列及其取值字典
+    trace_ids.jsonl     每行一个 JSON 编码的 trace_id
+    f_<feature>.f8      float64 特征列
+    v_<Filter>.i4       int32 过滤结论编码 (0 = 通过)
+    recovery.u1         uint8 是否为修正轨迹 (SFT / RLHF 分流)
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from array import array
+from typing import List, Dict, Any, Optional, Iterator
+
+from .schemas import AnalysisResult, DatasetType, TraceData
+from .filters import BaseFilter, ACTIVE_FILTERS
+from .scorers import FeatureScorer, FEATURE_SCORERS
+from .scenarios import ScenarioConfig, SCENARIO_REGISTRY, get_scenario
+
+META_FILE = "meta.json"
+TRACE_ID_FILE = "trace_ids.jsonl"
+RECOVERY_FILE = "recovery.u1"
+
+
+def _default_filters() -> List[BaseFilter]:
+    """所有已知过滤器 (按类名去重)：全局注册的 + 各场景中使用的"""
+    seen = {}
+    for f in ACTIVE_FILTERS + [f for cfg in SCENARIO_REGISTRY.values() for f in cfg.filters]:
+        seen.setdefault(type(f).__name__, f)
+    return list(seen.values())
+
+
+class FeatureStoreWriter:
+    """按列追加写出特征，内存中只缓冲 flush_rows 行"""
+
+    def __init__(self, store_dir: str, filters: Optional[List[BaseFilter]] = None,
+                 scorers: Optional[List[FeatureScorer]] = None, flush_rows: int = 65536):
+        self.store_dir = store_dir
+        self.filters = filters if filters is not None else _default_filters()
+        self.scorers = scorers if scorers is not None else FEATURE_SCORERS
+        self.flush_rows = flush_rows
+        os.makedirs(store_dir, exist_ok=True)
+
+        # 列名在第一条轨迹时确定
+        self.feature_names: Optional[List[str]] = None
+        self.filter_names = [type(f).__name__ for f in self.filters]
+        self.vocab: Dict[str, List[Optional[str]]] = {name: [None] for name in self.filter_names}
+        self._codes: Dict[str, Dict[Optional[str], int]] = {name: {None: 0} for name in self.filter_names}
+
+        self.rows = 0
+        self._ids: List[str] = []
+        self._features: Dict[str, array] = {}
+        self._verdicts: Dict[str, array] = {name: array('i') for name in self.filter_names}
+        self._recovery = array('B')
+        self._lock = threading.Lock()
+
+        # 覆盖目录中旧的存储文件
+        for name in os.listdir(store_dir):
+            if name in (META_FILE, TRACE_ID_FILE, RECOVERY_FILE) or \
+                    (name.startswith('f_') and name.endswith('.f8')) or \
+                    (name.startswith('v_') and name.endswith('.i4')):
+                os.remove(os.path.join(store_dir, name))
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.store_dir, name)
+
+    def add(self, trace: TraceData):
+        # 特征与结论在锁外计算；追加一整行时持锁，多个线程 (如 StagedPipeline 的 analyze worker)
+        # 同时写入时各列的行仍然对齐
+        features = {}
+        for scorer in self.scorers:
+            features.update(scorer.extract_features(trace))
+        verdicts = [f.check(trace) for f in self.filters]
+
+        with self._lock:
+            if self.feature_names is None:
+                self.feature_names = sorted(features)
+                self._features = {name: array('d') for name in self.feature_names}
+
+            for name in self.feature_names:
+                self._features[name].append(float(features.get(name, 0.0)))
+
+            for verdict, name in zip(verdicts, self.filter_names):
+                codes = self._codes[name]
+                code = codes.get(verdict)
+                if code is None:
+                    code = codes[verdict] = len(self.vocab[name])
+                    self.vocab[name].append(verdict)
+                self._verdicts[name].append(code)
+
+            self._recovery.append(1 if trace.is_recovery else 0)
+            self._ids.append(trace.trace_id)
+            self.rows += 1
+
+            if len(self._ids) >= self.flush_rows:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._ids:
+            return
+        with open(self._path(TRACE_ID_FILE), 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(tid) + "\n" for tid in self._ids)
+        for name, col in self._features.items():
+            with open(self._path(f"f_{name}.f8"), 'ab') as f:
+                col.tofile(f)
+            del col[:]
+        for name, col in self._verdicts.items():
+            with open(self._path(f"v_{name}.i4"), 'ab') as f:
+                col.tofile(f)
+            del col[:]
+        with open(self._path(RECOVERY_FILE), 'ab') as f:
+            self._recovery.tofile(f)
+        del self._recovery[:]
+        self._ids = []
+
+    def close(self):
+        self.flush()
+        with open(self._path(META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                "rows": self.rows,
+                "features": self.feature_names or [],
+                "filters": self.filter_names,
+                "vocab": self.vocab
+            }, f, ensure_ascii=False, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class FeatureStoreReader:
+    """按块读取特征列"""
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, META_FILE), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.rows: int = self.meta['rows']
+        self.feature_names: List[str] = self.meta['features']
+        self.filter_names: List[str] = self.meta['filters']
+        self.vocab: Dict[str, List[Optional[str]]] = self.meta['vocab']
+
+    def iter_chunks(self, chunk_rows: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+        """产出 {"trace_id": [...], "features": {name: array}, "verdicts": {name: array}, "recovery": array}"""
+        if self.rows == 0:
+            return
+        files = {}
+        try:
+            ids_f = files['ids'] = open(os.path.join(self.store_dir, TRACE_ID_FILE), encoding='utf-8')
+            for name in self.feature_names:
+                files[f"f_{name}"] = open(os.path.join(self.store_dir, f"f_{name}.f8"), 'rb')
+            for name in self.filter_names:
+                files[f"v_{name}"] = open(os.path.join(self.store_dir, f"v_{name}.i4"), 'rb')
+            rec_f = files['recovery'] = open(os.path.join(self.store_dir, RECOVERY_FILE), 'rb')
+
+            remaining = self.rows
+            while remaining > 0:
+                n = min(chunk_rows, remaining)
+                chunk = {"trace_id": [json.loads(next(ids_f)) for _ in range(n)],
+                         "features": {}, "verdicts": {}}
+                for name in self.feature_names:
+                    col = array('d')
+                    col.fromfile(files[f"f_{name}"], n)
+                    chunk["features"][name] = col
+                for name in self.filter_names:
+                    col = array('i')
+                    col.fromfile(files[f"v_{name}"], n)
+                    chunk["verdicts"][name] = col
+                rec = array('B')
+                rec.fromfile(rec_f, n)
+                chunk["recovery"] = rec
+                remaining -= n
+                yield chunk
+        finally:
+            for f in files.values():
+                f.close()
+
+
+def rescore(store_dir: str, config: ScenarioConfig, chunk_rows: int = 1 << 20) -> Iterator[AnalysisResult]:
+    """
+    在存储的特征上按新的 ScenarioConfig 重新打分，结果与 TracePipeline._analyze 一致
+    (不含 openai_messages / metadata，需要时按 trace_id 回查原始数据)
+    """
+    reader = FeatureStoreReader(store_dir)
+
+    for f in config.filters:
+        if type(f).__name__ not in reader.filter_names:
+            raise ValueError(f"Filter {type(f).__name__} was not captured in feature store {store_dir}")
+    for s in config.scorers:
+        if not isinstance(s, FeatureScorer):
+            raise ValueError(f"Scorer {type(s).__name__} does not support feature-based re-scoring")
+
+    filter_cols = [type(f).__name__ for f in config.filters]
+    scorer_names = [type(s).__name__ for s in config.scorers]
+
+    for chunk in reader.iter_chunks(chunk_rows):
+        feature_cols = chunk["features"]
+        verdict_cols = [(chunk["verdicts"][name], reader.vocab[name]) for name in filter_cols]
+        recovery = chunk["recovery"]
+
+        for i, trace_id in enumerate(chunk["trace_id"]):
+            reasons = []
+            for col, vocab in verdict_cols:
+                code = col[i]
+                if code:
+                    reasons.append(vocab[code])
+
+            if reasons:
+                yield AnalysisResult(trace_id=trace_id, score=0.0, dataset_type=DatasetType.REJECTED,
+                                     reasons=reasons)
+                continue
+
+            features = {name: col[i] for name, col in feature_cols.items()}
+            total_score = 0.0
+            breakdown = {}
+            for name, scorer in zip(scorer_names, config.scorers):
+                value = scorer.score_features(features)
+                breakdown[name] = value
+                total_score += value
+
+            yield AnalysisResult(
+                trace_id=trace_id,
+                score=round(total_score, 2),
+                dataset_type=DatasetType.RLHF if recovery[i] else DatasetType.SFT,
+                reasons=[],
+                score_breakdown=breakdown
+            )
+
+
+def main(argv=None):
+    from .sketches import ScoreDistributions
+    from .stats import RunStats
+
+    parser = argparse.ArgumentParser(description="Feature store tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_rescore = sub.add_parser("rescore", help="re-score stored features with a scenario")
+    p_rescore.add_argument("--store", required=True)
+    p_rescore.add_argument("--scenario", required=True,
+                           help="registry name, scenario file (.json / .yaml) or module:ATTR")
+    p_rescore.add_argument("--out", help="write re-scored results as JSONL")
+    args = parser.parse_args(argv)
+
+    config = get_scenario(args.scenario)
+    stats = RunStats()
+    dists = ScoreDistributions(metrics=[])
+    start = time.time()
+
+    out = open(args.out, 'w', encoding='utf-8') if args.out else None
+    try:
+        for res in rescore(args.store, config):
+            stats.update(res)
+            dists.add(res, config.name)
+            if out:
+                out.write(json.dumps(res.to_dict(), ensure_ascii=False) + "\n")
+    finally:
+        if out:
+            out.close()
+
+    print(f"♻️ Re-scored {stats.total} traces with scenario '{config.name}' in {time.time() - start:.2f}s")
+    print(json.dumps(stats.to_dict(), ensure_ascii=False, indent=2))
+    dists.print_summary()
+
+
+if __name__ == "__main__":
+    main()
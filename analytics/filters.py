@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import List, Optional, Dict, Any
 from .schemas import TraceData
 import tiktoken
 
@@ -30,14 +30,34 @@ class BaseFilter(ABC):
         """返回 None 表示通过，返回字符串表示拒绝原因"""
         pass
 
+    # ---------------- 增量模式 (见 incremental.py) ----------------
+    # 支持增量的过滤器维护一份运行状态，每个事件 O(1) 更新，verdict 与 check 的结论一致。
+    # 不支持的过滤器在增量模式下退化为对完整轨迹调用 check。
+    supports_incremental = False
+
+    def init_state(self) -> Any:
+        return None
+
+    def update_state(self, state: Any, event: Dict[str, Any]) -> Any:
+        """应用一个新事件，返回新的状态"""
+        return state
+
+    def verdict(self, state: Any, metrics: Dict[str, Any]) -> Optional[str]:
+        raise NotImplementedError
+
 
 class IntegrityFilter(BaseFilter):
     """检查系统层面的完整性"""
 
+    supports_incremental = True
+
     def check(self, trace: TraceData) -> Optional[str]:
-        if trace.metrics.get('gemini_cli.exit.fail.count', 0) > 0:
+        return self.verdict(None, trace.metrics)
+
+    def verdict(self, state: Any, metrics: Dict[str, Any]) -> Optional[str]:
+        if metrics.get('gemini_cli.exit.fail.count', 0) > 0:
             return "CLI_EXIT_FAILURE"
-        if trace.metrics.get('gemini_cli.chat.content_retry_failure.count', 0) > 0:
+        if metrics.get('gemini_cli.chat.content_retry_failure.count', 0) > 0:
             return "CONTENT_RETRY_FAILURE"
         return None
 
@@ -45,12 +65,17 @@ class IntegrityFilter(BaseFilter):
 class ProductivityFilter(BaseFilter):
     """检查是否有有效产出"""
 
+    supports_incremental = True
+
     def check(self, trace: TraceData) -> Optional[str]:
-        if 'gemini_cli.file.operation.count' not in trace.metrics:
+        return self.verdict(None, trace.metrics)
+
+    def verdict(self, state: Any, metrics: Dict[str, Any]) -> Optional[str]:
+        if 'gemini_cli.file.operation.count' not in metrics:
             return self.handle_missing_data("metric: file.operation.count")
 
-        file_ops = trace.metrics.get('gemini_cli.file.operation.count', 0)
-        lines_changed = trace.metrics.get('gemini_cli.lines.changed', 0)
+        file_ops = metrics.get('gemini_cli.file.operation.count', 0)
+        lines_changed = metrics.get('gemini_cli.lines.changed', 0)
 
         # 如果做了文件操作但没有行数变更，视为无效操作
         if file_ops > 0 and lines_changed == 0:
@@ -61,12 +86,23 @@ class ProductivityFilter(BaseFilter):
 class ContextTruncationFilter(BaseFilter):
     """检查上下文是否完整"""
 
+    supports_incremental = True
+
     def check(self, trace: TraceData) -> Optional[str]:
         truncated_events = [e for e in trace.events if e['name'] == 'gemini_cli.tool_output_truncated']
         if truncated_events:
             return "TOOL_OUTPUT_TRUNCATED"
         return None
 
+    def init_state(self) -> bool:
+        return False
+
+    def update_state(self, state: bool, event: Dict[str, Any]) -> bool:
+        return state or event['name'] == 'gemini_cli.tool_output_truncated'
+
+    def verdict(self, state: bool, metrics: Dict[str, Any]) -> Optional[str]:
+        return "TOOL_OUTPUT_TRUNCATED" if state else None
+
 
 class PromptRichnessFilter(BaseFilter):
     """
@@ -74,13 +110,29 @@ class PromptRichnessFilter(BaseFilter):
     规则：剔除 prompt_length 过短的轨迹，这些通常是无效的测试或寒暄。
     """
 
+    supports_incremental = True
+
     def check(self, trace: TraceData) -> Optional[str]:
         # 寻找 User Prompt 事件
         user_prompt_event = next(
             (e for e in trace.events if e['name'] == 'gemini_cli.user_prompt'),
             None
         )
+        return self._check_prompt(user_prompt_event)
+
+    def init_state(self) -> Optional[tuple]:
+        # 只有第一个 user_prompt 事件参与判断，到达时算一次结论 (可能需要 tokenize)
+        return None
+
+    def update_state(self, state: Optional[tuple], event: Dict[str, Any]) -> Optional[tuple]:
+        if state is None and event['name'] == 'gemini_cli.user_prompt':
+            return (self._check_prompt(event),)
+        return state
+
+    def verdict(self, state: Optional[tuple], metrics: Dict[str, Any]) -> Optional[str]:
+        return state[0] if state is not None else self._check_prompt(None)
 
+    def _check_prompt(self, user_prompt_event: Optional[Dict[str, Any]]) -> Optional[str]:
         # 连 prompt 事件都没打点
         if not user_prompt_event:
             return self.handle_missing_data("event: gemini_cli.user_prompt")
@@ -0,0 +1,264 @@
+"""
+场景融合编译 (Fused Evaluator)
+
+把一个 ScenarioConfig (手写的或从 JSON / YAML 加载的) 编译成单个 Python 函数：
+只扫描一次 events，且只累加该场景用到的特征；阈值与权重作为常量内联，
+没有逐个 Filter / Scorer 的虚调用和重复的事件扫描。结果与 TracePipeline.evaluate 完全一致。
+
+    evaluate = compile_scenario(get_scenario("swe_bench"))
+    result = evaluate(trace)
+
+    pipeline = TracePipeline("scenarios/swe_strict.json", fused=True)
+
+    python -m analytics.fused --scenario swe_bench traces.jsonl       # 校验一致性并对比耗时
+
+不认识的组件 (自定义 Filter / Scorer 或其子类) 在生成的函数中按原顺序回退为 check / calculate 调用。
+"""
+import argparse
+import math
+import time
+from typing import List, Dict, Any, Callable, Tuple
+
+from .schemas import TraceData, AnalysisResult, DatasetType
+from .scenarios import ScenarioConfig
+from .filters import IntegrityFilter, ProductivityFilter, ContextTruncationFilter, PromptRichnessFilter
+from .scorers import (
+    CodeProductionScorer,
+    ReasoningDepthScorer,
+    ToolDiversityScorer,
+    ToolSuccessScorer,
+    TurnEfficiencyScorer
+)
+
+# 事件扫描中可累加的特征组 -> 累加代码 (按事件名分支)
+_EVENT_FEATURES = {
+    "responses": ("gemini_cli.api_response", [
+        "a = e.get('attributes', {})",
+        "responses += 1",
+        "thoughts += a.get('thoughts_token_count', 0)",
+        "outputs += a.get('output_token_count', 0)",
+    ]),
+    "tool_stats": ("gemini_cli.tool_call", [
+        "tool_calls += 1",
+        "if e.get('attributes', {}).get('success'): tool_success += 1",
+    ]),
+    "tool_names": ("gemini_cli.tool_call", [
+        "fn = e.get('attributes', {}).get('function_name')",
+        "if fn: tool_names.add(fn)",
+    ]),
+    "truncated": ("gemini_cli.tool_output_truncated", [
+        "truncated = True",
+    ]),
+    "prompt": ("gemini_cli.user_prompt", [
+        "if prompt_event is None: prompt_event = e",
+    ]),
+}
+
+_FEATURE_INIT = {
+    "responses": "responses = 0; thoughts = 0; outputs = 0",
+    "tool_stats": "tool_calls = 0; tool_success = 0",
+    "tool_names": "tool_names = set()",
+    "truncated": "truncated = False",
+    "prompt": "prompt_event = None",
+}
+
+
+def _const(value: Any, namespace: Dict[str, Any], hint: str) -> str:
+    """有限的数值常量直接内联，其他值 (包括 inf / nan，其 repr 不是合法的字面量) 放入命名空间"""
+    if type(value) is int or (type(value) is float and math.isfinite(value)):
+        return repr(value)
+    namespace[hint] = value
+    return hint
+
+
+def _filter_code(f, i: int, ns: Dict[str, Any]) -> Tuple[List[str], set]:
+    """返回 (代码行 (设置 err), 所需事件特征)"""
+    ns[f"F{i}"] = f
+    cls = type(f)
+    if cls is IntegrityFilter:
+        # 与 IntegrityFilter.verdict 一样只报告第一个失败原因
+        return [
+            "if m.get('gemini_cli.exit.fail.count', 0) > 0: reasons.append('CLI_EXIT_FAILURE')",
+            "elif m.get('gemini_cli.chat.content_retry_failure.count', 0) > 0: reasons.append('CONTENT_RETRY_FAILURE')",
+        ], set()
+    if cls is ProductivityFilter:
+        return [
+            "if 'gemini_cli.file.operation.count' not in m:",
+            f"    err = F{i}.handle_missing_data('metric: file.operation.count')",
+            "    if err: reasons.append(err)",
+            "elif m.get('gemini_cli.file.operation.count', 0) > 0 and m.get('gemini_cli.lines.changed', 0) == 0:",
+            "    reasons.append('INEFFECTIVE_FILE_OPERATION')",
+        ], set()
+    if cls is ContextTruncationFilter:
+        return ["if truncated: reasons.append('TOOL_OUTPUT_TRUNCATED')"], {"truncated"}
+    if cls is PromptRichnessFilter:
+        return [f"err = F{i}._check_prompt(prompt_event)", "if err: reasons.append(err)"], {"prompt"}
+    return [f"err = F{i}.check(trace)", "if err: reasons.append(err)"], set()
+
+
+def _scorer_code(s, i: int, ns: Dict[str, Any]) -> Tuple[List[str], set]:
+    """返回 (代码行 (设置 v), 所需事件特征)"""
+    ns[f"S{i}"] = s
+    cls = type(s)
+    if cls is CodeProductionScorer:
+        w, mx = _const(s.weight, ns, f"S{i}_w"), _const(s.max_score, ns, f"S{i}_max")
+        return [f"v = min(m.get('gemini_cli.lines.changed', 0) * {w}, {mx})"], set()
+    if cls is ReasoningDepthScorer:
+        mx = _const(s.max_score, ns, f"S{i}_max")
+        return [
+            "if not responses: v = 0.0",
+            f"else: v = ((thoughts / outputs) if outputs > 0 else 0.0) * {mx}",
+        ], {"responses"}
+    if cls is ToolDiversityScorer:
+        w, mx = _const(s.weight, ns, f"S{i}_w"), _const(s.max_score, ns, f"S{i}_max")
+        return [f"v = min(len(tool_names) * {w}, {mx})"], {"tool_names"}
+    if cls is ToolSuccessScorer:
+        mx = _const(s.max_score, ns, f"S{i}_max")
+        return [
+            "if not tool_calls: v = 0.0",
+            f"else: v = (tool_success / tool_calls) * {mx}",
+        ], {"tool_stats"}
+    if cls is TurnEfficiencyScorer:
+        mx = _const(s.max_score, ns, f"S{i}_max")
+        opt = _const(s.optimal_turns, ns, f"S{i}_opt")
+        pen = _const(s.penalty, ns, f"S{i}_pen")
+        return [
+            "turns = m.get('gemini_cli.agent.turns', 0)",
+            "if turns < 2: v = 0.0",
+            f"elif turns <= {opt}: v = {mx}",
+            f"else: v = max({mx} - ((turns - {opt}) * {pen}), -10.0)",
+        ], set()
+    return [f"v = S{i}.calculate(trace)"], set()
+
+
+def _scan_code(features: set) -> List[str]:
+    if not features:
+        return []
+    lines = [_FEATURE_INIT[name] for name in _EVENT_FEATURES if name in features]
+    # 同一事件名的多个特征合并到一个分支
+    branches: Dict[str, List[str]] = {}
+    for name, (event_name, body) in _EVENT_FEATURES.items():
+        if name in features:
+            branches.setdefault(event_name, []).extend(body)
+    lines.append("for e in trace.events:")
+    lines.append("    name = e['name']")
+    for k, (event_name, body) in enumerate(branches.items()):
+        lines.append(f"    {'if' if k == 0 else 'elif'} name == {event_name!r}:")
+        lines.extend(f"        {line}" for line in body)
+    return lines
+
+
+def generate_source(config: ScenarioConfig) -> Tuple[str, Dict[str, Any]]:
+    """生成融合函数的源码与其命名空间"""
+    ns: Dict[str, Any] = {"AnalysisResult": AnalysisResult, "DatasetType": DatasetType}
+
+    filter_lines, filter_features = [], set()
+    for i, f in enumerate(config.filters):
+        code, feats = _filter_code(f, i, ns)
+        filter_lines.extend(code)
+        filter_features |= feats
+
+    scorer_lines, scorer_features = [], set()
+    for i, s in enumerate(config.scorers):
+        code, feats = _scorer_code(s, i, ns)
+        scorer_lines.extend(code)
+        scorer_features |= feats
+        scorer_lines.append(f"breakdown[{type(s).__name__!r}] = v")
+        scorer_lines.append("total += v")
+
+    body = ["m = trace.metrics"]
+    # 过滤器需要事件特征时先整体扫描一次；否则先做指标过滤，被拒绝的轨迹不必扫描事件
+    if filter_features:
+        body += _scan_code(filter_features | scorer_features)
+    body += ["reasons = []"] + filter_lines + [
+        "if reasons:",
+        "    return AnalysisResult(trace_id=trace.trace_id, score=0.0, dataset_type=DatasetType.REJECTED,",
+        "                          reasons=reasons, metadata=m)",
+    ]
+    if not filter_features:
+        body += _scan_code(scorer_features)
+    body += ["total = 0.0", "breakdown = {}"] + scorer_lines + [
+        "return AnalysisResult(trace_id=trace.trace_id, score=round(total, 2),",
+        "                      dataset_type=DatasetType.RLHF if trace.is_recovery else DatasetType.SFT,",
+        "                      reasons=[], metadata=m, score_breakdown=breakdown)",
+    ]
+    source = "def evaluate(trace):\n" + "".join(f"    {line}\n" for line in body)
+    return source, ns
+
+
+def compile_scenario(config: ScenarioConfig) -> Callable[[TraceData], AnalysisResult]:
+    """编译为融合的 evaluate(trace) 函数"""
+    source, ns = generate_source(config)
+    exec(compile(source, f"<fused:{config.name}>", "exec"), ns)
+    evaluate = ns["evaluate"]
+    evaluate.__source__ = source
+    return evaluate
+
+
+def benchmark(config: ScenarioConfig, traces: List[TraceData], repeat: int = 5) -> Dict[str, Any]:
+    """校验融合函数与逐组件路径结果一致，并对比耗时"""
+    from .pipeline import TracePipeline
+
+    pipeline = TracePipeline(config)
+    fused = compile_scenario(config)
+
+    mismatches = sum(1 for t in traces if pipeline.evaluate(t).to_dict() != fused(t).to_dict())
+
+    def timed(fn) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for t in traces:
+                fn(t)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    object_seconds = timed(pipeline.evaluate)
+    fused_seconds = timed(fused)
+    return {
+        "scenario": config.name,
+        "traces": len(traces),
+        "mismatches": mismatches,
+        "object_seconds": round(object_seconds, 4),
+        "fused_seconds": round(fused_seconds, 4),
+        "speedup": round(object_seconds / fused_seconds, 2) if fused_seconds > 0 else None
+    }
+
+
+def main(argv=None):
+    from .scenarios import SCENARIO_REGISTRY, get_scenario
+    from .readers import ConcurrentTraceReader
+    from .pipeline import TracePipeline
+    from .utils import get_mock_data
+
+    parser = argparse.ArgumentParser(description="Compile scenarios into fused evaluators and benchmark them")
+    parser.add_argument("paths", nargs="*", help="trace JSONL files (default: mock data)")
+    parser.add_argument("--scenario", action="append", help="registry name, scenario file or module:ATTR (repeatable)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=100000)
+    parser.add_argument("--show-source", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.paths:
+        adapter = TracePipeline()
+        traces = []
+        for record in ConcurrentTraceReader(args.paths):
+            traces.append(adapter.adapt_record(record))
+            if len(traces) >= args.limit:
+                break
+    else:
+        mock = [TraceData(trace_id=tid, metrics=metrics, events=events) for tid, metrics, events in get_mock_data()]
+        traces = (mock * (args.limit // len(mock) + 1))[:args.limit]
+
+    for spec in args.scenario or list(SCENARIO_REGISTRY):
+        config = get_scenario(spec)
+        if args.show_source:
+            print(generate_source(config)[0])
+        r = benchmark(config, traces, repeat=args.repeat)
+        status = "identical" if r["mismatches"] == 0 else f"{r['mismatches']} MISMATCHES"
+        print(f"⚡ {r['scenario']:<16} {r['traces']} traces: object {r['object_seconds']}s, "
+              f"fused {r['fused_seconds']}s, speedup x{r['speedup']} ({status})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+无序事件流的外部排序归并分组 (External Sort-Merge Grouping)
+
+原始导出是多个 Agent 交错写出的扁平事件流，同一 trace_id / prompt_id 的事件分散在多个文件中：
+
+    事件  {"trace_id": "t1", "name": "gemini_cli.tool_call", "attributes": {...}, "timestamp": 1712000000.5}
+    指标  {"trace_id": "t1", "metric": "gemini_cli.lines.changed", "value": 12}
+
+分组键依次取 key_fields 中第一个存在的字段 (顶层或 attributes 中，如 gemini CLI 日志的 attributes.prompt_id)。
+内存中缓冲的记录超过 memory_mb 时按 (键, 时间戳, 输入顺序) 排序后落盘为一个有序 run，
+最后多路归并所有 run，按键连续产出 TraceData：同一条轨迹的事件按时间排序，数值指标累加。
+run 数超过 fan_in 时先分轮归并，同时打开的文件数有上限。内存占用与输入总量无关。
+
+    grouper = ExternalGrouper(memory_mb=512)
+    grouper.add_all(ConcurrentTraceReader(paths))
+    for trace in grouper.groups():
+        pipeline.process_trace(trace.trace_id, trace.metrics, trace.events)
+
+    python -m analytics.grouping --memory-mb 512 --out grouped.jsonl events-*.jsonl.gz
+"""
+import argparse
+import heapq
+import json
+import os
+import shutil
+import tempfile
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+
+from . import fastjson
+from .schemas import TraceData
+
+
+def _time_key(value: Any) -> Tuple[int, Any]:
+    """时间戳排序键：数值 < 字符串 (ISO) < 缺失，避免不同类型之间无法比较"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 0, value
+    if isinstance(value, str):
+        return 1, value
+    return 2, 0
+
+
+class ExternalGrouper:
+    """按轨迹分组的外部排序器"""
+
+    def __init__(self,
+                 memory_mb: float = 256,
+                 spill_dir: Optional[str] = None,
+                 key_fields: Iterable[str] = ("trace_id", "prompt_id"),
+                 time_field: str = "timestamp",
+                 fan_in: int = 64):
+        """
+        :param memory_mb: 内存中缓冲的记录 (按序列化后的字节数估算) 上限
+        :param spill_dir: run 文件目录，默认使用临时目录 (分组结束后删除)
+        :param key_fields: 分组键候选字段
+        :param time_field: 事件时间戳字段，缺失时保持输入顺序
+        :param fan_in: 单轮归并最多同时打开的 run 数
+        """
+        self._own_dir = spill_dir is None
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="group_runs_")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.memory_bytes = int(memory_mb * 1024 * 1024)
+        self.key_fields = tuple(key_fields)
+        self.time_field = time_field
+        self.fan_in = max(2, fan_in)
+
+        self._buffer: List[Tuple[str, Tuple[int, Any], int, str]] = []
+        self._buffer_bytes = 0
+        self._runs: List[str] = []
+        self._run_seq = 0
+        self._seq = 0
+
+        self.records = 0
+        self.orphans = 0
+        self.spilled_bytes = 0
+        self.traces = 0
+
+    def _key_of(self, record: Dict[str, Any]) -> Optional[str]:
+        attrs = record.get('attributes') or {}
+        for field in self.key_fields:
+            value = record.get(field)
+            if value is None and isinstance(attrs, dict):
+                value = attrs.get(field)
+            if value is not None:
+                return str(value)
+        return None
+
+    def add(self, record: Dict[str, Any]):
+        key = self._key_of(record)
+        if key is None:
+            self.orphans += 1
+            return
+        line = json.dumps(record, ensure_ascii=False)
+        self._buffer.append((key, _time_key(record.get(self.time_field)), self._seq, line))
+        self._seq += 1
+        self.records += 1
+        # 字符串本身 + 元组与键的开销的粗略估计
+        self._buffer_bytes += len(line) + len(key) + 120
+        if self._buffer_bytes >= self.memory_bytes:
+            self._spill()
+
+    def add_all(self, records: Iterable[Dict[str, Any]]):
+        for record in records:
+            self.add(record)
+
+    def _new_run_path(self) -> str:
+        path = os.path.join(self.spill_dir, f"run-{self._run_seq:06d}.jsonl")
+        self._run_seq += 1
+        return path
+
+    def _spill(self):
+        if not self._buffer:
+            return
+        self._buffer.sort(key=lambda item: item[:3])
+        path = self._new_run_path()
+        with open(path, 'w', encoding='utf-8') as f:
+            for key, (kind, ts), seq, line in self._buffer:
+                f.write(f'[{json.dumps(key, ensure_ascii=False)},{kind},{json.dumps(ts)},{seq},{line}]\n')
+        self.spilled_bytes += os.path.getsize(path)
+        self._runs.append(path)
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    @staticmethod
+    def _read_run(path: str) -> Iterator[Tuple[str, Tuple[int, Any], int, Any]]:
+        with open(path, 'rb') as f:
+            for line in f:
+                key, kind, ts, seq, record = fastjson.loads(line)
+                yield key, (kind, ts), seq, record
+
+    def _merge_runs(self, paths: List[str]) -> str:
+        """把多个 run 归并为一个新 run"""
+        out_path = self._new_run_path()
+        with open(out_path, 'w', encoding='utf-8') as f:
+            for key, (kind, ts), seq, record in heapq.merge(*(self._read_run(p) for p in paths),
+                                                            key=lambda item: item[:3]):
+                f.write(json.dumps([key, kind, ts, seq, record], ensure_ascii=False) + "\n")
+        for p in paths:
+            os.remove(p)
+        return out_path
+
+    def _sorted_stream(self) -> Iterator[Tuple[str, Tuple[int, Any], int, Any]]:
+        if not self._runs:
+            # 全部在内存中：无需落盘
+            self._buffer.sort(key=lambda item: item[:3])
+            for key, tkey, seq, line in self._buffer:
+                yield key, tkey, seq, fastjson.loads(line)
+            self._buffer = []
+            return
+
+        self._spill()
+        while len(self._runs) > self.fan_in:
+            batch, self._runs = self._runs[:self.fan_in], self._runs[self.fan_in:]
+            self._runs.append(self._merge_runs(batch))
+        yield from heapq.merge(*(self._read_run(p) for p in self._runs), key=lambda item: item[:3])
+
+    def groups(self) -> Iterator[TraceData]:
+        """按分组键顺序产出 TraceData (events 按时间排序，数值指标累加)"""
+        current_key = None
+        metrics: Dict[str, Any] = {}
+        events: List[Dict[str, Any]] = []
+        try:
+            for key, _, _, record in self._sorted_stream():
+                if key != current_key:
+                    if current_key is not None:
+                        self.traces += 1
+                        yield TraceData(trace_id=current_key, metrics=metrics, events=events)
+                    current_key, metrics, events = key, {}, []
+
+                if 'metric' in record:
+                    name, value = record['metric'], record.get('value', 0)
+                    if isinstance(value, (int, float)) and isinstance(metrics.get(name, 0), (int, float)):
+                        metrics[name] = metrics.get(name, 0) + value
+                    else:
+                        metrics[name] = value
+                elif 'name' in record:
+                    events.append(record)
+
+            if current_key is not None:
+                self.traces += 1
+                yield TraceData(trace_id=current_key, metrics=metrics, events=events)
+        finally:
+            self.close()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "orphans": self.orphans,
+            "traces": self.traces,
+            "runs": self._run_seq,
+            "spilled_bytes": self.spilled_bytes
+        }
+
+    def close(self):
+        for path in self._runs:
+            if os.path.exists(path):
+                os.remove(path)
+        self._runs = []
+        if self._own_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def group_events(records: Iterable[Dict[str, Any]], **grouper_kwargs) -> Iterator[TraceData]:
+    """把扁平事件流分组为 TraceData 的便捷函数"""
+    grouper = ExternalGrouper(**grouper_kwargs)
+    grouper.add_all(records)
+    yield from grouper.groups()
+
+
+def main(argv=None):
+    from .readers import ConcurrentTraceReader
+
+    parser = argparse.ArgumentParser(description="Group flat event exports into traces (external sort-merge)")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--out", required=True, help="grouped JSONL ({trace_id, metrics, events} per line)")
+    parser.add_argument("--memory-mb", type=float, default=256)
+    parser.add_argument("--spill-dir")
+    parser.add_argument("--key", action="append", help="grouping key field (repeatable, default trace_id, prompt_id)")
+    parser.add_argument("--time-field", default="timestamp")
+    parser.add_argument("--fan-in", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    grouper = ExternalGrouper(memory_mb=args.memory_mb, spill_dir=args.spill_dir,
+                              key_fields=args.key or ("trace_id", "prompt_id"),
+                              time_field=args.time_field, fan_in=args.fan_in)
+    with grouper, open(args.out, 'w', encoding='utf-8') as f:
+        grouper.add_all(ConcurrentTraceReader(args.paths))
+        for trace in grouper.groups():
+            f.write(json.dumps({"trace_id": trace.trace_id, "metrics": trace.metrics, "events": trace.events},
+                               ensure_ascii=False) + "\n")
+
+    s = grouper.summary()
+    print(f"🧮 Grouped {s['records']} records into {s['traces']} traces "
+          f"({s['runs']} spill runs, {s['spilled_bytes'] / 1024 / 1024:.1f} MB spilled, orphans: {s['orphans']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+进行中轨迹的增量打分 (实时监控)
+
+每条轨迹为每个 Filter / Scorer 维护一份运行状态 (token 累加、工具成功计数、工具集合、
+截断标记等)，新事件到达时 O(1) 更新；任何时刻都可以得到与批处理
+TracePipeline.evaluate(TraceData(trace_id, metrics, events)) 一致的结论。
+
+    monitor = IncrementalMonitor("swe_bench")
+    for trace_id, event in live_events:
+        monitor.add_event(trace_id, event)
+        print(monitor.snapshot(trace_id).score)
+    monitor.update_metrics(trace_id, {"gemini_cli.agent.turns": 7})
+    final = monitor.finish(trace_id)
+
+指标 (metrics) 是累计值，通过 update_metrics 覆盖更新；基于指标的 Filter / Scorer 只做 O(1) 查询。
+不支持增量的 Filter / Scorer (supports_incremental = False) 在 snapshot 时对完整轨迹重新计算。
+"""
+from typing import List, Dict, Any, Optional, Tuple
+
+from .schemas import TraceData, AnalysisResult, DatasetType
+from .scenarios import get_scenario, ScenarioConfig
+from .converters import OpenAIConverter
+
+
+class IncrementalTrace:
+    """一条进行中的轨迹"""
+
+    def __init__(self, trace_id: str, config: ScenarioConfig, metrics: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.config = config
+        self.metrics: Dict[str, Any] = dict(metrics or {})
+        # 事件仍然保留：供不支持增量的组件回退、以及结束时转换为 OpenAI 格式
+        self.events: List[Dict[str, Any]] = []
+
+        self._filter_states = [f.init_state() if f.supports_incremental else None for f in config.filters]
+        self._scorer_states = [s.init_state() if s.supports_incremental else None for s in config.scorers]
+
+    def add_event(self, event: Dict[str, Any]):
+        self.events.append(event)
+        for i, f in enumerate(self.config.filters):
+            if f.supports_incremental:
+                self._filter_states[i] = f.update_state(self._filter_states[i], event)
+        for i, s in enumerate(self.config.scorers):
+            if s.supports_incremental:
+                self._scorer_states[i] = s.update_state(self._scorer_states[i], event)
+
+    def update_metrics(self, metrics: Dict[str, Any]):
+        self.metrics.update(metrics)
+
+    def to_trace(self) -> TraceData:
+        """当前轨迹 (共享 metrics / events，不复制)"""
+        return TraceData(trace_id=self.trace_id, metrics=self.metrics, events=self.events)
+
+    def _reasons(self, trace: TraceData) -> List[str]:
+        reasons = []
+        for f, state in zip(self.config.filters, self._filter_states):
+            error = f.verdict(state, self.metrics) if f.supports_incremental else f.check(trace)
+            if error: reasons.append(error)
+        return reasons
+
+    def _scores(self, trace: TraceData) -> List[Tuple[str, float]]:
+        return [(type(s).__name__, s.score_state(state, self.metrics) if s.supports_incremental else s.calculate(trace))
+                for s, state in zip(self.config.scorers, self._scorer_states)]
+
+    def snapshot(self) -> AnalysisResult:
+        """当前时刻的结论，与对已到达事件做批处理 evaluate 的结果一致"""
+        trace = self.to_trace()
+        reasons = self._reasons(trace)
+        if reasons:
+            return AnalysisResult(
+                trace_id=self.trace_id,
+                score=0.0,
+                dataset_type=DatasetType.REJECTED,
+                reasons=reasons,
+                metadata=dict(self.metrics)
+            )
+
+        total_score = 0.0
+        breakdown = {}
+        for name, value in self._scores(trace):
+            breakdown[name] = value
+            total_score += value
+
+        return AnalysisResult(
+            trace_id=self.trace_id,
+            score=round(total_score, 2),
+            dataset_type=DatasetType.RLHF if trace.is_recovery else DatasetType.SFT,
+            reasons=[],
+            metadata=dict(self.metrics),
+            score_breakdown=breakdown
+        )
+
+
+class IncrementalMonitor:
+    """按 trace_id 管理多条进行中的轨迹"""
+
+    def __init__(self, scenario_name: str = "default"):
+        self.config: ScenarioConfig = get_scenario(scenario_name)
+        self.traces: Dict[str, IncrementalTrace] = {}
+
+    def _get(self, trace_id: str) -> IncrementalTrace:
+        trace = self.traces.get(trace_id)
+        if trace is None:
+            trace = self.traces[trace_id] = IncrementalTrace(trace_id, self.config)
+        return trace
+
+    def add_event(self, trace_id: str, event: Dict[str, Any]) -> IncrementalTrace:
+        trace = self._get(trace_id)
+        trace.add_event(event)
+        return trace
+
+    def update_metrics(self, trace_id: str, metrics: Dict[str, Any]) -> IncrementalTrace:
+        trace = self._get(trace_id)
+        trace.update_metrics(metrics)
+        return trace
+
+    def snapshot(self, trace_id: str) -> AnalysisResult:
+        return self._get(trace_id).snapshot()
+
+    def finish(self, trace_id: str) -> AnalysisResult:
+        """结束一条轨迹：返回最终结论 (通过时附带 openai_messages) 并释放其状态"""
+        trace = self.traces.pop(trace_id, None) or IncrementalTrace(trace_id, self.config)
+        result = trace.snapshot()
+        if result.dataset_type != DatasetType.REJECTED:
+            result.openai_messages = OpenAIConverter.convert(trace.to_trace())
+        return result
+
+    def __len__(self) -> int:
+        return len(self.traces)
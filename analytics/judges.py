@@ -0,0 +1,149 @@
+"""
+基于模型服务的 Judge Scorer
+
+HttpJudgeScorer 把通过过滤的轨迹 (OpenAI 格式) 按批 POST 给本地模型服务：
+
+    请求  {"traces": [{"trace_id": "...", "messages": [...]}, ...]}
+    响应  {"scores": [0.82, 0.4, ...]}      每个分数在 [0, 1]，乘以 max_score 计入总分
+
+    scenario = ScenarioConfig(name="judged", description="...",
+                              filters=[...], scorers=[..., HttpJudgeScorer("http://127.0.0.1:8000/judge")])
+
+HTTP/1.1 客户端基于 asyncio streams，空闲连接放回连接池复用 (keep-alive)，不依赖第三方库。
+"""
+import asyncio
+import json
+from typing import List, Dict, Any, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .schemas import TraceData
+from .scorers import AsyncBatchScorer
+from .converters import OpenAIConverter
+
+
+class _ConnectionPool:
+    """按 (host, port) 复用的 keep-alive 连接"""
+
+    def __init__(self, host: str, port: int, ssl: bool = False):
+        self.host = host
+        self.port = port
+        self.ssl = ssl
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self.opened = 0
+
+    async def acquire(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        """返回 (reader, writer, 是否为复用的连接)"""
+        while self._idle:
+            reader, writer = self._idle.pop()
+            if not writer.is_closing() and not reader.at_eof():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        self.opened += 1
+        return reader, writer, False
+
+    def release(self, conn: Tuple[asyncio.StreamReader, asyncio.StreamWriter], reusable: bool):
+        if reusable:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+
+    async def close(self):
+        for _, writer in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+async def _read_body(reader: asyncio.StreamReader, headers: Dict[str, str]) -> Tuple[bytes, bool]:
+    """返回 (body, 连接是否可复用)：既没有长度也不是 chunked 的响应读到 EOF 为止，连接随之作废"""
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip(), 16)
+            if size == 0:
+                await reader.readline()
+                return b''.join(chunks), True
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+    length = headers.get('content-length')
+    if length is not None:
+        return await reader.readexactly(int(length)), True
+    return await reader.read(), False
+
+
+class HttpJudgeScorer(AsyncBatchScorer):
+    def __init__(self, url: str, max_score: float = 20.0, batch_size: int = 16, max_concurrency: int = 4,
+                 timeout: float = 30.0, fallback_score: float = 0.0, headers: Optional[Dict[str, str]] = None):
+        """
+        :param url: 模型服务地址
+        :param max_score: Judge 分数 (0~1) 的满分权重
+        :param headers: 额外的请求头 (如鉴权)
+        """
+        super().__init__(batch_size=batch_size, max_concurrency=max_concurrency, timeout=timeout,
+                         fallback_score=fallback_score)
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.max_score = max_score
+        self.headers = headers or {}
+        self._pool = _ConnectionPool(self.host, self.port, ssl=parts.scheme == 'https')
+
+    def build_payload(self, traces: List[TraceData]) -> Dict[str, Any]:
+        """请求体，子类可覆盖以适配不同的模型服务"""
+        return {"traces": [{"trace_id": t.trace_id, "messages": OpenAIConverter.convert(t)} for t in traces]}
+
+    def parse_scores(self, response: Dict[str, Any]) -> List[float]:
+        """从响应中取出 [0, 1] 的分数，子类可覆盖"""
+        return [min(max(float(s), 0.0), 1.0) * self.max_score for s in response["scores"]]
+
+    async def _post(self, body: bytes) -> Tuple[int, bytes]:
+        head = (f"POST {self.path} HTTP/1.1\r\n"
+                f"Host: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: keep-alive\r\n"
+                + "".join(f"{k}: {v}\r\n" for k, v in self.headers.items())
+                + "\r\n").encode('latin-1')
+
+        # 复用的连接可能已被服务端关闭，此时换新连接重试一次
+        for attempt in range(2):
+            reader, writer, reused = await self._pool.acquire()
+            try:
+                writer.write(head + body)
+                await writer.drain()
+                status_line = await reader.readline()
+                if not status_line:
+                    raise ConnectionResetError("connection closed by server")
+                status = int(status_line.split()[1])
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                data, reusable = await _read_body(reader, headers)
+            except (ConnectionError, asyncio.IncompleteReadError) as e:
+                self._pool.release((reader, writer), reusable=False)
+                if reused and attempt == 0 and not isinstance(e, asyncio.IncompleteReadError):
+                    continue
+                raise
+            except BaseException:
+                # 包括超时取消：响应未读完的连接不能再复用
+                self._pool.release((reader, writer), reusable=False)
+                raise
+            self._pool.release((reader, writer),
+                               reusable=reusable and headers.get('connection', '').lower() != 'close')
+            return status, data
+        raise ConnectionResetError("unreachable")
+
+    async def score_batch(self, traces: List[TraceData]) -> List[float]:
+        body = json.dumps(self.build_payload(traces), ensure_ascii=False).encode('utf-8')
+        status, data = await self._post(body)
+        if status != 200:
+            raise RuntimeError(f"Judge server returned HTTP {status}")
+        return self.parse_scores(json.loads(data))
+
+    async def aclose(self):
+        await self._pool.close()
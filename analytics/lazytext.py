@@ -0,0 +1,224 @@
+import json
+import mmap
+import re
+from typing import Any, Iterator, Tuple
+
+'''
+零拷贝的延迟文本：大字符串 (工具输出、写文件参数等) 在解析时不解码，只记录其在共享缓冲区
+(mmap 或原始行 bytes) 中的位置，直到 filter / scorer / converter / sink 真正读取时才解码。
+被拒绝的轨迹中的多 MB 工具输出因此一次都不会被复制。
+'''
+
+# 超过该字节数的字符串保持为 TextRef
+DEFAULT_MIN_LAZY_BYTES = 4096
+
+_WS = b" \t\r\n"
+_NUMBER = re.compile(rb'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_BACKSLASH = 0x5c
+
+
+class TextRef:
+    """指向共享缓冲区中一段 JSON 字符串字面量 (不含两侧引号) 的引用"""
+
+    __slots__ = ("buf", "start", "end")
+
+    def __init__(self, buf, start: int, end: int):
+        self.buf = buf
+        self.start = start
+        self.end = end
+
+    @property
+    def nbytes(self) -> int:
+        return self.end - self.start
+
+    def text(self) -> str:
+        """完整解码 (产生一份拷贝，调用方按需持有)"""
+        raw = self.buf[self.start:self.end]
+        if b'\\' not in raw:
+            return raw.decode('utf-8')
+        return json.loads(b'"' + raw + b'"')
+
+    def prefix(self, n: int) -> str:
+        """只解码前 n 个字符 (如错误检测只看开头)"""
+        # 每个字符最多占 12 字节 (代理对 \uD83D\uDE00)；多取一个字符的余量，
+        # 截断处被拆开的代理对只可能出现在第 n 个字符之后。
+        # 截断处可能落在转义序列或多字节字符中间，逐字节回退
+        stop = min(self.end, self.start + (n + 1) * 12 + 12)
+        raw = self.buf[self.start:stop]
+        for cut in range(min(len(raw), 12) + 1):
+            try:
+                return json.loads(b'"' + raw[:len(raw) - cut] + b'"')[:n]
+            except ValueError:
+                continue
+        return self.text()[:n]
+
+    def __str__(self):
+        return self.text()
+
+    def __repr__(self):
+        return f"TextRef({self.nbytes} bytes @ {self.start})"
+
+
+def materialize(value: Any) -> Any:
+    """TextRef 解码为 str，其他值原样返回"""
+    return value.text() if isinstance(value, TextRef) else value
+
+
+def materialize_deep(value: Any) -> Any:
+    """递归解码容器中的全部 TextRef"""
+    if isinstance(value, TextRef):
+        return value.text()
+    if isinstance(value, dict):
+        return {k: materialize_deep(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [materialize_deep(v) for v in value]
+    return value
+
+
+class LazyJsonParser:
+    """
+    在 bytes / mmap 上解析 JSON，长字符串返回 TextRef 而不解码。
+    结构部分 (对象、数组、短字符串、数字) 正常解析。
+    """
+
+    def __init__(self, buf, min_lazy_bytes: int = DEFAULT_MIN_LAZY_BYTES):
+        self.buf = buf
+        self.min_lazy_bytes = min_lazy_bytes
+
+    def parse(self, start: int = 0, end: int = None) -> Any:
+        end = len(self.buf) if end is None else end
+        pos = self._skip_ws(start, end)
+        value, pos = self._value(pos, end)
+        if self._skip_ws(pos, end) != end:
+            raise ValueError(f"Extra data at offset {pos}")
+        return value
+
+    def _skip_ws(self, pos: int, end: int) -> int:
+        buf = self.buf
+        while pos < end and buf[pos] in _WS:
+            pos += 1
+        return pos
+
+    def _value(self, pos: int, end: int) -> Tuple[Any, int]:
+        if pos >= end:
+            raise ValueError("Unexpected end of JSON")
+        c = self.buf[pos]
+        if c == 0x22:  # "
+            return self._string(pos, end)
+        if c == 0x7b:  # {
+            return self._object(pos, end)
+        if c == 0x5b:  # [
+            return self._array(pos, end)
+        if self.buf[pos:pos + 4] == b"true":
+            return True, pos + 4
+        if self.buf[pos:pos + 5] == b"false":
+            return False, pos + 5
+        if self.buf[pos:pos + 4] == b"null":
+            return None, pos + 4
+        m = _NUMBER.match(self.buf, pos, end)
+        if not m:
+            raise ValueError(f"Invalid JSON value at offset {pos}")
+        raw = m.group()
+        value = float(raw) if (b'.' in raw or b'e' in raw or b'E' in raw) else int(raw)
+        return value, m.end()
+
+    def _string(self, pos: int, end: int) -> Tuple[Any, int]:
+        buf = self.buf
+        j = pos + 1
+        while True:
+            k = buf.find(b'"', j, end)
+            if k == -1:
+                raise ValueError(f"Unterminated string at offset {pos}")
+            # 引号前连续反斜杠为偶数个时才是真正的结束引号
+            b, n = k - 1, 0
+            while buf[b] == _BACKSLASH:
+                n += 1
+                b -= 1
+            if n % 2 == 0:
+                break
+            j = k + 1
+
+        if k - pos - 1 >= self.min_lazy_bytes:
+            return TextRef(buf, pos + 1, k), k + 1
+        raw = buf[pos:k + 1]
+        if b'\\' not in raw:
+            return raw[1:-1].decode('utf-8'), k + 1
+        return json.loads(raw), k + 1
+
+    def _object(self, pos: int, end: int) -> Tuple[dict, int]:
+        obj = {}
+        pos = self._skip_ws(pos + 1, end)
+        if pos < end and self.buf[pos] == 0x7d:  # }
+            return obj, pos + 1
+        while True:
+            if pos >= end or self.buf[pos] != 0x22:
+                raise ValueError(f"Expected object key at offset {pos}")
+            key, pos = self._string(pos, end)
+            pos = self._skip_ws(pos, end)
+            if pos >= end or self.buf[pos] != 0x3a:  # :
+                raise ValueError(f"Expected ':' at offset {pos}")
+            value, pos = self._value(self._skip_ws(pos + 1, end), end)
+            obj[materialize(key)] = value
+            pos = self._skip_ws(pos, end)
+            if pos < end and self.buf[pos] == 0x2c:  # ,
+                pos = self._skip_ws(pos + 1, end)
+                continue
+            if pos < end and self.buf[pos] == 0x7d:
+                return obj, pos + 1
+            raise ValueError(f"Expected ',' or '}}' at offset {pos}")
+
+    def _array(self, pos: int, end: int) -> Tuple[list, int]:
+        arr = []
+        pos = self._skip_ws(pos + 1, end)
+        if pos < end and self.buf[pos] == 0x5d:  # ]
+            return arr, pos + 1
+        while True:
+            value, pos = self._value(pos, end)
+            arr.append(value)
+            pos = self._skip_ws(pos, end)
+            if pos < end and self.buf[pos] == 0x2c:
+                pos = self._skip_ws(pos + 1, end)
+                continue
+            if pos < end and self.buf[pos] == 0x5d:
+                return arr, pos + 1
+            raise ValueError(f"Expected ',' or ']' at offset {pos}")
+
+
+def parse_lazy_record(buf, start: int, end: int, min_lazy_bytes: int = DEFAULT_MIN_LAZY_BYTES) -> Any:
+    """解析一行记录；延迟文本只在 OpenAI messages 路径中被 Adapter 处理，其他格式直接解码，保证下游拿到 str"""
+    record = LazyJsonParser(buf, min_lazy_bytes).parse(start, end)
+    if isinstance(record, dict) and 'messages' not in record:
+        return materialize_deep(record)
+    return record
+
+
+def iter_line_spans(path: str) -> Iterator[Tuple[Any, int, int]]:
+    """
+    逐行产出 (共享缓冲区, 起始偏移, 结束偏移)，跳过空行。
+    未压缩文件通过 mmap 共享同一块缓冲区；压缩文件以解压后的每行 bytes 作为缓冲区。
+    """
+    from .readers import open_trace_file
+
+    if path.endswith(('.gz', '.zst', '.zstd')):
+        with open_trace_file(path) as f:
+            for line in f:
+                if line.strip():
+                    yield line, 0, len(line)
+        return
+
+    with open(path, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # 空文件
+    # mmap 在所有 TextRef 释放后才会被回收
+    pos, size = 0, len(buf)
+    while pos < size:
+        nl = buf.find(b'\n', pos)
+        end = size if nl == -1 else nl
+        start = pos
+        while start < end and buf[start] in _WS:
+            start += 1
+        if start < end:
+            yield buf, start, end
+        pos = end + 1
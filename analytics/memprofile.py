@@ -0,0 +1,169 @@
+import heapq
+import os
+import resource
+import tracemalloc
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterable
+
+
+class _Frame:
+    __slots__ = ("component", "start", "max_abs")
+
+    def __init__(self, component: str, start: int):
+        self.component = component
+        self.start = start
+        self.max_abs = start
+
+
+class ComponentStats:
+    __slots__ = ("calls", "net_bytes", "peak_sum", "peak_max")
+
+    def __init__(self):
+        self.calls = 0
+        self.net_bytes = 0
+        self.peak_sum = 0
+        self.peak_max = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "avg_net_bytes": self.net_bytes // self.calls if self.calls else 0,
+            "avg_peak_bytes": self.peak_sum // self.calls if self.calls else 0,
+            "max_peak_bytes": self.peak_max
+        }
+
+
+class MemoryProfiler:
+    """
+    可选的内存归因 (基于 tracemalloc)
+    按组件统计分配与峰值：adapter、每个 filter / scorer、converter、report 等；
+    按轨迹统计峰值，给出每条轨迹的平均内存与占用最大的轨迹。
+
+    inflight_path 不为空时，每条轨迹开始前写入其 trace_id (批量 adapt 前写入整批的 trace_id)，
+    进程被 OOM kill 后可以从该文件得知是哪条 (或哪一批) 输入导致的。
+
+    注意：tracemalloc 统计的是整个进程的分配，只在单线程运行 (TracePipeline) 时归因准确；
+    开启后 Python 分配速度会明显下降，仅用于诊断。
+    """
+
+    def __init__(self, top_n: int = 20, inflight_path: Optional[str] = None):
+        self.top_n = top_n
+        self.inflight_path = inflight_path
+        self.components: Dict[str, ComponentStats] = {}
+        self.trace_count = 0
+        self.trace_peak_sum = 0
+        self._largest: List[tuple] = []  # 小顶堆 (peak, net, trace_id)
+        self._stack: List[_Frame] = []
+        self._fd: Optional[int] = None
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.inflight_path:
+            self._fd = os.open(self.inflight_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        return self
+
+    def stop(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _enter(self, component: str) -> _Frame:
+        current, peak = tracemalloc.get_traced_memory()
+        if self._stack:
+            # 先把父级到目前为止的峰值记下，再重置峰值计数给子级使用
+            parent = self._stack[-1]
+            parent.max_abs = max(parent.max_abs, peak)
+        tracemalloc.reset_peak()
+        frame = _Frame(component, current)
+        self._stack.append(frame)
+        return frame
+
+    def _exit(self, frame: _Frame) -> tuple:
+        current, peak = tracemalloc.get_traced_memory()
+        frame.max_abs = max(frame.max_abs, peak)
+        self._stack.pop()
+        if self._stack:
+            parent = self._stack[-1]
+            parent.max_abs = max(parent.max_abs, frame.max_abs)
+        tracemalloc.reset_peak()
+
+        net = current - frame.start
+        peak_bytes = frame.max_abs - frame.start
+        stats = self.components.get(frame.component)
+        if stats is None:
+            stats = self.components[frame.component] = ComponentStats()
+        stats.calls += 1
+        stats.net_bytes += net
+        stats.peak_sum += peak_bytes
+        stats.peak_max = max(stats.peak_max, peak_bytes)
+        return net, peak_bytes
+
+    @contextmanager
+    def measure(self, component: str):
+        """统计一个组件的一次调用"""
+        frame = self._enter(component)
+        try:
+            yield
+        finally:
+            self._exit(frame)
+
+    def mark_inflight(self, trace_ids: Iterable[str]):
+        """覆盖写入正在处理的 trace_id (每行一个)"""
+        if self._fd is None:
+            return
+        data = "".join(f"{tid}\n" for tid in trace_ids).encode('utf-8')
+        os.ftruncate(self._fd, 0)
+        os.pwrite(self._fd, data, 0)
+
+    @contextmanager
+    def trace(self, trace_id: str):
+        """统计一整条轨迹，并记录在处理中的 trace_id"""
+        self.mark_inflight((trace_id,))
+
+        frame = self._enter("trace")
+        try:
+            yield
+        finally:
+            net, peak = self._exit(frame)
+            self.trace_count += 1
+            self.trace_peak_sum += peak
+            item = (peak, net, trace_id)
+            if len(self._largest) < self.top_n:
+                heapq.heappush(self._largest, item)
+            elif item > self._largest[0]:
+                heapq.heapreplace(self._largest, item)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "traces": self.trace_count,
+            "avg_peak_bytes_per_trace": self.trace_peak_sum // self.trace_count if self.trace_count else 0,
+            "process_max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "components": {name: s.to_dict() for name, s in sorted(self.components.items()) if name != "trace"},
+            "largest_traces": [
+                {"trace_id": tid, "peak_bytes": peak, "net_bytes": net}
+                for peak, net, tid in sorted(self._largest, reverse=True)
+            ]
+        }
+
+    def print_report(self):
+        r = self.report()
+        print(f"🧠 Memory profile: {r['traces']} traces, "
+              f"avg peak {r['avg_peak_bytes_per_trace'] / 1024:.1f} KB/trace, max RSS {r['process_max_rss_kb'] / 1024:.1f} MB")
+        for name, s in r['components'].items():
+            print(f"   - {name:<36} calls={s['calls']:<8} avg_peak={s['avg_peak_bytes'] / 1024:.1f} KB "
+                  f"max_peak={s['max_peak_bytes'] / 1024:.1f} KB avg_net={s['avg_net_bytes'] / 1024:.1f} KB")
+        print("   Largest traces:")
+        for t in r['largest_traces']:
+            print(f"   - {t['trace_id']}: peak {t['peak_bytes'] / 1024:.1f} KB, retained {t['net_bytes'] / 1024:.1f} KB")
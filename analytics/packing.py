@@ -0,0 +1,210 @@
+import json
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+
+from .schemas import AnalysisResult, DatasetType
+from .adapters import count_tokens_batch, RESPONSE_TOKENS_METRIC
+
+# 每条消息在 Chat 模板中的额外开销 (role 标记、分隔符等)，与 OpenAI 官方估算口径一致
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+@dataclass
+class PackedSequence:
+    """一个定长训练序列，内含若干条首尾相接的样本"""
+    pack_id: int
+    capacity: int
+    samples: List[Dict[str, Any]] = field(default_factory=list)
+    token_count: int = 0
+
+    @property
+    def remaining(self) -> int:
+        return self.capacity - self.token_count
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "pack_id": self.pack_id,
+            "token_count": self.token_count,
+            "capacity": self.capacity,
+            "samples": self.samples
+        }
+
+
+class SequencePacker:
+    """
+    流式序列打包器 (Best-Fit + 有界 Open Bins)
+    将通过过滤的 openai_messages 装入固定长度 (如 8k / 32k) 的训练序列，减少 padding 浪费。
+    assistant 回复正文复用 Adapter 已算好的 token 数 (metadata 中的 RESPONSE_TOKENS_METRIC)，
+    只对其余文本 (Prompt、工具调用的名称与参数、Converter 生成的 system / 工具输出摘要) 计数；
+    没有该指标的结果 (如原生 OTel 轨迹) 全部现场计数。
+    - 每个样本放入剩余空间最小且能容纳它的 open bin (Best-Fit)；
+    - open bin 数量达到上限时，关闭最满的一个再开新 bin，内存占用与输入规模无关。
+    """
+
+    def __init__(self,
+                 max_tokens: int = 8192,
+                 max_open_bins: int = 64,
+                 dataset_types: Iterable[DatasetType] = (DatasetType.SFT,),
+                 batch_size: int = 256):
+        """
+        :param max_tokens: 单个训练序列的 token 上限
+        :param max_open_bins: 同时保持打开的序列数上限
+        :param dataset_types: 参与打包的数据集类型，默认只打包 SFT
+        :param batch_size: pack() 中每批一起计数 token 的样本数
+        """
+        self.max_tokens = max_tokens
+        self.max_open_bins = max_open_bins
+        self.dataset_types = set(dataset_types)
+        self.batch_size = max(1, batch_size)
+
+        self._open_bins: List[PackedSequence] = []
+        self._next_id = 0
+
+        # 统计
+        self.closed_bins = 0
+        self.packed_samples = 0
+        self.packed_tokens = 0
+        self.skipped_oversized = 0
+
+    @staticmethod
+    def _known_tokens(result: AnalysisResult) -> Optional[int]:
+        """Adapter 已计数的 assistant 回复 token 数，没有时返回 None"""
+        value = (result.metadata or {}).get(RESPONSE_TOKENS_METRIC)
+        return value if isinstance(value, int) and not isinstance(value, bool) else None
+
+    @staticmethod
+    def _texts(result: AnalysisResult, skip_responses: bool) -> List[str]:
+        """
+        导出样本中需要计数的文本 (工具输出已被 Converter 替换为 Success / Error 摘要)
+        :param skip_responses: assistant 回复正文已有计数时跳过
+        """
+        texts = []
+        for msg in result.openai_messages or []:
+            content = msg.get('content')
+            if isinstance(content, str) and not (skip_responses and msg.get('role') == 'assistant'):
+                texts.append(content)
+            for call in msg.get('tool_calls') or []:
+                func = call.get('function') or {}
+                texts.append(func.get('name') or "")
+                texts.append(func.get('arguments') or "")
+        return texts
+
+    def estimate_tokens_batch(self, results: List[AnalysisResult]) -> List[int]:
+        """对导出的 openai_messages 计数 token (复用已有的回复计数)，一批样本只调用一次 batch 编码"""
+        known = [self._known_tokens(res) for res in results]
+        per_result = [self._texts(res, k is not None) for res, k in zip(results, known)]
+        counts = count_tokens_batch([t for texts in per_result for t in texts])
+        sizes = []
+        offset = 0
+        for res, k, texts in zip(results, known, per_result):
+            total = sum(counts[offset:offset + len(texts)]) + (k or 0)
+            offset += len(texts)
+            sizes.append(total + len(res.openai_messages or []) * MESSAGE_OVERHEAD_TOKENS)
+        return sizes
+
+    def estimate_tokens(self, result: AnalysisResult) -> int:
+        """估算一个样本 (导出的 openai_messages) 的 token 数"""
+        return self.estimate_tokens_batch([result])[0]
+
+    def _accepts(self, result: AnalysisResult) -> bool:
+        return result.dataset_type in self.dataset_types and bool(result.openai_messages)
+
+    def _close(self, seq: PackedSequence) -> PackedSequence:
+        self._open_bins.remove(seq)
+        self.closed_bins += 1
+        self.packed_tokens += seq.token_count
+        return seq
+
+    def add(self, result: AnalysisResult, size: Optional[int] = None) -> List[PackedSequence]:
+        """
+        放入一个分析结果，返回因此被关闭 (已写满或被挤出) 的序列
+        :param size: 已算好的 token 数 (见 estimate_tokens_batch)，为 None 时现场计数
+        """
+        if not self._accepts(result):
+            return []
+
+        if size is None:
+            size = self.estimate_tokens(result)
+        if size > self.max_tokens:
+            # 单个样本超过序列长度，无法打包
+            self.skipped_oversized += 1
+            return []
+
+        closed = []
+
+        # Best-Fit: 选剩余空间最小且能装下的 bin
+        target = None
+        for seq in self._open_bins:
+            if seq.remaining >= size and (target is None or seq.remaining < target.remaining):
+                target = seq
+
+        if target is None:
+            if len(self._open_bins) >= self.max_open_bins:
+                fullest = min(self._open_bins, key=lambda s: s.remaining)
+                closed.append(self._close(fullest))
+            target = PackedSequence(pack_id=self._next_id, capacity=self.max_tokens)
+            self._next_id += 1
+            self._open_bins.append(target)
+
+        target.samples.append({
+            "trace_id": result.trace_id,
+            "token_count": size,
+            "messages": result.openai_messages
+        })
+        target.token_count += size
+        self.packed_samples += 1
+
+        # 已经写满的 bin 直接关闭，避免占用 open 名额
+        if target.remaining < MESSAGE_OVERHEAD_TOKENS:
+            closed.append(self._close(target))
+
+        return closed
+
+    def flush(self) -> List[PackedSequence]:
+        """关闭所有剩余的 open bin"""
+        return [self._close(seq) for seq in list(self._open_bins)]
+
+    def pack(self, results: Iterable[AnalysisResult]) -> Iterator[PackedSequence]:
+        """流式打包：每 batch_size 个样本批量计数 token，逐个产出已关闭的序列"""
+        batch = []
+        for res in results:
+            if not self._accepts(res):
+                continue
+            batch.append(res)
+            if len(batch) >= self.batch_size:
+                yield from self._add_batch(batch)
+                batch = []
+        if batch:
+            yield from self._add_batch(batch)
+        yield from self.flush()
+
+    def _add_batch(self, results: List[AnalysisResult]) -> Iterator[PackedSequence]:
+        for res, size in zip(results, self.estimate_tokens_batch(results)):
+            yield from self.add(res, size)
+
+    def summary(self) -> Dict[str, Any]:
+        """打包效率报告 (仅统计已关闭的序列)"""
+        capacity = self.closed_bins * self.max_tokens
+        return {
+            "max_tokens": self.max_tokens,
+            "sequences": self.closed_bins,
+            "samples": self.packed_samples,
+            "packed_tokens": self.packed_tokens,
+            "padding_tokens": capacity - self.packed_tokens,
+            "efficiency": round(self.packed_tokens / capacity, 4) if capacity else 0.0,
+            "skipped_oversized": self.skipped_oversized
+        }
+
+
+def export_packed_jsonl(results: Iterable[AnalysisResult], filename: str = "sft_packed.jsonl",
+                        **packer_kwargs) -> Dict[str, Any]:
+    """将分析结果打包并写出为 JSONL，每行一个训练序列，返回打包效率报告"""
+    packer = SequencePacker(**packer_kwargs)
+    with open(filename, 'w', encoding='utf-8') as f:
+        for seq in packer.pack(results):
+            f.write(json.dumps(seq.to_dict(), ensure_ascii=False) + "\n")
+
+    summary = packer.summary()
+    print(f"📦 Packed {summary['samples']} samples into {summary['sequences']} sequences "
+          f"(efficiency: {summary['efficiency']:.2%}, oversized skipped: {summary['skipped_oversized']})")
+    return summary
@@ -1,71 +1,236 @@
-from typing import Dict, List, Optional
+from contextlib import nullcontext
+from typing import Dict, List, Optional, Any, Iterable, Iterator, Tuple, Union
 from .schemas import TraceData, AnalysisResult, DatasetType
 from .scenarios import get_scenario, ScenarioConfig
+from .scorers import AsyncBatchScorer
 from .adapters import OpenAIAdapter
 from .converters import OpenAIConverter
 
+# 未开启内存分析时复用的空上下文
+_NO_PROFILE = nullcontext()
+
 
 class TracePipeline:
-    def __init__(self, scenario_name: str = "default"):
+    def __init__(self, scenario_name: Union[str, ScenarioConfig] = "default", feature_store=None, profiler=None,
+                 fused: bool = False):
         """
         初始化 Pipeline，加载指定场景配置
-        :param scenario_name: 'default', 'swe_bench', 'qa'
+        :param scenario_name: 'default', 'swe_bench', 'qa'，场景文件路径 (.json / .yaml)，'module:ATTR'，
+                              或 ScenarioConfig 实例 (解析规则见 scenarios.get_scenario)
+        :param feature_store: 可选的 FeatureStoreWriter，记录每条轨迹的打分特征与过滤结论，供之后快速重打分
+        :param profiler: 可选的 MemoryProfiler，按组件与轨迹统计内存
+        :param fused: 使用编译后的融合 evaluate (见 fused.py)，结果一致；此时 profiler 不再按 filter / scorer 细分
         """
-        self.config: ScenarioConfig = get_scenario(scenario_name)
+        self.config: ScenarioConfig = scenario_name if isinstance(scenario_name, ScenarioConfig) \
+            else get_scenario(scenario_name)
+        self.feature_store = feature_store
+        self.profiler = profiler
+        self._fused = None
+        if fused:
+            from .fused import compile_scenario
+            self._fused = compile_scenario(self.config)
         print(f"🔧 Pipeline initialized with scenario: {self.config.name}")
         print(f"   - Active Filters: {len(self.config.filters)}")
         print(f"   - Active Scorers: {len(self.config.scorers)}")
 
+    def _measure(self, component: str):
+        return self.profiler.measure(component) if self.profiler is not None else _NO_PROFILE
+
+    def _trace_scope(self, trace_id: str):
+        return self.profiler.trace(trace_id) if self.profiler is not None else _NO_PROFILE
+
+    def _mark_inflight(self, trace_ids: List[str]):
+        """批量 adapt 不在单条轨迹的 scope 内，先把整批 trace_id 写入 inflight 文件"""
+        if self.profiler is not None:
+            self.profiler.mark_inflight(trace_ids)
+
     def process_trace(self, trace_id: str, metrics: Dict, events: List) -> AnalysisResult:
-        trace = TraceData(trace_id=trace_id, metrics=metrics, events=events)
-        return self._analyze(trace)
+        with self._trace_scope(trace_id):
+            trace = TraceData(trace_id=trace_id, metrics=metrics, events=events)
+            return self._analyze(trace)
 
     def process_openai_trace(self, trace_id: str, messages: List[Dict]) -> AnalysisResult:
-        trace = OpenAIAdapter.to_trace_data(trace_id, messages)
-        return self._analyze(trace)
+        with self._trace_scope(trace_id):
+            with self._measure("adapter"):
+                trace = OpenAIAdapter.to_trace_data(trace_id, messages)
+            return self._analyze(trace)
+
+    def process_openai_batch(self, items: List[Tuple[str, List[Dict]]], num_threads: int = 8) -> List[AnalysisResult]:
+        """批量处理 OpenAI 对话：整批文本一次性多线程计数 token，再逐条分析"""
+        self._mark_inflight([trace_id for trace_id, _ in items])
+        with self._measure("adapter(batch)"):
+            traces = OpenAIAdapter.to_trace_data_batch(items, num_threads=num_threads)
+        return self._analyze_batch(traces)
+
+    def process_record(self, record: Dict[str, Any]) -> AnalysisResult:
+        """
+        处理一条 JSONL 记录，自动识别格式：
+        - OpenAI 对话: {"trace_id": ..., "messages": [...]}
+        - OTel 打点:   {"trace_id": ..., "metrics": {...}, "events": [...]}
+        """
+        with self._trace_scope(str(record.get('trace_id') or record.get('id', ''))):
+            return self._analyze(self.adapt_record(record))
+
+    def process_stream(self, records: Iterable[Dict[str, Any]], batch_size: int = 1,
+                       num_threads: int = 8) -> Iterator[AnalysisResult]:
+        """
+        流式处理记录 (如 ConcurrentTraceReader 的输出)
+        :param batch_size: > 1 时按块批量 tokenization (见 process_openai_batch)，输出顺序不变
+        """
+        if batch_size <= 1:
+            for record in records:
+                yield self.process_record(record)
+            return
+
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= batch_size:
+                yield from self._process_chunk(chunk, num_threads)
+                chunk = []
+        if chunk:
+            yield from self._process_chunk(chunk, num_threads)
+
+    def _process_chunk(self, chunk: List[Dict[str, Any]], num_threads: int) -> List[AnalysisResult]:
+        openai_idx = [i for i, r in enumerate(chunk) if 'messages' in r]
+        self._mark_inflight([str(r.get('trace_id') or r.get('id', '')) for r in chunk])
+        with self._measure("adapter(batch)"):
+            adapted = OpenAIAdapter.to_trace_data_batch(
+                [(str(chunk[i].get('trace_id') or chunk[i].get('id', '')), chunk[i]['messages']) for i in openai_idx],
+                num_threads=num_threads
+            )
+        traces: List[Optional[TraceData]] = [None] * len(chunk)
+        for i, trace in zip(openai_idx, adapted):
+            traces[i] = trace
+        for i, record in enumerate(chunk):
+            if traces[i] is None:
+                traces[i] = self.adapt_record(record)
+        return self._analyze_batch(traces)
+
+    def adapt_record(self, record: Dict[str, Any]) -> TraceData:
+        """将一条记录转换为 TraceData (不做分析)，格式同 process_record"""
+        trace_id = str(record.get('trace_id') or record.get('id', ''))
+        if 'messages' in record:
+            with self._measure("adapter"):
+                return OpenAIAdapter.to_trace_data(trace_id, record['messages'])
+        return TraceData(trace_id=trace_id, metrics=record.get('metrics', {}), events=record.get('events', []))
 
     def _analyze(self, trace: TraceData) -> AnalysisResult:
         """
         核心分析逻辑：过滤 -> 打分 -> 分类 -> 格式化
         """
+        result = self.evaluate(trace)
+        if result.dataset_type != DatasetType.REJECTED:
+            # 4. 转换
+            with self._measure("converter"):
+                result.openai_messages = OpenAIConverter.convert(trace)
+        return result
+
+    def _analyze_batch(self, traces: List[TraceData]) -> List[AnalysisResult]:
+        """批量分析：场景中有 AsyncBatchScorer 时跨轨迹批量打分，否则逐条分析"""
+        if not any(isinstance(s, AsyncBatchScorer) for s in self.config.scorers):
+            results = []
+            for trace in traces:
+                with self._trace_scope(trace.trace_id):
+                    results.append(self._analyze(trace))
+            return results
+
+        results = self.evaluate_batch(traces)
+        for trace, result in zip(traces, results):
+            if result.dataset_type != DatasetType.REJECTED:
+                with self._measure("converter"):
+                    result.openai_messages = OpenAIConverter.convert(trace)
+        return results
+
+    def evaluate(self, trace: TraceData) -> AnalysisResult:
+        """过滤 -> 打分 -> 分类，不做格式转换 (openai_messages 为空)"""
+        if self.feature_store is not None:
+            self.feature_store.add(trace)
+        if self._fused is not None:
+            with self._measure("evaluate(fused)"):
+                return self._fused(trace)
+
         # 1. 使用配置中的 Filters
+        reasons = self._check_filters(trace)
+        if reasons:
+            return self._rejected(trace, reasons)
+
+        # 2. 使用配置中的 Scorers
+        scores = []
+        for scorer in self.config.scorers:
+            with self._measure(f"scorer:{type(scorer).__name__}"):
+                scores.append((type(scorer).__name__, scorer.calculate(trace)))
+        return self._classify(trace, scores)
+
+    def evaluate_batch(self, traces: List[TraceData]) -> List[AnalysisResult]:
+        """
+        批量版 evaluate：先对每条轨迹运行同步的过滤器与 Scorer，
+        只有通过过滤的轨迹才交给 AsyncBatchScorer (按其 batch_size / max_concurrency 并发)。
+        结果与逐条 evaluate 一致。
+        """
+        results: List[Optional[AnalysisResult]] = [None] * len(traces)
+        survivors = []
+        for i, trace in enumerate(traces):
+            if self.feature_store is not None:
+                self.feature_store.add(trace)
+            reasons = self._check_filters(trace)
+            if reasons:
+                results[i] = self._rejected(trace, reasons)
+            else:
+                survivors.append(i)
+
+        scores = {i: [] for i in survivors}
+        for scorer in self.config.scorers:
+            name = type(scorer).__name__
+            if isinstance(scorer, AsyncBatchScorer):
+                with self._measure(f"scorer:{name}"):
+                    values = scorer.score_traces([traces[i] for i in survivors])
+                for i, value in zip(survivors, values):
+                    scores[i].append((name, value))
+            else:
+                for i in survivors:
+                    with self._measure(f"scorer:{name}"):
+                        scores[i].append((name, scorer.calculate(traces[i])))
+
+        for i in survivors:
+            results[i] = self._classify(traces[i], scores[i])
+        return results
+
+    def _check_filters(self, trace: TraceData) -> List[str]:
         reasons = []
         for f in self.config.filters:
-            error = f.check(trace)
+            with self._measure(f"filter:{type(f).__name__}"):
+                error = f.check(trace)
             if error: reasons.append(error)
+        return reasons
 
-        if reasons:
-            return AnalysisResult(
-                trace_id=trace.trace_id,
-                score=0.0,
-                dataset_type=DatasetType.REJECTED,
-                reasons=reasons,
-                metadata=trace.metrics
-            )
+    def _rejected(self, trace: TraceData, reasons: List[str]) -> AnalysisResult:
+        return AnalysisResult(
+            trace_id=trace.trace_id,
+            score=0.0,
+            dataset_type=DatasetType.REJECTED,
+            reasons=reasons,
+            metadata=trace.metrics
+        )
 
-        # 2. 使用配置中的 Scorers
+    def _classify(self, trace: TraceData, scores: List[Tuple[str, float]]) -> AnalysisResult:
+        """按场景中 Scorer 的顺序汇总 (名称, 分数) 并分类"""
         total_score = 0.0
-        for scorer in self.config.scorers:
-            total_score += scorer.calculate(trace)
-
+        breakdown = {}
+        for name, value in scores:
+            breakdown[name] = value
+            total_score += value
         total_score = round(total_score, 2)
 
         # 3. 分类 (逻辑通用)
         # 数据集分类 (Classification: SFT, RLHF)
-        # 检查是否发生过需要修正的错误
-        # OpenAIAdapter 会尝试从文本中推断这些计数，如果无法推断则为 0
-        is_recovery = (trace.metrics.get('gemini_cli.agent.recovery_attempt.count', 0) > 0 or
-                       trace.metrics.get('gemini_cli.chat.content_retry.count', 0) > 0)
-        ds_type = DatasetType.RLHF if is_recovery else DatasetType.SFT
-
-        # 4. 转换
-        openai_msgs = OpenAIConverter.convert(trace)
+        ds_type = DatasetType.RLHF if trace.is_recovery else DatasetType.SFT
 
         return AnalysisResult(
             trace_id=trace.trace_id,
             score=total_score,
             dataset_type=ds_type,
             reasons=[],
-            openai_messages=openai_msgs,
-            metadata=trace.metrics
+            metadata=trace.metrics,
+            score_breakdown=breakdown
         )
\ No newline at end of file
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+
+from .schemas import AnalysisResult, DatasetType
+
+
+def normalize_prompt(prompt: str) -> str:
+    """归一化 Prompt：小写 + 压缩空白，使仅有格式差异的同一问题落到同一组"""
+    return re.sub(r"\s+", " ", (prompt or "").strip().lower())
+
+
+def prompt_key(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """第一句 User Prompt 的归一化哈希，作为 DPO 分组键"""
+    first = next((m.get('content') for m in messages if m.get('role') == 'user'), None)
+    if not isinstance(first, str):
+        return None
+    return hashlib.sha1(normalize_prompt(first).encode('utf-8')).hexdigest()
+
+
+class PreferencePairBuilder:
+    """
+    DPO 偏好对构造器
+    按第一句 User Prompt 分组，同组内最高分轨迹为 chosen，最低分为 rejected。
+
+    为支持上亿条轨迹，结果不驻留内存，而是按 key 哈希分区落盘 (spill)；
+    构建时逐个分区扫描，内存中只保留 "key -> 最高/最低分在文件中的偏移"。
+
+    分区文件每行为 "key<TAB>score<TAB>{trace_id, messages}"：第一遍扫描只切分定长前缀，
+    不解析对话 JSON；只有被选中的 chosen / rejected 两行才会完整解析。
+    """
+
+    def __init__(self,
+                 spill_dir: Optional[str] = None,
+                 num_partitions: int = 256,
+                 min_margin: float = 5.0,
+                 dataset_types: Iterable[DatasetType] = (DatasetType.SFT, DatasetType.RLHF)):
+        """
+        :param spill_dir: 分区文件目录，默认使用临时目录 (构建结束后删除)
+        :param num_partitions: 分区数，决定单个分区扫描时的内存上限
+        :param min_margin: chosen 与 rejected 的最小分差，分差过小的对没有训练信号
+        :param dataset_types: 参与配对的数据集类型 (REJECTED 结果不含对话，无法配对)
+        """
+        self._own_dir = spill_dir is None
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="dpo_index_")
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self.num_partitions = num_partitions
+        self.min_margin = min_margin
+        self.dataset_types = set(dataset_types)
+
+        self._files: Dict[int, Any] = {}
+        self.indexed = 0
+        self.skipped = 0
+
+        # 复用调用方指定的目录时清掉上一次运行留下的分区，避免旧记录混入本次配对
+        for name in os.listdir(self.spill_dir):
+            if name.startswith("part-") and name.endswith(".jsonl"):
+                os.remove(os.path.join(self.spill_dir, name))
+
+    def _partition_path(self, idx: int) -> str:
+        return os.path.join(self.spill_dir, f"part-{idx:05d}.jsonl")
+
+    def add(self, result: AnalysisResult):
+        """将一个分析结果写入磁盘索引"""
+        if result.dataset_type not in self.dataset_types or not result.openai_messages:
+            self.skipped += 1
+            return
+
+        key = prompt_key(result.openai_messages)
+        if key is None:
+            self.skipped += 1
+            return
+
+        idx = int(key[:8], 16) % self.num_partitions
+        f = self._files.get(idx)
+        if f is None:
+            f = self._files[idx] = open(self._partition_path(idx), 'a', encoding='utf-8')
+
+        # json.dumps 会转义字符串中的制表符与换行，前缀可以按 TAB 安全切分
+        f.write(f"{key}\t{float(result.score)!r}\t" + json.dumps({
+            "trace_id": result.trace_id,
+            "messages": result.openai_messages
+        }, ensure_ascii=False) + "\n")
+        self.indexed += 1
+
+    def add_all(self, results: Iterable[AnalysisResult]):
+        for res in results:
+            self.add(res)
+
+    @staticmethod
+    def _split_prompt(messages: List[Dict[str, Any]]):
+        """切分为 (prompt 前缀, 回复部分)，前缀截止到第一句 User Prompt"""
+        for i, msg in enumerate(messages):
+            if msg.get('role') == 'user':
+                return messages[:i + 1], messages[i + 1:]
+        return [], messages
+
+    @staticmethod
+    def _read_record(f, offset: int) -> Dict[str, Any]:
+        f.seek(offset)
+        _, score, payload = f.readline().split(b'\t', 2)
+        rec = json.loads(payload)
+        rec['score'] = float(score)
+        return rec
+
+    def _scan_partition(self, path: str) -> Iterator[Dict[str, Any]]:
+        # 第一遍：只切分前缀，记录每个 key 的最高/最低分及其行偏移
+        best: Dict[bytes, tuple] = {}
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                key, score, _ = line.split(b'\t', 2)
+                score = float(score)
+                entry = best.get(key)
+                if entry is None:
+                    best[key] = (score, offset, score, offset)
+                else:
+                    hi, hi_off, lo, lo_off = entry
+                    if score > hi:
+                        hi, hi_off = score, offset
+                    if score < lo:
+                        lo, lo_off = score, offset
+                    best[key] = (hi, hi_off, lo, lo_off)
+                offset += len(line)
+
+            # 第二遍：按偏移回读 chosen / rejected
+            for key, (hi, hi_off, lo, lo_off) in best.items():
+                if hi_off == lo_off or hi - lo < self.min_margin:
+                    continue
+                chosen = self._read_record(f, hi_off)
+                rejected = self._read_record(f, lo_off)
+
+                prompt, chosen_reply = self._split_prompt(chosen['messages'])
+                _, rejected_reply = self._split_prompt(rejected['messages'])
+                yield {
+                    "prompt_hash": key.decode('ascii'),
+                    "prompt": prompt,
+                    "chosen": chosen_reply,
+                    "rejected": rejected_reply,
+                    "chosen_trace_id": chosen['trace_id'],
+                    "rejected_trace_id": rejected['trace_id'],
+                    "chosen_score": chosen['score'],
+                    "rejected_score": rejected['score']
+                }
+
+    def build(self) -> Iterator[Dict[str, Any]]:
+        """逐分区产出 DPO 偏好对"""
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+        for idx in range(self.num_partitions):
+            path = self._partition_path(idx)
+            if os.path.exists(path):
+                yield from self._scan_partition(path)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        if self._own_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+
+def export_dpo_pairs(results: Iterable[AnalysisResult], filename: str = "dpo_pairs.jsonl",
+                     **builder_kwargs) -> int:
+    """构造 DPO 偏好对并写出为 JSONL，返回写出的对数"""
+    builder = PreferencePairBuilder(**builder_kwargs)
+    count = 0
+    try:
+        builder.add_all(results)
+        with open(filename, 'w', encoding='utf-8') as f:
+            for pair in builder.build():
+                f.write(json.dumps(pair, ensure_ascii=False) + "\n")
+                count += 1
+    finally:
+        builder.close()
+
+    print(f"⚖️ Built {count} DPO pairs from {builder.indexed} indexed traces (skipped: {builder.skipped})")
+    return count
@@ -0,0 +1,159 @@
+import gzip
+import io
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator
+
+from . import fastjson
+from .lazytext import iter_line_spans, parse_lazy_record, DEFAULT_MIN_LAZY_BYTES
+
+try:
+    import zstandard
+
+    def _open_zstd(path: str):
+        fh = open(path, 'rb')
+        reader = zstandard.ZstdDecompressor().stream_reader(fh, closefd=True)
+        return io.BufferedReader(reader)
+except ImportError:
+    def _open_zstd(path: str):
+        raise ImportError(f"zstandard is required to read {path}")
+
+logger = logging.getLogger(__name__)
+
+# 队列中的结束标记
+_DONE = object()
+
+
+def open_trace_file(path: str):
+    """按扩展名打开 (可能压缩的) JSONL 文件，返回二进制流 (orjson / msgspec 可直接解析 bytes，省去解码)"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst') or path.endswith('.zstd'):
+        return _open_zstd(path)
+    return open(path, 'rb')
+
+
+class ConcurrentTraceReader:
+    """
+    多文件并发读取器
+    线程池中并发打开、解压、解析多个 JSONL 文件 (gzip / zlib / zstd 解压时会释放 GIL)，
+    解析好的批次放入有界队列，由消费方 (通常是 TracePipeline) 拉取。
+    队列满时读线程阻塞，read_ahead 即预读深度，内存占用因此有上界。
+
+    注意：不同文件之间的输出顺序不确定，单个文件内部保持原顺序。
+    """
+
+    def __init__(self, paths: Iterable[str], max_workers: int = 4, read_ahead: int = 8, batch_size: int = 256,
+                 lazy_text: bool = False, min_lazy_bytes: int = DEFAULT_MIN_LAZY_BYTES):
+        """
+        :param paths: 输入文件列表 (.jsonl / .jsonl.gz / .jsonl.zst)
+        :param max_workers: 同时读取的文件数
+        :param read_ahead: 队列中最多缓存的批次数
+        :param batch_size: 每个批次的记录数
+        :param lazy_text: 零拷贝模式，超过 min_lazy_bytes 的字符串保持为 TextRef (见 lazytext.py)
+        """
+        self.paths = list(paths)
+        self.max_workers = max_workers
+        self.read_ahead = read_ahead
+        self.batch_size = batch_size
+        self.lazy_text = lazy_text
+        self.min_lazy_bytes = min_lazy_bytes
+
+        self.files_read = 0
+        self.records_read = 0
+        self.bad_lines = 0
+        # files_read / bad_lines 由多个读线程更新
+        self._count_lock = threading.Lock()
+
+    def _put(self, q: queue.Queue, item, stop: threading.Event) -> bool:
+        # 周期性检查 stop，避免消费方提前退出时读线程永远阻塞
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read_file(self, path: str, q: queue.Queue, stop: threading.Event):
+        if stop.is_set():
+            return
+        try:
+            batch = []
+            for record in self._iter_file(path):
+                if stop.is_set():
+                    return
+                batch.append(record)
+                if len(batch) >= self.batch_size:
+                    if not self._put(q, batch, stop):
+                        return
+                    batch = []
+            if batch:
+                self._put(q, batch, stop)
+            with self._count_lock:
+                self.files_read += 1
+        except Exception as e:
+            self._put(q, e, stop)
+        finally:
+            self._put(q, _DONE, stop)
+
+    def iter_file(self, path: str) -> Iterator[Dict[str, Any]]:
+        """在调用线程中顺序读取单个文件 (不经过线程池与队列，没有预读缓冲)"""
+        return self._iter_file(path)
+
+    def _iter_file(self, path: str) -> Iterator[Dict[str, Any]]:
+        if self.lazy_text:
+            for buf, start, end in iter_line_spans(path):
+                try:
+                    yield parse_lazy_record(buf, start, end, self.min_lazy_bytes)
+                except ValueError:
+                    self._count_bad_line()
+            return
+
+        with open_trace_file(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield fastjson.loads(line)
+                except ValueError:
+                    self._count_bad_line()
+
+    def _count_bad_line(self):
+        with self._count_lock:
+            self.bad_lines += 1
+
+    def iter_batches(self) -> Iterator[List[Dict[str, Any]]]:
+        """按批次产出解析后的记录"""
+        if not self.paths:
+            return
+
+        q: queue.Queue = queue.Queue(maxsize=self.read_ahead)
+        stop = threading.Event()
+        pending = len(self.paths)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="trace-reader") as pool:
+            for path in self.paths:
+                pool.submit(self._read_file, path, q, stop)
+            try:
+                while pending:
+                    item = q.get()
+                    if item is _DONE:
+                        pending -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        self.records_read += len(item)
+                        yield item
+            finally:
+                stop.set()
+
+        if self.bad_lines:
+            logger.warning(f"Skipped {self.bad_lines} malformed lines")
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for batch in self.iter_batches():
+            yield from batch
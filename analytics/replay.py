@@ -0,0 +1,338 @@
+"""
+轨迹回放压测 (Replay Load Generator)
+
+按录制的节奏 (或固定速率) 把真实轨迹发送给正在运行的处理服务 (HTTP) 或进程内的
+TracePipeline，用来验证一套接入配置能否跟上线上真实的事件速率：
+
+    python -m analytics.replay --target pipeline --scenario swe_bench --concurrency 4 --rate 5 traces.jsonl.gz
+    python -m analytics.replay --target http --url http://127.0.0.1:8080/traces --time-key end_time --rate 10 traces.jsonl
+
+发送节奏：
+    - 指定 --time-key 时按记录中的时间戳 (秒) 还原到达间隔，再除以 --rate 倍数；
+      多个文件按时间戳归并 (每个文件内部按时间有序)，而不是并发读取时的任意交错顺序
+    - 否则以 --rps * --rate 的固定速率发送 (--rps 0 表示不限速)
+
+延迟从轨迹 "应当到达" 的计划时刻算起，到结果返回为止，包含排队与背压等待，
+因此发送端落后于计划时不会低估延迟 (coordinated omission)。
+
+目标队列满时：
+    --mode block  等待空位，记一次 backpressure
+    --mode drop   直接丢弃，记一次 drop
+"""
+import argparse
+import heapq
+import http.client
+import json
+import queue
+import threading
+import time
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+from urllib.parse import urlsplit
+
+from .sketches import KLLSketch
+
+_STOP = object()
+
+LATENCY_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class _QueueTarget:
+    """有界队列 + concurrency 个 worker 线程的回放目标，子类实现 _handle(records)"""
+
+    def __init__(self, concurrency: int = 4, queue_size: int = 1024, block: bool = True, batch_size: int = 1):
+        self.concurrency = max(1, concurrency)
+        self.block = block
+        self.batch_size = max(1, batch_size)
+        self._q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+        self.latency = KLLSketch()
+        self.accepted = 0
+        self.completed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.throttled = 0
+        self.backpressure_events = 0
+        self.backpressure_seconds = 0.0
+        self.max_latency = 0.0
+        self.last_completion = 0.0
+
+    def start(self):
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._worker, name=f"replay-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, record: Dict[str, Any], scheduled: float) -> bool:
+        item = (record, scheduled)
+        try:
+            self._q.put_nowait(item)
+        except queue.Full:
+            if not self.block:
+                self.dropped += 1
+                return False
+            self.backpressure_events += 1
+            wait_start = time.perf_counter()
+            self._q.put(item)
+            self.backpressure_seconds += time.perf_counter() - wait_start
+        self.accepted += 1
+        return True
+
+    def close(self):
+        for _ in self._threads:
+            self._q.put(_STOP)
+        for t in self._threads:
+            t.join()
+
+    def _take_batch(self, first) -> List:
+        items = [first]
+        while len(items) < self.batch_size:
+            try:
+                item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # 放回给自己下一轮退出
+                self._q.put(_STOP)
+                break
+            items.append(item)
+        return items
+
+    def _worker(self):
+        while True:
+            first = self._q.get()
+            if first is _STOP:
+                break
+            items = self._take_batch(first)
+            try:
+                ok = self._handle([record for record, _ in items])
+            except Exception:
+                ok = [False] * len(items)
+            now = time.perf_counter()
+            with self._lock:
+                for (_, scheduled), success in zip(items, ok):
+                    if not success:
+                        self.errors += 1
+                        continue
+                    latency = now - scheduled
+                    self.latency.update(latency)
+                    self.max_latency = max(self.max_latency, latency)
+                    self.completed += 1
+                self.last_completion = now
+
+    def _handle(self, records: List[Dict[str, Any]]) -> List[bool]:
+        raise NotImplementedError
+
+
+class PipelineTarget(_QueueTarget):
+    """进程内回放：batch_size > 1 时走 process_stream 的批量 tokenization 路径"""
+
+    def __init__(self, pipeline, **kwargs):
+        super().__init__(**kwargs)
+        self.pipeline = pipeline
+
+    def _handle(self, records: List[Dict[str, Any]]) -> List[bool]:
+        results = list(self.pipeline.process_stream(records, batch_size=len(records)))
+        return [True] * len(results)
+
+
+class HttpTarget(_QueueTarget):
+    """
+    以 POST JSON 发送到处理服务，每个 worker 复用一条 keep-alive 连接。
+    batch_size > 1 时请求体为记录数组。429 / 503 计为服务端限流 (throttled)。
+    """
+
+    def __init__(self, url: str, timeout: float = 10.0, **kwargs):
+        super().__init__(**kwargs)
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            conn = self._local.conn = cls(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _handle(self, records: List[Dict[str, Any]]) -> List[bool]:
+        body = json.dumps(records[0] if self.batch_size == 1 else records, ensure_ascii=False).encode('utf-8')
+        conn = self._connection()
+        try:
+            conn.request("POST", self.path, body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            return [False] * len(records)
+        if resp.status in (429, 503):
+            with self._lock:
+                self.throttled += len(records)
+        return [200 <= resp.status < 300] * len(records)
+
+
+class TraceReplayer:
+    """按计划时刻把记录发送给目标，并汇总吞吐与延迟"""
+
+    def __init__(self, target: _QueueTarget, rate: float = 1.0, rps: float = 100.0,
+                 time_key: Optional[str] = None, limit: Optional[int] = None):
+        """
+        :param target: PipelineTarget / HttpTarget
+        :param rate: 速率倍数 (相对录制节奏或 rps)
+        :param rps: 没有时间戳时的基准速率，0 表示不限速
+        :param time_key: 记录中的时间戳字段 (秒)
+        :param limit: 最多回放的记录数
+        """
+        self.target = target
+        self.rate = rate
+        self.rps = rps
+        self.time_key = time_key
+        self.limit = limit
+
+        self.sent = 0
+        self.max_schedule_lag = 0.0
+        self._start = 0.0
+        self._send_end = 0.0
+
+    def _offsets(self, records: Iterable[Dict[str, Any]]):
+        """产出 (记录, 相对开始的计划偏移秒数)"""
+        first_ts, last_offset = None, 0.0
+        for i, record in enumerate(records):
+            if self.limit is not None and i >= self.limit:
+                break
+            if self.time_key:
+                ts = record.get(self.time_key)
+                if isinstance(ts, (int, float)):
+                    if first_ts is None:
+                        first_ts = ts
+                    # 乱序的时间戳不回退
+                    last_offset = max(last_offset, (ts - first_ts) / self.rate)
+                yield record, last_offset
+            elif self.rps > 0:
+                yield record, i / (self.rps * self.rate)
+            else:
+                yield record, 0.0
+
+    def run(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        self.target.start()
+        self._start = time.perf_counter()
+        try:
+            for record, offset in self._offsets(records):
+                scheduled = self._start + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    self.max_schedule_lag = max(self.max_schedule_lag, -delay)
+                self.target.submit(record, scheduled)
+                self.sent += 1
+        finally:
+            self._send_end = time.perf_counter()
+            self.target.close()
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        t = self.target
+        send_seconds = self._send_end - self._start
+        busy_seconds = (t.last_completion - self._start) if t.completed else 0.0
+        return {
+            "sent": self.sent,
+            "accepted": t.accepted,
+            "completed": t.completed,
+            "dropped": t.dropped,
+            "errors": t.errors,
+            "throttled": t.throttled,
+            "backpressure_events": t.backpressure_events,
+            "backpressure_seconds": round(t.backpressure_seconds, 3),
+            "max_schedule_lag_seconds": round(self.max_schedule_lag, 3),
+            "offered_rps": round(self.sent / send_seconds, 2) if send_seconds > 0 else 0.0,
+            "throughput_rps": round(t.completed / busy_seconds, 2) if busy_seconds > 0 else 0.0,
+            "latency_ms": {
+                **{f"p{int(q * 100)}": round(t.latency.quantile(q) * 1000, 2) if t.completed else None
+                   for q in LATENCY_QUANTILES},
+                "max": round(t.max_latency * 1000, 2)
+            }
+        }
+
+    @staticmethod
+    def print_report(report: Dict[str, Any]):
+        lat = report["latency_ms"]
+        print(f"🎬 Replayed {report['sent']} traces: offered {report['offered_rps']}/s, "
+              f"sustained {report['throughput_rps']}/s")
+        print(f"   - latency ms: p50={lat['p50']} p90={lat['p90']} p95={lat['p95']} p99={lat['p99']} max={lat['max']}")
+        print(f"   - completed={report['completed']} dropped={report['dropped']} errors={report['errors']} "
+              f"throttled={report['throttled']}")
+        print(f"   - backpressure: {report['backpressure_events']} events, {report['backpressure_seconds']}s waiting, "
+              f"max schedule lag {report['max_schedule_lag_seconds']}s")
+
+
+def merge_by_time(paths: List[str], time_key: str) -> Iterator[Dict[str, Any]]:
+    """
+    按时间戳多路归并多个文件 (假设每个文件内部按时间有序)
+    每个文件在当前线程中顺序读取，没有读线程和预读缓冲；内存只与文件数有关 (每个文件一个打开的句柄)。
+    没有数值时间戳的记录排在所在文件的当前位置，立即发出
+    """
+    from .readers import ConcurrentTraceReader
+
+    def key(record: Dict[str, Any]) -> float:
+        ts = record.get(time_key)
+        return ts if isinstance(ts, (int, float)) else float("-inf")
+
+    reader = ConcurrentTraceReader(paths)
+    streams = [reader.iter_file(path) for path in paths]
+    try:
+        yield from heapq.merge(*streams, key=key)
+    finally:
+        # 提前结束 (--limit) 时关闭已打开的文件
+        for stream in streams:
+            stream.close()
+
+
+def main(argv=None):
+    from .readers import ConcurrentTraceReader
+
+    parser = argparse.ArgumentParser(description="Replay recorded traces against a pipeline")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--target", choices=("pipeline", "http"), default="pipeline")
+    parser.add_argument("--url", help="endpoint for --target http")
+    parser.add_argument("--scenario", default="default")
+    parser.add_argument("--rate", type=float, default=1.0, help="rate multiplier")
+    parser.add_argument("--rps", type=float, default=100.0, help="base rate without --time-key, 0 = unthrottled")
+    parser.add_argument("--time-key", help="record field holding the trace timestamp in seconds")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--mode", choices=("block", "drop"), default="block")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--limit", type=int)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    target_kwargs = dict(concurrency=args.concurrency, queue_size=args.queue_size,
+                         block=args.mode == "block", batch_size=args.batch_size)
+    if args.target == "http":
+        if not args.url:
+            parser.error("--url is required for --target http")
+        target = HttpTarget(args.url, timeout=args.timeout, **target_kwargs)
+    else:
+        from .pipeline import TracePipeline
+        target = PipelineTarget(TracePipeline(args.scenario), **target_kwargs)
+
+    replayer = TraceReplayer(target, rate=args.rate, rps=args.rps, time_key=args.time_key, limit=args.limit)
+    # 并发读取会把多个文件任意交错，按录制节奏回放时必须按时间戳归并
+    records = merge_by_time(args.paths, args.time_key) if args.time_key else ConcurrentTraceReader(args.paths)
+    report = replayer.run(records)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        TraceReplayer.print_report(report)
+
+
+if __name__ == "__main__":
+    main()
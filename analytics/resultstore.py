@@ -0,0 +1,349 @@
+"""
+带索引的本地结果库 (SQLite)
+
+把 AnalysisResult 批量写入 SQLite，按场景 / 数据集类型 / 分数 / 拒绝原因 / 时间建立索引，
+无需重新生成 HTML 报告或重扫 JSONL 就能回答常见问题：
+
+    store = ResultStore("results.db", scenario=pipeline.config.name)
+    with store:
+        for res in pipeline.process_stream(reader):
+            store.write(res)
+
+    python -m analytics.resultstore query --db results.db --scenario swe_bench --type sft --min-score 70 --top 1000
+    python -m analytics.resultstore query --db results.db --reason PROMPT_TOO_SHORT --since yesterday --until today
+    python -m analytics.resultstore reasons --db results.db --since 24h
+    python -m analytics.resultstore import --db results.db --scenario swe_bench out/sft.jsonl out/rejected.jsonl
+
+表结构：
+    results(id, trace_id, scenario, dataset_type, score, created_at, breakdown, metadata, messages)
+    reasons(result_id, code, reason)    每条拒绝原因一行，code 为去掉数值的类别码
+"""
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+
+from .schemas import AnalysisResult, DatasetType
+from .stats import reason_code
+
+# query() 每次读取的行数
+_QUERY_BLOCK = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    trace_id TEXT NOT NULL,
+    scenario TEXT NOT NULL,
+    dataset_type TEXT NOT NULL,
+    score REAL NOT NULL,
+    created_at REAL NOT NULL,
+    breakdown TEXT,
+    metadata TEXT,
+    messages TEXT
+);
+CREATE TABLE IF NOT EXISTS reasons (
+    result_id INTEGER NOT NULL REFERENCES results(id),
+    code TEXT NOT NULL,
+    reason TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_scenario_type_score ON results(scenario, dataset_type, score DESC);
+CREATE INDEX IF NOT EXISTS idx_results_score ON results(score DESC);
+CREATE INDEX IF NOT EXISTS idx_results_created ON results(created_at);
+CREATE INDEX IF NOT EXISTS idx_results_trace ON results(trace_id);
+CREATE INDEX IF NOT EXISTS idx_reasons_code ON reasons(code, result_id);
+CREATE INDEX IF NOT EXISTS idx_reasons_result ON reasons(result_id);
+"""
+
+
+class ResultStore:
+    """SQLite 结果库：write() 缓冲，满 batch_size 条时在一个事务中批量插入"""
+
+    def __init__(self, db_path: str, scenario: str = "default", batch_size: int = 1000,
+                 store_messages: bool = False):
+        """
+        :param db_path: 数据库文件
+        :param scenario: 写入结果所属的场景名 (如 pipeline.config.name)
+        :param batch_size: 每个事务插入的条数
+        :param store_messages: 是否同时保存 openai_messages (体积大，默认只存分数与原因)
+        """
+        self.db_path = db_path
+        self.scenario = scenario
+        self.batch_size = batch_size
+        self.store_messages = store_messages
+
+        # 可作为 StagedPipeline 的 sink / on_result 在其他线程中写入，访问由锁串行化
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._buffer: List[AnalysisResult] = []
+        self.written = 0
+
+    # ---------------- 写入 ----------------
+
+    def write(self, result: AnalysisResult):
+        with self._lock:
+            self._buffer.append(result)
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def write_all(self, results: Iterable[AnalysisResult]):
+        for res in results:
+            self.write(res)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        now = time.time()
+        with self.conn:  # 单个事务
+            cur = self.conn.cursor()
+            reason_rows = []
+            for res in self._buffer:
+                # id 由 SQLite 在写事务内分配，多个进程同时写入同一个库也不会冲突
+                cur.execute(
+                    "INSERT INTO results (trace_id, scenario, dataset_type, score, created_at, breakdown, "
+                    "metadata, messages) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (res.trace_id, self.scenario, res.dataset_type.value, res.score, now,
+                     json.dumps(res.score_breakdown, ensure_ascii=False),
+                     json.dumps(res.metadata, ensure_ascii=False, default=str),
+                     json.dumps(res.openai_messages, ensure_ascii=False)
+                     if self.store_messages and res.openai_messages is not None else None))
+                rid = cur.lastrowid
+                reason_rows.extend((rid, reason_code(r), r) for r in res.reasons)
+            cur.executemany("INSERT INTO reasons (result_id, code, reason) VALUES (?, ?, ?)", reason_rows)
+        self.written += len(self._buffer)
+        self._buffer = []
+
+    # ---------------- 查询 ----------------
+
+    def query(self,
+              scenario: Optional[str] = None,
+              dataset_type: Optional[str] = None,
+              min_score: Optional[float] = None,
+              max_score: Optional[float] = None,
+              reason: Optional[str] = None,
+              since: Optional[float] = None,
+              until: Optional[float] = None,
+              trace_id: Optional[str] = None,
+              limit: Optional[int] = None,
+              order: str = "score") -> Iterator[Dict[str, Any]]:
+        """
+        按条件查询，产出 {"trace_id", "scenario", "dataset_type", "score", "created_at", "reasons",
+        "score_breakdown", "metadata", "openai_messages"}
+        :param reason: 拒绝原因类别码，如 PROMPT_TOO_SHORT
+        :param since / until: unix 时间戳 (写入时刻)
+        :param order: "score" (从高到低) / "time" (从新到旧)
+        """
+        self.flush()
+        where, params = [], []
+        if scenario is not None:
+            where.append("r.scenario = ?")
+            params.append(scenario)
+        if dataset_type is not None:
+            where.append("r.dataset_type = ?")
+            params.append(dataset_type)
+        if min_score is not None:
+            where.append("r.score >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            where.append("r.score <= ?")
+            params.append(max_score)
+        if since is not None:
+            where.append("r.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("r.created_at < ?")
+            params.append(until)
+        if trace_id is not None:
+            where.append("r.trace_id = ?")
+            params.append(trace_id)
+        if reason is not None:
+            where.append("r.id IN (SELECT result_id FROM reasons WHERE code = ?)")
+            params.append(reason)
+
+        sql = ("SELECT r.id, r.trace_id, r.scenario, r.dataset_type, r.score, r.created_at, "
+               "r.breakdown, r.metadata, r.messages FROM results r")
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY r.score DESC, r.id" if order == "score" else " ORDER BY r.created_at DESC, r.id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._lock:
+            cursor = self.conn.execute(sql, params)
+        try:
+            while True:
+                # 逐块读取，每块的拒绝原因一次取回 (块大小不超过 SQLite 的参数上限)；
+                # 锁只在读取时持有，调用方在迭代过程中仍可写入
+                with self._lock:
+                    rows = cursor.fetchmany(_QUERY_BLOCK)
+                    if not rows:
+                        break
+                    reasons = self._reasons_for([row[0] for row in rows])
+                yield from self._rows_to_dicts(rows, reasons)
+        finally:
+            cursor.close()
+
+    def _reasons_for(self, ids: List[int]) -> Dict[int, List[str]]:
+        reasons: Dict[int, List[str]] = {}
+        for rid, text in self.conn.execute(
+                f"SELECT result_id, reason FROM reasons WHERE result_id IN ({','.join('?' * len(ids))}) "
+                f"ORDER BY rowid", ids):
+            reasons.setdefault(rid, []).append(text)
+        return reasons
+
+    @staticmethod
+    def _rows_to_dicts(rows: List[tuple], reasons: Dict[int, List[str]]) -> Iterator[Dict[str, Any]]:
+        for rid, trace_id_, scenario_, ds_type, score, created_at, breakdown, metadata, messages in rows:
+            yield {
+                "trace_id": trace_id_,
+                "scenario": scenario_,
+                "dataset_type": ds_type,
+                "score": score,
+                "created_at": created_at,
+                "reasons": reasons.get(rid, []),
+                "score_breakdown": json.loads(breakdown) if breakdown else {},
+                "metadata": json.loads(metadata) if metadata else {},
+                "openai_messages": json.loads(messages) if messages else None
+            }
+
+    def query_results(self, **kwargs) -> Iterator[AnalysisResult]:
+        """同 query，产出 AnalysisResult"""
+        for row in self.query(**kwargs):
+            yield AnalysisResult.from_dict(row)
+
+    def reason_counts(self, scenario: Optional[str] = None, since: Optional[float] = None,
+                      until: Optional[float] = None) -> Dict[str, int]:
+        self.flush()
+        where, params = [], []
+        if scenario is not None:
+            where.append("r.scenario = ?")
+            params.append(scenario)
+        if since is not None:
+            where.append("r.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("r.created_at < ?")
+            params.append(until)
+        sql = "SELECT c.code, COUNT(*) FROM reasons c JOIN results r ON r.id = c.result_id"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " GROUP BY c.code ORDER BY COUNT(*) DESC"
+        with self._lock:
+            return dict(self.conn.execute(sql, params).fetchall())
+
+    # ---------------- 生命周期 ----------------
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """'today' / 'yesterday' / '24h' / '7d' / ISO 日期或时间 -> unix 时间戳 (本地时区)"""
+    if value is None:
+        return None
+    midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if value == "today":
+        return midnight.timestamp()
+    if value == "yesterday":
+        return (midnight - timedelta(days=1)).timestamp()
+    if value[-1:] in ("h", "d") and value[:-1].isdigit():
+        delta = timedelta(hours=int(value[:-1])) if value[-1] == "h" else timedelta(days=int(value[:-1]))
+        return (datetime.now() - delta).timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _resolve_scenario(spec: Optional[str]) -> Optional[str]:
+    """接受注册名 ('qa') 或场景名 ('chat_qa')"""
+    if spec is None:
+        return None
+    from .scenarios import SCENARIO_REGISTRY
+    if spec in SCENARIO_REGISTRY:
+        return SCENARIO_REGISTRY[spec].name
+    return spec
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Indexed result store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_query = sub.add_parser("query", help="query stored results")
+    p_query.add_argument("--db", required=True)
+    p_query.add_argument("--scenario")
+    p_query.add_argument("--type", choices=[t.value for t in DatasetType])
+    p_query.add_argument("--min-score", type=float)
+    p_query.add_argument("--max-score", type=float)
+    p_query.add_argument("--reason", help="rejection reason code, e.g. PROMPT_TOO_SHORT")
+    p_query.add_argument("--since", help="today / yesterday / 24h / 7d / ISO date")
+    p_query.add_argument("--until")
+    p_query.add_argument("--trace-id")
+    p_query.add_argument("--top", type=int, help="limit (ordered by score)")
+    p_query.add_argument("--order", choices=("score", "time"), default="score")
+    p_query.add_argument("--jsonl", action="store_true", help="print full rows as JSONL")
+
+    p_reasons = sub.add_parser("reasons", help="count rejections by reason code")
+    p_reasons.add_argument("--db", required=True)
+    p_reasons.add_argument("--scenario")
+    p_reasons.add_argument("--since")
+    p_reasons.add_argument("--until")
+
+    p_import = sub.add_parser("import", help="load sink JSONL files")
+    p_import.add_argument("--db", required=True)
+    p_import.add_argument("--scenario", required=True)
+    p_import.add_argument("--messages", action="store_true", help="also store openai_messages")
+    p_import.add_argument("paths", nargs="+")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        with ResultStore(args.db, scenario=_resolve_scenario(args.scenario), store_messages=args.messages) as store:
+            for path in args.paths:
+                with open(path, encoding='utf-8') as f:
+                    store.write_all(AnalysisResult.from_dict(json.loads(line)) for line in f if line.strip())
+        print(f"🗄️ Imported {store.written} results into {args.db}")
+        return
+
+    with ResultStore(args.db) as store:
+        if args.command == "reasons":
+            counts = store.reason_counts(_resolve_scenario(args.scenario), parse_time(args.since),
+                                         parse_time(args.until))
+            for code, count in counts.items():
+                print(f"{count:>10}  {code}")
+            return
+
+        rows = store.query(scenario=_resolve_scenario(args.scenario), dataset_type=args.type,
+                           min_score=args.min_score, max_score=args.max_score, reason=args.reason,
+                           since=parse_time(args.since), until=parse_time(args.until), trace_id=args.trace_id,
+                           limit=args.top, order=args.order)
+        count = 0
+        for row in rows:
+            count += 1
+            if args.jsonl:
+                print(json.dumps(row, ensure_ascii=False))
+            else:
+                when = datetime.fromtimestamp(row['created_at']).strftime('%Y-%m-%d %H:%M')
+                print(f"{row['score']:>8.2f}  {row['dataset_type']:<8} {row['scenario']:<16} {when}  "
+                      f"{row['trace_id']}  {'; '.join(row['reasons'])}")
+        if not args.jsonl:
+            print(f"🗄️ {count} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import json
+import math
+import random
+from typing import List, Dict, Optional, Iterable, Iterator
+
+from .schemas import AnalysisResult, DatasetType
+from .stats import reason_code
+
+
+class Reservoir:
+    """单个分层的蓄水池 (Algorithm R)，内存固定为 k 条"""
+
+    def __init__(self, k: int, rng: random.Random):
+        self.k = k
+        self.rng = rng
+        self.seen = 0
+        self.items: List[AnalysisResult] = []
+
+    def offer(self, item: AnalysisResult):
+        self.seen += 1
+        if len(self.items) < self.k:
+            self.items.append(item)
+        else:
+            j = self.rng.randrange(self.seen)
+            if j < self.k:
+                self.items[j] = item
+
+
+class StratifiedReviewSampler:
+    """
+    分层蓄水池抽样，生成人工审核集
+    分层维度：
+    - type:<DatasetType>       每种数据集类型
+    - reason:<拒绝原因类别码>    每种拒绝原因
+    - score:d<NN> [lo, hi)     通过样本按观测到的分数分布分为十分位 (d01 最低 ... d10 最高)
+    同一条结果可同时进入多个分层。
+
+    十分位的边界要看完整个分布才能确定：通过样本先按 score_resolution 宽的细分数段各自做蓄水池抽样，
+    结束时按各段的精确计数把相邻分数段合并为十分位，再按各段计数加权合并样本 (等价于在十分位内均匀抽样)。
+    一个分数段不会被拆开，十分位边界的精度为 score_resolution；同分的样本总在同一个十分位。
+    内存只与 "(分层数 + 分数段数) × k" 有关，与流经的轨迹数无关。
+    """
+
+    def __init__(self, per_stratum: int = 200, seed: Optional[int] = None, score_resolution: float = 1.0):
+        """
+        :param per_stratum: 每个分层保留的样本数
+        :param seed: 随机种子，固定后可复现同一份审核集
+        :param score_resolution: 细分数段的宽度，即十分位边界的精度
+        """
+        self.per_stratum = per_stratum
+        self.rng = random.Random(seed)
+        self.score_resolution = score_resolution
+        self.reservoirs: Dict[str, Reservoir] = {}
+        self._score_buckets: Dict[int, Reservoir] = {}
+        self._deciles: Optional[Dict[str, Reservoir]] = None
+
+    def score_bucket(self, score: float) -> int:
+        return int(math.floor(score / self.score_resolution))
+
+    def strata_of(self, result: AnalysisResult) -> List[str]:
+        """结果所属的类型 / 原因分层 (分数十分位在结束时才能确定，见 score_deciles)"""
+        strata = [f"type:{result.dataset_type.value}"]
+        if result.dataset_type == DatasetType.REJECTED:
+            # 同一原因类别在一条结果中只计一次
+            strata.extend(f"reason:{code}" for code in dict.fromkeys(reason_code(r) for r in result.reasons))
+        return strata
+
+    def add(self, result: AnalysisResult):
+        for stratum in self.strata_of(result):
+            reservoir = self.reservoirs.get(stratum)
+            if reservoir is None:
+                reservoir = self.reservoirs[stratum] = Reservoir(self.per_stratum, self.rng)
+            reservoir.offer(result)
+        if result.dataset_type != DatasetType.REJECTED:
+            key = self.score_bucket(result.score)
+            bucket = self._score_buckets.get(key)
+            if bucket is None:
+                bucket = self._score_buckets[key] = Reservoir(self.per_stratum, self.rng)
+            bucket.offer(result)
+            self._deciles = None
+
+    def _merge(self, parts: List[Reservoir]) -> Reservoir:
+        """把若干互不相交的蓄水池合并为并集上的均匀样本：按各段尚未抽取的数量加权选段，无放回抽取"""
+        merged = Reservoir(self.per_stratum, self.rng)
+        pools = [list(r.items) for r in parts]
+        remaining = [r.seen for r in parts]
+        merged.seen = sum(remaining)
+        while len(merged.items) < self.per_stratum and any(remaining):
+            j = self.rng.choices(range(len(pools)), weights=remaining)[0]
+            pool = pools[j]
+            i = self.rng.randrange(len(pool))
+            pool[i], pool[-1] = pool[-1], pool[i]
+            merged.items.append(pool.pop())
+            remaining[j] -= 1
+        return merged
+
+    def score_deciles(self) -> Dict[str, Reservoir]:
+        """按当前观测到的分布把分数段合并为十分位分层 (结果会缓存，直到再加入通过样本)"""
+        if self._deciles is None:
+            total = sum(b.seen for b in self._score_buckets.values())
+            groups: Dict[int, List[int]] = {}
+            cum = 0
+            for key in sorted(self._score_buckets):
+                seen = self._score_buckets[key].seen
+                # 分数段整体归入其中点所在的十分位
+                groups.setdefault(min(int(10 * (cum + seen / 2) / total), 9), []).append(key)
+                cum += seen
+            self._deciles = {}
+            for d, keys in groups.items():
+                lo, hi = keys[0] * self.score_resolution, (keys[-1] + 1) * self.score_resolution
+                self._deciles[f"score:d{d + 1:02d} [{lo:g}, {hi:g})"] = \
+                    self._merge([self._score_buckets[k] for k in keys])
+        return self._deciles
+
+    def strata(self) -> Dict[str, Reservoir]:
+        return {**self.reservoirs, **self.score_deciles()}
+
+    def observe(self, results: Iterable[AnalysisResult]) -> Iterator[AnalysisResult]:
+        """透传结果流，同时抽样：for res in sampler.observe(pipeline.process_stream(...))"""
+        for res in results:
+            self.add(res)
+            yield res
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        return {name: {"seen": r.seen, "sampled": len(r.items)} for name, r in sorted(self.strata().items())}
+
+    def write(self, filename: str = "review_set.jsonl") -> int:
+        """写出审核集，每行带 stratum 字段，返回写出的行数"""
+        count = 0
+        strata = self.strata()
+        with open(filename, 'w', encoding='utf-8') as f:
+            for name, reservoir in sorted(strata.items()):
+                for res in reservoir.items:
+                    row = res.to_dict()
+                    row["stratum"] = name
+                    f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                    count += 1
+        print(f"🔍 Review set saved to {filename}: {count} samples across {len(strata)} strata")
+        return count
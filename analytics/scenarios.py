@@ -1,5 +1,8 @@
+import importlib
+import json
+import os
 from dataclasses import dataclass, field
-from typing import List, Dict
+from typing import List, Dict, Any, Union
 
 # 导入具体的实现类
 from .filters import (
@@ -103,5 +106,99 @@ SCENARIO_REGISTRY = {
 }
 
 
+# 声明式场景中可用的组件类型 (其他类型用 "module:Class" 指定)
+FILTER_TYPES = {cls.__name__: cls for cls in (
+    IntegrityFilter, ProductivityFilter, ContextTruncationFilter, PromptRichnessFilter
+)}
+SCORER_TYPES = {cls.__name__: cls for cls in (
+    CodeProductionScorer, ReasoningDepthScorer, ToolDiversityScorer, ToolSuccessScorer, TurnEfficiencyScorer
+)}
+
+SCENARIO_FILE_SUFFIXES = ('.json', '.yaml', '.yml')
+
+
+def _build_component(spec: Union[str, Dict[str, Any]], types: Dict[str, type], base: type):
+    """"IntegrityFilter" 或 {"type": "CodeProductionScorer", "max_score": 10, ...} -> 实例"""
+    if isinstance(spec, str):
+        spec = {"type": spec}
+    params = dict(spec)
+    type_name = params.pop("type", None)
+    if not type_name:
+        raise ValueError(f"Component spec without 'type': {spec}")
+
+    cls = types.get(type_name)
+    if cls is None and ':' in type_name:
+        module_name, attr = type_name.split(':', 1)
+        cls = getattr(importlib.import_module(module_name), attr)
+    if cls is None or not issubclass(cls, base):
+        raise ValueError(f"Unknown {base.__name__} type '{type_name}', expected one of {sorted(types)} or 'module:Class'")
+    try:
+        return cls(**params)
+    except TypeError as e:
+        raise ValueError(f"Invalid parameters for {type_name}: {e}")
+
+
+def scenario_from_dict(data: Dict[str, Any]) -> ScenarioConfig:
+    """
+    由声明式定义构造 ScenarioConfig：
+        {"name": "swe_bench_strict", "description": "...",
+         "filters": ["IntegrityFilter", "ContextTruncationFilter"],
+         "scorers": [{"type": "CodeProductionScorer", "weight_per_line": 5.0, "max_score": 10}, ...]}
+    """
+    if "name" not in data:
+        raise ValueError("Scenario definition requires 'name'")
+    return ScenarioConfig(
+        name=data["name"],
+        description=data.get("description", ""),
+        filters=[_build_component(f, FILTER_TYPES, BaseFilter) for f in data.get("filters", [])],
+        scorers=[_build_component(s, SCORER_TYPES, BaseScorer) for s in data.get("scorers", [])]
+    )
+
+
+def load_scenario_file(path: str) -> ScenarioConfig:
+    """从 JSON / YAML 文件加载场景 (YAML 需要安装 PyYAML)"""
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError(f"PyYAML is required to load {path}")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    try:
+        return scenario_from_dict(data)
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}")
+
+
+def register_scenario_files(directory: str) -> List[str]:
+    """加载目录下所有场景文件并以文件名 (不含后缀) 注册，返回注册的键"""
+    keys = []
+    for name in sorted(os.listdir(directory)):
+        key, ext = os.path.splitext(name)
+        if ext in SCENARIO_FILE_SUFFIXES:
+            SCENARIO_REGISTRY[key] = load_scenario_file(os.path.join(directory, name))
+            keys.append(key)
+    return keys
+
+
 def get_scenario(name: str) -> ScenarioConfig:
-    return SCENARIO_REGISTRY.get(name, SCENARIO_GENERAL_CODING)
\ No newline at end of file
+    """
+    解析场景：注册名 ('swe_bench')、场景文件 (.json / .yaml) 或 'module:ATTR' (模块中的 ScenarioConfig)。
+    文件不存在时抛出 FileNotFoundError，无法识别时抛出 ValueError，都不回退到默认场景
+    """
+    if name in SCENARIO_REGISTRY:
+        return SCENARIO_REGISTRY[name]
+    if name.endswith(SCENARIO_FILE_SUFFIXES):
+        if not os.path.exists(name):
+            raise FileNotFoundError(f"Scenario file not found: {name}")
+        return load_scenario_file(name)
+    if ':' in name:
+        module_name, attr = name.split(':', 1)
+        config = getattr(importlib.import_module(module_name), attr)
+        if not isinstance(config, ScenarioConfig):
+            raise ValueError(f"{name} is not a ScenarioConfig")
+        return config
+    raise ValueError(f"Unknown scenario '{name}', expected one of {sorted(SCENARIO_REGISTRY)}, "
+                     f"a scenario file or 'module:ATTR'")
@@ -0,0 +1,444 @@
+"""
+按轨迹大小调度 (Size-Aware Scheduling)
+
+轨迹的处理代价相差几个数量级：3 条消息的 QA 与 2000 次工具调用的 SWE-bench 轨迹。
+按固定大小分块交给 worker 时，一个分到大轨迹的 worker 还在跑，其他 worker 早已空闲 (straggler)。
+
+SizeAwareScheduler 启动 workers 个进程 (各自加载场景、构建 TracePipeline)，按窗口读入记录，
+用 estimate_cost (消息文本字节数 / 事件数) 估计代价，放入父进程中每个 worker 的逻辑队列：
+    - largest_first: 窗口内按代价从大到小排序，依次分给当前排队代价最小的 worker (LPT)
+    - fifo:          按到达顺序切成固定大小的块轮流分配 (对照基线)
+每个 worker 进程最多预取 prefetch 个任务 (各自的 multiprocessing 队列)，完成一个再补发一个：
+先取自己逻辑队列的头部；自己的队列空了就从排队代价最大的 worker 队列尾部窃取 (work stealing)。
+任务只在需要时才发往 worker 进程，所以窃取不需要从其他进程取回已发送的任务。
+
+    scheduler = SizeAwareScheduler("swe_bench", workers=8, sink=sink)
+    report = scheduler.run(ConcurrentTraceReader(paths))
+    SizeAwareScheduler.print_report(report)
+
+    python -m analytics.scheduling --workers 8 --scenario swe_bench --out out/ traces.jsonl.gz
+    python -m analytics.scheduling --workers 8 --compare traces.jsonl.gz      # 与固定分块对比
+
+报告包含逐条轨迹的延迟分位数 (从进入调度到结果返回)、每个 worker 进程内实测的处理时间
+(墙钟与 CPU 时间) 与利用率、窃取次数，以及 straggler 时间 (第一个 worker 彻底空闲到全部完成)。
+计时从全部 worker 完成初始化后开始。sink / on_result 在父进程中调用；输出顺序不保证与输入一致。
+"""
+import argparse
+import collections
+import contextlib
+import io
+import itertools
+import multiprocessing
+import pickle
+import queue
+import time
+from typing import List, Dict, Any, Optional, Callable, Iterable, Union
+
+from .schemas import AnalysisResult
+from .scenarios import ScenarioConfig
+from .sketches import KLLSketch
+from .lazytext import materialize_deep
+
+POLICIES = ("largest_first", "fifo")
+
+LATENCY_QUANTILES = (0.5, 0.9, 0.99)
+
+# 代价估计中每条消息 / 每个事件的固定开销 (按文本字节计)
+MESSAGE_OVERHEAD = 64
+EVENT_OVERHEAD = 256
+
+# 等待结果时检查 worker 进程存活的间隔 (秒)
+_POLL_SECONDS = 1.0
+
+
+def _text_size(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value)
+    nbytes = getattr(value, 'nbytes', None)  # lazytext.TextRef
+    if nbytes is not None:
+        return nbytes
+    if isinstance(value, list):
+        # 多模态 content: [{"type": "text", "text": ...}, ...]
+        return sum(_text_size(part.get('text') if isinstance(part, dict) else part) for part in value)
+    return len(str(value))
+
+
+def estimate_cost(record: Dict[str, Any]) -> float:
+    """
+    估计一条记录的处理代价 (近似为需要 tokenize / 扫描的字节数)
+    - OpenAI 对话: 各消息文本与工具调用参数的长度之和
+    - OTel 打点:   事件数
+    """
+    messages = record.get('messages')
+    if messages is not None:
+        cost = 0
+        for msg in messages:
+            cost += MESSAGE_OVERHEAD + _text_size(msg.get('content'))
+            for call in msg.get('tool_calls') or []:
+                cost += _text_size((call.get('function') or {}).get('arguments'))
+        return float(cost)
+    return float(EVENT_OVERHEAD * (len(record.get('events') or []) + 1))
+
+
+def _portable_error(e: BaseException) -> BaseException:
+    """multiprocessing 队列在后台线程中 pickle，无法 pickle 的异常会被静默丢弃，这里提前转换"""
+    try:
+        pickle.dumps(e)
+        return e
+    except Exception:
+        return RuntimeError(f"{type(e).__name__}: {e}")
+
+
+def _worker_main(index: int, scenario: Union[str, ScenarioConfig], fused: bool,
+                 task_q: multiprocessing.Queue, result_q: multiprocessing.Queue):
+    """worker 进程：构建自己的 TracePipeline，逐条处理任务并回报实测的处理时间"""
+    from .pipeline import TracePipeline
+
+    try:
+        # 每个进程的初始化信息都打印一遍没有意义
+        with contextlib.redirect_stdout(io.StringIO()):
+            pipeline = TracePipeline(scenario, fused=fused)
+    except BaseException as e:
+        result_q.put(("error", index, None, _portable_error(e)))
+        return
+    result_q.put(("ready", index, None, None))
+
+    while True:
+        item = task_q.get()
+        if item is None:
+            break
+        task_id, record = item
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            result = pipeline.process_record(record)
+            service, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+            # 在本线程 pickle：失败时能作为错误回报，而不是在队列的后台线程中丢失
+            payload = pickle.dumps((result, service, cpu), protocol=pickle.HIGHEST_PROTOCOL)
+        except BaseException as e:
+            result_q.put(("error", index, task_id, _portable_error(e)))
+            break
+        result_q.put(("done", index, task_id, payload))
+
+
+class _Task:
+    __slots__ = ("record", "cost", "enqueued")
+
+    def __init__(self, record: Dict[str, Any], cost: float, enqueued: float):
+        self.record = record
+        self.cost = cost
+        self.enqueued = enqueued
+
+
+class _Worker:
+    """父进程中一个 worker 的逻辑队列与统计"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.queue: collections.deque = collections.deque()
+        self.queued_cost = 0.0
+        self.inflight = 0
+
+        self.tasks = 0
+        self.cost = 0.0
+        self.busy_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.steals = 0
+        self.max_service = 0.0
+        self.last_finish = 0.0
+
+    def stats(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "tasks": self.tasks,
+            "cost": round(self.cost),
+            "steals": self.steals,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "cpu_seconds": round(self.cpu_seconds, 4),
+            "max_service_ms": round(self.max_service * 1000, 2),
+            "utilization": round(self.busy_seconds / elapsed, 4) if elapsed > 0 else 0.0
+        }
+
+
+class SizeAwareScheduler:
+    def __init__(self, scenario: Union[str, ScenarioConfig] = "default", workers: int = 4, window: int = 512,
+                 policy: str = "largest_first", steal: bool = True,
+                 cost_fn: Callable[[Dict[str, Any]], float] = estimate_cost, prefetch: int = 2,
+                 fused: bool = False, sink=None, on_result: Optional[Callable[[AnalysisResult], None]] = None,
+                 mp_context: Optional[str] = None):
+        """
+        :param scenario: 场景名、场景文件路径或 ScenarioConfig (需可 pickle)，每个 worker 进程各自构建 TracePipeline
+        :param workers: worker 进程数
+        :param window: 每次读入并排序分配的记录数；父进程中排队的记录不超过约 2 个窗口
+        :param policy: largest_first (按代价从大到小 + 负载均衡) 或 fifo (固定分块，对照基线)
+        :param steal: 是否允许空闲 worker 从其他 worker 的队列窃取任务
+        :param cost_fn: 代价估计函数，默认 estimate_cost
+        :param prefetch: 每个 worker 进程最多持有的未完成任务数，掩盖进程间往返的延迟
+        :param fused: worker 使用融合 evaluate (见 fused.py)
+        :param sink: 具有 write(result) 方法的输出 (如 JsonlDatasetSink)，在父进程中调用
+        :param on_result: 对每个结果调用的回调，在父进程中调用
+        :param mp_context: multiprocessing 启动方式 ('fork' / 'spawn' / 'forkserver')，默认为平台默认
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', expected one of {POLICIES}")
+        self.scenario = scenario
+        self.num_workers = max(1, workers)
+        self.window = max(1, window)
+        self.policy = policy
+        self.steal = steal
+        self.cost_fn = cost_fn
+        self.prefetch = max(1, prefetch)
+        self.fused = fused
+        self.sink = sink
+        self.on_result = on_result
+        self.mp_context = mp_context
+
+        self._workers: List[_Worker] = []
+        self._queued_tasks = 0
+
+        self.latency = KLLSketch()
+        self.max_latency = 0.0
+        self.completed = 0
+        self.total_cost = 0.0
+        self._start_time = 0.0
+        self._end_time = 0.0
+
+    # ---------------- 分配 ----------------
+
+    def _dispatch(self, tasks: List[_Task]):
+        """把一个窗口的任务放入各 worker 的逻辑队列"""
+        workers = self._workers
+        if self.policy == "largest_first":
+            tasks.sort(key=lambda t: t.cost, reverse=True)
+            for task in tasks:
+                target = min(workers, key=lambda w: w.queued_cost)
+                target.queue.append(task)
+                target.queued_cost += task.cost
+        else:
+            chunk = -(-len(tasks) // len(workers))
+            for i, w in enumerate(workers):
+                for task in tasks[i * chunk:(i + 1) * chunk]:
+                    w.queue.append(task)
+                    w.queued_cost += task.cost
+        self._queued_tasks += len(tasks)
+
+    def _take(self, worker: _Worker) -> Optional[_Task]:
+        """取下一个任务：自己队列头部 (最大的)，否则从排队代价最大的 worker 队列尾部窃取"""
+        if worker.queue:
+            task = worker.queue.popleft()
+            worker.queued_cost -= task.cost
+        elif self.steal:
+            victim = max((w for w in self._workers if w.queue), key=lambda w: w.queued_cost, default=None)
+            if victim is None:
+                return None
+            task = victim.queue.pop()
+            victim.queued_cost -= task.cost
+            worker.steals += 1
+        else:
+            return None
+        self._queued_tasks -= 1
+        return task
+
+    # ---------------- 执行 ----------------
+
+    def _feed(self, worker: _Worker, task_q, inflight: Dict[int, _Task], task_ids):
+        """给 worker 进程补发任务直到 prefetch 个在途"""
+        while worker.inflight < self.prefetch:
+            task = self._take(worker)
+            if task is None:
+                return
+            task_id = next(task_ids)
+            task_q.put((task_id, task.record))
+            # 记录已交给队列，父进程不再持有
+            task.record = None
+            inflight[task_id] = task
+            worker.inflight += 1
+
+    def _receive(self, result_q, processes) -> tuple:
+        while True:
+            try:
+                return result_q.get(timeout=_POLL_SECONDS)
+            except queue.Empty:
+                dead = [p for p in processes if not p.is_alive()]
+                if dead:
+                    raise RuntimeError(f"Scheduler worker {dead[0].name} exited with code {dead[0].exitcode}")
+
+    def _complete(self, worker: _Worker, task: _Task, payload):
+        result, service, cpu = pickle.loads(payload)
+        now = time.perf_counter()
+        latency = now - task.enqueued
+        worker.inflight -= 1
+        worker.tasks += 1
+        worker.cost += task.cost
+        worker.busy_seconds += service
+        worker.cpu_seconds += cpu
+        worker.max_service = max(worker.max_service, service)
+        worker.last_finish = now
+        self.latency.update(latency)
+        self.max_latency = max(self.max_latency, latency)
+        self.completed += 1
+
+        if self.sink is not None:
+            self.sink.write(result)
+        if self.on_result is not None:
+            self.on_result(result)
+
+    def _read_window(self, iterator) -> List[_Task]:
+        tasks = []
+        for record in itertools.islice(iterator, self.window):
+            # 零拷贝模式的 TextRef 引用父进程的缓冲区，发送前解码
+            record = materialize_deep(record)
+            cost = self.cost_fn(record)
+            self.total_cost += cost
+            tasks.append(_Task(record, cost, time.perf_counter()))
+        return tasks
+
+    def run(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """处理全部记录，返回调度报告"""
+        self._workers = [_Worker(i) for i in range(self.num_workers)]
+        self._queued_tasks = 0
+        self.latency = KLLSketch()
+        self.max_latency = 0.0
+        self.completed = 0
+        self.total_cost = 0.0
+
+        ctx = multiprocessing.get_context(self.mp_context)
+        result_q = ctx.Queue()
+        task_qs = [ctx.Queue() for _ in self._workers]
+        processes = [ctx.Process(target=_worker_main, args=(w.index, self.scenario, self.fused, task_qs[w.index],
+                                                            result_q),
+                                 name=f"sched-worker-{w.index}", daemon=True)
+                     for w in self._workers]
+        for p in processes:
+            p.start()
+
+        iterator = None
+        try:
+            ready = 0
+            while ready < len(processes):
+                kind, _, _, payload = self._receive(result_q, processes)
+                if kind == "error":
+                    raise payload
+                ready += 1
+
+            self._start_time = time.perf_counter()
+            iterator = iter(records)
+            exhausted = False
+            inflight: Dict[int, _Task] = {}
+            task_ids = itertools.count()
+            while True:
+                # 父进程中排队的记录不足一个窗口时读入下一个窗口 (内存有界)
+                if not exhausted and self._queued_tasks < self.window:
+                    tasks = self._read_window(iterator)
+                    exhausted = len(tasks) < self.window
+                    if tasks:
+                        self._dispatch(tasks)
+                for w in self._workers:
+                    self._feed(w, task_qs[w.index], inflight, task_ids)
+                if not inflight:
+                    if exhausted and self._queued_tasks == 0:
+                        break
+                    continue
+
+                kind, index, task_id, payload = self._receive(result_q, processes)
+                if kind == "error":
+                    raise payload
+                worker = self._workers[index]
+                self._complete(worker, inflight.pop(task_id), payload)
+                self._feed(worker, task_qs[index], inflight, task_ids)
+            self._end_time = time.perf_counter()
+        finally:
+            # 提前结束时关闭生成器，让并发读取器的线程退出
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            for q in task_qs:
+                q.put(None)
+            for p in processes:
+                p.join(timeout=5)
+                if p.is_alive():
+                    p.terminate()
+                    p.join()
+            for q in task_qs + [result_q]:
+                q.close()
+                q.join_thread()
+        return self.report()
+
+    def report(self) -> Dict[str, Any]:
+        elapsed = self._end_time - self._start_time
+        busy = [w.busy_seconds for w in self._workers]
+        mean_busy = sum(busy) / len(busy) if busy else 0.0
+        finishes = [w.last_finish for w in self._workers if w.tasks]
+        return {
+            "policy": self.policy,
+            "steal": self.steal,
+            "workers": self.num_workers,
+            "completed": self.completed,
+            "total_cost": round(self.total_cost),
+            "elapsed_seconds": round(elapsed, 4),
+            "throughput_tps": round(self.completed / elapsed, 2) if elapsed > 0 else 0.0,
+            "utilization": round(sum(busy) / (len(busy) * elapsed), 4) if busy and elapsed > 0 else 0.0,
+            "cpu_utilization": round(sum(w.cpu_seconds for w in self._workers) / (len(busy) * elapsed), 4)
+            if busy and elapsed > 0 else 0.0,
+            "imbalance": round(max(busy) / mean_busy, 3) if mean_busy > 0 else 1.0,
+            "straggler_seconds": round(max(finishes) - min(finishes), 4) if finishes else 0.0,
+            "steals": sum(w.steals for w in self._workers),
+            "latency_ms": {
+                **{f"p{int(q * 100)}": round(self.latency.quantile(q) * 1000, 2) if self.completed else None
+                   for q in LATENCY_QUANTILES},
+                "max": round(self.max_latency * 1000, 2)
+            },
+            "per_worker": [w.stats(elapsed) for w in self._workers]
+        }
+
+    @staticmethod
+    def print_report(report: Dict[str, Any]):
+        lat = report["latency_ms"]
+        print(f"⚖️  {report['policy']}{' + stealing' if report['steal'] else ''}: "
+              f"{report['completed']} traces on {report['workers']} workers in {report['elapsed_seconds']}s "
+              f"({report['throughput_tps']}/s)")
+        print(f"   - latency ms: p50={lat['p50']} p90={lat['p90']} p99={lat['p99']} max={lat['max']}")
+        print(f"   - utilization={report['utilization']:.0%} (cpu {report['cpu_utilization']:.0%}) "
+              f"imbalance={report['imbalance']} straggler={report['straggler_seconds']}s steals={report['steals']}")
+        for i, w in enumerate(report["per_worker"]):
+            print(f"     worker {i:<3} tasks={w['tasks']:<6} cost={w['cost']:<10} steals={w['steals']:<5} "
+                  f"max={w['max_service_ms']}ms util={w['utilization']:.0%}")
+
+
+def main(argv=None):
+    from .readers import ConcurrentTraceReader
+    from .sinks import JsonlDatasetSink
+
+    parser = argparse.ArgumentParser(description="Process traces with size-aware scheduling and work stealing")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--scenario", default="default")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--window", type=int, default=512)
+    parser.add_argument("--prefetch", type=int, default=2)
+    parser.add_argument("--policy", choices=POLICIES, default="largest_first")
+    parser.add_argument("--no-steal", action="store_true")
+    parser.add_argument("--fused", action="store_true")
+    parser.add_argument("--out", help="write results with JsonlDatasetSink to this directory")
+    parser.add_argument("--compare", action="store_true",
+                        help="load records into memory and compare against fixed chunks without stealing")
+    args = parser.parse_args(argv)
+
+    options = dict(workers=args.workers, window=args.window, prefetch=args.prefetch, fused=args.fused)
+    if args.compare:
+        records = list(ConcurrentTraceReader(args.paths))
+        for policy, steal in (("fifo", False), (args.policy, not args.no_steal)):
+            scheduler = SizeAwareScheduler(args.scenario, policy=policy, steal=steal, **options)
+            SizeAwareScheduler.print_report(scheduler.run(records))
+        return
+
+    sink = JsonlDatasetSink(args.out) if args.out else None
+    try:
+        scheduler = SizeAwareScheduler(args.scenario, policy=args.policy, steal=not args.no_steal, sink=sink,
+                                       **options)
+        SizeAwareScheduler.print_report(scheduler.run(ConcurrentTraceReader(args.paths)))
+    finally:
+        if sink is not None:
+            sink.close()
+
+
+if __name__ == "__main__":
+    main()
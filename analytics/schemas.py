@@ -21,6 +21,15 @@ class TraceData:
         """提取配置信息的便捷属性"""
         return next((e.get('attributes', {}) for e in self.events if e['name'] == 'gemini_cli.config'), {})
 
+    @property
+    def is_recovery(self) -> bool:
+        """
+        是否发生过需要修正的错误 (SFT / RLHF 分流依据)
+        OpenAIAdapter 会尝试从文本中推断这些计数，如果无法推断则为 0
+        """
+        return (self.metrics.get('gemini_cli.agent.recovery_attempt.count', 0) > 0 or
+                self.metrics.get('gemini_cli.chat.content_retry.count', 0) > 0)
+
 
 @dataclass
 class AnalysisResult:
@@ -30,4 +39,29 @@ class AnalysisResult:
     dataset_type: DatasetType
     reasons: List[str]
     openai_messages: Optional[List[Dict[str, Any]]] = None
-    metadata: Dict[str, Any] = field(default_factory=dict)  # 用于存储额外统计，如token数
\ No newline at end of file
+    metadata: Dict[str, Any] = field(default_factory=dict)  # 用于存储额外统计，如token数
+    score_breakdown: Dict[str, float] = field(default_factory=dict)  # 各 Scorer 的得分贡献
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为可写入 JSON 的字典"""
+        return {
+            "trace_id": self.trace_id,
+            "score": self.score,
+            "dataset_type": self.dataset_type.value,
+            "reasons": self.reasons,
+            "openai_messages": self.openai_messages,
+            "metadata": self.metadata,
+            "score_breakdown": self.score_breakdown
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AnalysisResult":
+        return cls(
+            trace_id=data['trace_id'],
+            score=data['score'],
+            dataset_type=DatasetType(data['dataset_type']),
+            reasons=data.get('reasons', []),
+            openai_messages=data.get('openai_messages'),
+            metadata=data.get('metadata', {}),
+            score_breakdown=data.get('score_breakdown', {})
+        )
\ No newline at end of file
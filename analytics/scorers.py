@@ -1,5 +1,7 @@
+import asyncio
+import threading
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Optional, Dict, List, Any
 from .schemas import TraceData
 
 
@@ -8,33 +10,189 @@ class BaseScorer(ABC):
     def calculate(self, trace: TraceData) -> float:
         pass
 
+    # ---------------- 增量模式 (见 incremental.py) ----------------
+    # 支持增量的 Scorer 维护一份运行状态，每个事件 O(1) 更新，score_state 与 calculate 的结果一致。
+    # 不支持的 Scorer 在增量模式下退化为对完整轨迹调用 calculate。
+    supports_incremental = False
+
+    def init_state(self) -> Any:
+        return None
+
+    def update_state(self, state: Any, event: Dict[str, Any]) -> Any:
+        """应用一个新事件，返回新的状态"""
+        return state
+
+    def score_state(self, state: Any, metrics: Dict[str, Any]) -> float:
+        raise NotImplementedError
+
+
+class FeatureScorer(BaseScorer):
+    """
+    特征与权重分离的 Scorer：
+    extract_features 只读取轨迹 (与权重无关)，score_features 只做加权计算。
+    特征可被持久化 (见 features.py)，调整权重后无需重跑全量数据即可重新打分。
+    """
+
+    def calculate(self, trace: TraceData) -> float:
+        return self.score_features(self.extract_features(trace))
+
+    @abstractmethod
+    def extract_features(self, trace: TraceData) -> Dict[str, float]:
+        pass
+
+    @abstractmethod
+    def score_features(self, features: Dict[str, float]) -> float:
+        pass
+
+    def state_features(self, state: Any, metrics: Dict[str, Any]) -> Dict[str, float]:
+        """增量模式：由运行状态得到与 extract_features 相同的特征"""
+        raise NotImplementedError
+
+    def score_state(self, state: Any, metrics: Dict[str, Any]) -> float:
+        return self.score_features(self.state_features(state, metrics))
+
+
+class AsyncBatchScorer(BaseScorer):
+    """
+    异步批量 Scorer (如调用本地模型服务的 Judge)
+    Pipeline 的批量接口 (evaluate_batch / process_stream(batch_size > 1)) 先运行同步的过滤器与打分器，
+    只把通过过滤的轨迹按 batch_size 分批，最多 max_concurrency 批并发地交给 score_batch。
+    超时或出错的批次记为 fallback_score。
+
+    协程运行在 Scorer 自己的常驻事件循环线程中，连接等资源可以跨批次复用。
+    单条调用 calculate 时退化为一批一条的同步调用。
+    """
+
+    def __init__(self, batch_size: int = 16, max_concurrency: int = 4, timeout: float = 30.0,
+                 fallback_score: float = 0.0):
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.fallback_score = fallback_score
+
+        self.batches = 0
+        self.timeouts = 0
+        self.errors = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+
+    @abstractmethod
+    async def score_batch(self, traces: List[TraceData]) -> List[float]:
+        """对一批轨迹打分，返回与输入等长的分数"""
+        pass
+
+    async def aclose(self):
+        """释放连接等资源 (在事件循环中调用)"""
+        pass
+
+    def calculate(self, trace: TraceData) -> float:
+        return self.score_traces([trace])[0]
+
+    def score_traces(self, traces: List[TraceData]) -> List[float]:
+        """同步入口：分批并发打分"""
+        if not traces:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._score_all(traces), self._event_loop())
+        return future.result()
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=f"{type(self).__name__}-loop", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    async def _score_all(self, traces: List[TraceData]) -> List[float]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def run(batch: List[TraceData]) -> List[float]:
+            async with semaphore:
+                self.batches += 1
+                try:
+                    scores = await asyncio.wait_for(self.score_batch(batch), self.timeout)
+                except asyncio.TimeoutError:
+                    self.timeouts += 1
+                    return [self.fallback_score] * len(batch)
+                except Exception:
+                    self.errors += 1
+                    return [self.fallback_score] * len(batch)
+                if len(scores) != len(batch):
+                    self.errors += 1
+                    return [self.fallback_score] * len(batch)
+                return list(scores)
+
+        batches = [traces[i:i + self.batch_size] for i in range(0, len(traces), self.batch_size)]
+        results = await asyncio.gather(*(run(b) for b in batches))
+        return [score for batch_scores in results for score in batch_scores]
+
+    def close(self):
+        """关闭事件循环线程"""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
 
 # ----------------------------------------------------------------
 # 1. 代码产出评分
 # ----------------------------------------------------------------
-class CodeProductionScorer(BaseScorer):
+class CodeProductionScorer(FeatureScorer):
+    supports_incremental = True
+
     def __init__(self, weight_per_line: float = 0.5, max_score: float = 20.0):
         self.weight = weight_per_line
         self.max_score = max_score
 
-    def calculate(self, trace: TraceData) -> float:
-        lines = trace.metrics.get('gemini_cli.lines.changed', 0)
+    def extract_features(self, trace: TraceData) -> Dict[str, float]:
+        return self.state_features(None, trace.metrics)
+
+    def state_features(self, state: Any, metrics: Dict[str, Any]) -> Dict[str, float]:
+        return {"lines_changed": metrics.get('gemini_cli.lines.changed', 0)}
+
+    def score_features(self, features: Dict[str, float]) -> float:
+        lines = features["lines_changed"]
         return min(lines * self.weight, self.max_score)
 
 
 # ----------------------------------------------------------------
 # 2. 推理深度评分
 # ----------------------------------------------------------------
-class ReasoningDepthScorer(BaseScorer):
+class ReasoningDepthScorer(FeatureScorer):
+    supports_incremental = True
+
     def __init__(self, max_score: float = 20.0):
         self.max_score = max_score
 
-    def calculate(self, trace: TraceData) -> float:
+    def extract_features(self, trace: TraceData) -> Dict[str, float]:
         responses = [e for e in trace.events if e['name'] == 'gemini_cli.api_response']
-        if not responses: return 0.0
+        return {
+            "response_count": len(responses),
+            "thoughts_tokens": sum(r.get('attributes', {}).get('thoughts_token_count', 0) for r in responses),
+            "output_tokens": sum(r.get('attributes', {}).get('output_token_count', 0) for r in responses)
+        }
+
+    def init_state(self) -> Dict[str, float]:
+        return {"response_count": 0, "thoughts_tokens": 0, "output_tokens": 0}
+
+    def update_state(self, state: Dict[str, float], event: Dict[str, Any]) -> Dict[str, float]:
+        if event['name'] == 'gemini_cli.api_response':
+            attrs = event.get('attributes', {})
+            state["response_count"] += 1
+            state["thoughts_tokens"] += attrs.get('thoughts_token_count', 0)
+            state["output_tokens"] += attrs.get('output_token_count', 0)
+        return state
+
+    def state_features(self, state: Dict[str, float], metrics: Dict[str, Any]) -> Dict[str, float]:
+        return dict(state)
 
-        total_thoughts = sum(r.get('attributes', {}).get('thoughts_token_count', 0) for r in responses)
-        total_tokens = sum(r.get('attributes', {}).get('output_token_count', 0) for r in responses)
+    def score_features(self, features: Dict[str, float]) -> float:
+        if not features["response_count"]: return 0.0
+
+        total_thoughts = features["thoughts_tokens"]
+        total_tokens = features["output_tokens"]
 
         ratio = (total_thoughts / total_tokens) if total_tokens > 0 else 0.0
         return ratio * self.max_score
@@ -43,50 +201,95 @@ class ReasoningDepthScorer(BaseScorer):
 # ----------------------------------------------------------------
 # 3. 工具多样性评分
 # ----------------------------------------------------------------
-class ToolDiversityScorer(BaseScorer):
+class ToolDiversityScorer(FeatureScorer):
+    supports_incremental = True
+
     def __init__(self, weight_per_tool: float = 5.0, max_score: float = 15.0):
         self.weight = weight_per_tool
         self.max_score = max_score
 
-    def calculate(self, trace: TraceData) -> float:
+    def extract_features(self, trace: TraceData) -> Dict[str, float]:
         tool_calls = [e for e in trace.events if e['name'] == 'gemini_cli.tool_call']
-        if not tool_calls: return 0.0
 
         unique_tools = set(
             t.get('attributes', {}).get('function_name')
             for t in tool_calls
             if t.get('attributes', {}).get('function_name')
         )
-        return min(len(unique_tools) * self.weight, self.max_score)
+        return {"unique_tools": len(unique_tools)}
+
+    def init_state(self) -> set:
+        return set()
+
+    def update_state(self, state: set, event: Dict[str, Any]) -> set:
+        if event['name'] == 'gemini_cli.tool_call':
+            name = event.get('attributes', {}).get('function_name')
+            if name:
+                state.add(name)
+        return state
+
+    def state_features(self, state: set, metrics: Dict[str, Any]) -> Dict[str, float]:
+        return {"unique_tools": len(state)}
+
+    def score_features(self, features: Dict[str, float]) -> float:
+        return min(features["unique_tools"] * self.weight, self.max_score)
 
 
 # ----------------------------------------------------------------
 # 4. 工具成功率评分
 # ----------------------------------------------------------------
-class ToolSuccessScorer(BaseScorer):
+class ToolSuccessScorer(FeatureScorer):
+    supports_incremental = True
+
     def __init__(self, max_score: float = 30.0):
         self.max_score = max_score
 
-    def calculate(self, trace: TraceData) -> float:
+    def extract_features(self, trace: TraceData) -> Dict[str, float]:
         tool_calls = [e for e in trace.events if e['name'] == 'gemini_cli.tool_call']
-        if not tool_calls: return 0.0
+        return {
+            "tool_calls": len(tool_calls),
+            "tool_success": sum(1 for t in tool_calls if t.get('attributes', {}).get('success'))
+        }
+
+    def init_state(self) -> Dict[str, float]:
+        return {"tool_calls": 0, "tool_success": 0}
+
+    def update_state(self, state: Dict[str, float], event: Dict[str, Any]) -> Dict[str, float]:
+        if event['name'] == 'gemini_cli.tool_call':
+            state["tool_calls"] += 1
+            if event.get('attributes', {}).get('success'):
+                state["tool_success"] += 1
+        return state
+
+    def state_features(self, state: Dict[str, float], metrics: Dict[str, Any]) -> Dict[str, float]:
+        return dict(state)
 
-        success_cnt = sum(1 for t in tool_calls if t.get('attributes', {}).get('success'))
-        rate = success_cnt / len(tool_calls)
+    def score_features(self, features: Dict[str, float]) -> float:
+        if not features["tool_calls"]: return 0.0
+
+        rate = features["tool_success"] / features["tool_calls"]
         return rate * self.max_score
 
 
 # ----------------------------------------------------------------
 # 5. 步数效率评分
 # ----------------------------------------------------------------
-class TurnEfficiencyScorer(BaseScorer):
+class TurnEfficiencyScorer(FeatureScorer):
+    supports_incremental = True
+
     def __init__(self, max_score: float = 15.0, optimal_turns: int = 5, penalty_per_turn: float = 2.0):
         self.max_score = max_score
         self.optimal_turns = optimal_turns
         self.penalty = penalty_per_turn
 
-    def calculate(self, trace: TraceData) -> float:
-        turns = trace.metrics.get('gemini_cli.agent.turns', 0)
+    def extract_features(self, trace: TraceData) -> Dict[str, float]:
+        return self.state_features(None, trace.metrics)
+
+    def state_features(self, state: Any, metrics: Dict[str, Any]) -> Dict[str, float]:
+        return {"turns": metrics.get('gemini_cli.agent.turns', 0)}
+
+    def score_features(self, features: Dict[str, float]) -> float:
+        turns = features["turns"]
 
         if turns < 2: return 0.0
 
@@ -96,4 +299,14 @@ class TurnEfficiencyScorer(BaseScorer):
             extra = turns - self.optimal_turns
             score = self.max_score - (extra * self.penalty)
             # 最低分不低于 -10，防止单个维度毁掉总分
-            return max(score, -10.0)
\ No newline at end of file
+            return max(score, -10.0)
+
+
+# 注册所有支持特征持久化的 Scorer (特征与权重无关，默认参数即可)
+FEATURE_SCORERS = [
+    CodeProductionScorer(),
+    ReasoningDepthScorer(),
+    ToolDiversityScorer(),
+    ToolSuccessScorer(),
+    TurnEfficiencyScorer()
+]
@@ -0,0 +1,268 @@
+"""
+多样性感知的子集选择
+
+只按分数取 Top-N 容易选出大量相似的任务。这里对每条通过的轨迹做本地向量化
+(Prompt 词 n-gram + 工具调用序列 n-gram 的哈希向量，不依赖任何网络模型)，
+再用带分数加权的贪心 k-center 选出 N 条：每一步选择
+
+    alpha * 与已选集合的最小余弦距离 + (1 - alpha) * 归一化分数
+
+最大的轨迹，完全重复的轨迹距离为 0，自然被排到后面。
+
+百万级候选按 mini-batch 处理：保留当前已选的 N 条作为候选池，每来一批就在
+"候选池 + 新批次" 上重新贪心选出 N 条 (GreeDi 式的组合核心集)，内存只有 (N + batch) 个向量。
+
+    python -m analytics.selection --in dataset/sft.jsonl --n 1000 --alpha 0.5 --out sft_diverse.jsonl
+
+依赖 numpy (可选依赖，仅本模块需要)。
+"""
+import argparse
+import json
+import math
+import re
+import zlib
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+
+from .schemas import AnalysisResult, DatasetType
+from .preference import normalize_prompt
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_WORD = re.compile(r"\w+")
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("numpy is required for diversity-aware selection")
+
+
+def _text_of(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        # 多模态消息只取文本部分
+        return " ".join(p.get('text', '') for p in content if isinstance(p, dict))
+    return ""
+
+
+class HashedNgramEmbedder:
+    """Prompt 与工具序列的哈希 n-gram 向量 (signed feature hashing，L2 归一化)"""
+
+    def __init__(self, dim: int = 512, tool_weight: float = 1.0, max_prompt_chars: int = 4000):
+        """
+        :param dim: 向量维度
+        :param tool_weight: 工具序列部分相对 Prompt 部分的权重
+        :param max_prompt_chars: Prompt 只取前若干字符
+        """
+        _require_numpy()
+        self.dim = dim
+        self.tool_weight = tool_weight
+        self.max_prompt_chars = max_prompt_chars
+
+    def features(self, messages: List[Dict[str, Any]]) -> Tuple[Counter, Counter]:
+        """返回 (Prompt 特征计数, 工具序列特征计数)"""
+        prompt = next((_text_of(m.get('content')) for m in messages if m.get('role') == 'user'), "")
+        words = _WORD.findall(normalize_prompt(prompt[:self.max_prompt_chars]))
+        prompt_feats = Counter(f"w:{w}" for w in words)
+        prompt_feats.update(f"b:{a} {b}" for a, b in zip(words, words[1:]))
+
+        tools = [call.get('function', {}).get('name', '')
+                 for m in messages if m.get('role') == 'assistant'
+                 for call in (m.get('tool_calls') or [])]
+        tool_feats = Counter(f"t:{t}" for t in tools)
+        tool_feats.update(f"tt:{a}>{b}" for a, b in zip(tools, tools[1:]))
+        return prompt_feats, tool_feats
+
+    def _hash_block(self, vec, feats: Counter, weight: float):
+        if not feats:
+            return
+        idx = np.empty(len(feats), dtype=np.int64)
+        val = np.empty(len(feats), dtype=np.float32)
+        for i, (feat, count) in enumerate(feats.items()):
+            # crc32 跨进程稳定 (内置 hash 会随机化)，最高位决定符号以抵消碰撞偏差
+            h = zlib.crc32(feat.encode('utf-8'))
+            idx[i] = h % self.dim
+            val[i] = (1.0 + math.log(count)) * (1.0 if h & 0x80000000 else -1.0)
+        block = np.zeros(self.dim, dtype=np.float32)
+        np.add.at(block, idx, val)
+        norm = np.linalg.norm(block)
+        if norm > 0:
+            vec += block * (weight / norm)
+
+    def embed(self, messages: List[Dict[str, Any]], out=None):
+        vec = out if out is not None else np.zeros(self.dim, dtype=np.float32)
+        prompt_feats, tool_feats = self.features(messages)
+        self._hash_block(vec, prompt_feats, 1.0)
+        self._hash_block(vec, tool_feats, self.tool_weight)
+        norm = np.linalg.norm(vec)
+        if norm > 0:
+            vec /= norm
+        return vec
+
+    def embed_batch(self, batch: List[List[Dict[str, Any]]]):
+        matrix = np.zeros((len(batch), self.dim), dtype=np.float32)
+        for i, messages in enumerate(batch):
+            self.embed(messages, out=matrix[i])
+        return matrix
+
+
+def greedy_select(vectors, quality, k: int, alpha: float = 0.5) -> Tuple[List[int], float]:
+    """
+    分数加权的贪心 k-center
+    :param vectors: (M, dim) L2 归一化向量
+    :param quality: (M,) 归一化到 [0, 1] 的分数
+    :return: (按选择顺序的下标, 覆盖半径：未选中点到已选集合的最大距离)
+    """
+    m = len(vectors)
+    if m == 0:
+        return [], 0.0
+    k = min(k, m)
+    # 余弦距离截断到 [0, 1]：负相关与正交同样视为 "完全不同"
+    min_dist = np.ones(m, dtype=np.float32)
+    chosen = np.zeros(m, dtype=bool)
+    order = []
+    for _ in range(k):
+        gain = alpha * min_dist + (1.0 - alpha) * quality
+        gain[chosen] = -np.inf
+        i = int(np.argmax(gain))
+        order.append(i)
+        chosen[i] = True
+        np.minimum(min_dist, np.clip(1.0 - vectors @ vectors[i], 0.0, 1.0), out=min_dist)
+    remaining = min_dist[~chosen]
+    radius = float(remaining.max()) if len(remaining) else 0.0
+    return order, radius
+
+
+class DiverseSelector:
+    """流式读取分析结果，按 mini-batch 维护多样性子集"""
+
+    def __init__(self,
+                 n: int,
+                 alpha: float = 0.5,
+                 batch_size: int = 50000,
+                 score_scale: float = 100.0,
+                 dataset_types: Iterable[DatasetType] = (DatasetType.SFT,),
+                 embedder: Optional[HashedNgramEmbedder] = None):
+        """
+        :param n: 需要选出的轨迹数
+        :param alpha: 多样性权重，0 退化为按分数排序，1 为纯 k-center
+        :param batch_size: 每批候选数
+        :param score_scale: 分数归一化的分母 (场景总分上限)
+        :param dataset_types: 参与选择的数据集类型
+        :param embedder: 向量化方法，默认 HashedNgramEmbedder()
+        """
+        _require_numpy()
+        self.n = n
+        self.alpha = alpha
+        self.batch_size = batch_size
+        self.score_scale = score_scale
+        self.dataset_types = set(dataset_types)
+        self.embedder = embedder or HashedNgramEmbedder()
+
+        self._pool: List[AnalysisResult] = []
+        self._pool_vectors = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._batch: List[AnalysisResult] = []
+
+        self.candidates = 0
+        self.skipped = 0
+        self.batches = 0
+        self.radius = 0.0
+
+    def add(self, result: AnalysisResult):
+        if result.dataset_type not in self.dataset_types or not result.openai_messages:
+            self.skipped += 1
+            return
+        self._batch.append(result)
+        self.candidates += 1
+        if len(self._batch) >= self.batch_size:
+            self._reduce()
+
+    def add_all(self, results: Iterable[AnalysisResult]):
+        for res in results:
+            self.add(res)
+
+    def _reduce(self):
+        if not self._batch:
+            return
+        batch_vectors = self.embedder.embed_batch([r.openai_messages for r in self._batch])
+        items = self._pool + self._batch
+        vectors = np.vstack([self._pool_vectors, batch_vectors])
+        quality = np.clip(np.array([r.score for r in items], dtype=np.float32) / self.score_scale, 0.0, 1.0)
+
+        order, self.radius = greedy_select(vectors, quality, self.n, self.alpha)
+        self._pool = [items[i] for i in order]
+        self._pool_vectors = vectors[order]
+        self._batch = []
+        self.batches += 1
+
+    def select(self) -> List[AnalysisResult]:
+        """处理剩余批次，返回按选择顺序排列的子集 (越靠前贡献越大)"""
+        self._reduce()
+        return list(self._pool)
+
+    def summary(self) -> Dict[str, Any]:
+        scores = [r.score for r in self._pool]
+        return {
+            "candidates": self.candidates,
+            "skipped": self.skipped,
+            "selected": len(self._pool),
+            "batches": self.batches,
+            "coverage_radius": round(self.radius, 4),
+            "avg_score": round(sum(scores) / len(scores), 2) if scores else 0.0
+        }
+
+
+def export_diverse_subset(results: Iterable[AnalysisResult], filename: str = "sft_diverse.jsonl",
+                          **selector_kwargs) -> Dict[str, Any]:
+    """选出多样性子集并写出为 JSONL，返回选择报告"""
+    selector = DiverseSelector(**selector_kwargs)
+    selector.add_all(results)
+    with open(filename, 'w', encoding='utf-8') as f:
+        for rank, res in enumerate(selector.select()):
+            data = res.to_dict()
+            data['selection_rank'] = rank
+            f.write(json.dumps(data, ensure_ascii=False) + "\n")
+
+    summary = selector.summary()
+    print(f"🌈 Selected {summary['selected']} of {summary['candidates']} traces "
+          f"(avg score: {summary['avg_score']}, coverage radius: {summary['coverage_radius']})")
+    return summary
+
+
+def _iter_results(path: str, blob_dir: Optional[str] = None) -> Iterable[AnalysisResult]:
+    if blob_dir:
+        from .blobstore import BlobStore, iter_expanded
+        with BlobStore(blob_dir) as store:
+            for sample in iter_expanded(path, store):
+                yield AnalysisResult.from_dict(sample)
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield AnalysisResult.from_dict(json.loads(line))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diversity-aware subset selection")
+    parser.add_argument("--in", dest="inputs", nargs="+", required=True, help="sink JSONL files (e.g. sft.jsonl)")
+    parser.add_argument("--n", type=int, required=True)
+    parser.add_argument("--alpha", type=float, default=0.5, help="diversity weight in [0, 1]")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--score-scale", type=float, default=100.0)
+    parser.add_argument("--blobs", help="blob store directory if samples were written with a BlobStore")
+    parser.add_argument("--out", default="sft_diverse.jsonl")
+    args = parser.parse_args(argv)
+
+    results = (res for path in args.inputs for res in _iter_results(path, args.blobs))
+    export_diverse_subset(results, filename=args.out, n=args.n, alpha=args.alpha,
+                          batch_size=args.batch_size, score_scale=args.score_scale,
+                          embedder=HashedNgramEmbedder(dim=args.dim))
+
+
+if __name__ == "__main__":
+    main()
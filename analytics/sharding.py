@@ -0,0 +1,247 @@
+"""
+多节点分片运行与结果合并
+
+每个节点只处理 trace_id 哈希落在自己分区内的轨迹 (分区判断在 adapt 之前，但每个节点仍要扫描全部输入；
+读取使用零拷贝模式，不属于本分片的记录中的大段文本不会被解码)：
+    python -m analytics.sharding run --shard 0/4 --scenario swe_bench --out out/ data/*.jsonl.gz
+全部分片完成后合并：
+    python -m analytics.sharding merge --out merged/ out/shard-*
+本地用 N 个进程模拟 N 个节点：
+    python -m analytics.sharding local --shards 4 --out out/ data/*.jsonl.gz
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from typing import List, Dict, Any, Tuple, Iterable
+
+from .schemas import AnalysisResult, DatasetType
+from .sinks import JsonlDatasetSink
+from .sketches import ScoreDistributions
+from .stats import RunStats, TopK
+
+MANIFEST_FILE = "manifest.json"
+METRICS_FILE = "metrics.json"
+TOPK_FILE = "topk.jsonl"
+DISTRIBUTIONS_FILE = "distributions.json"
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """解析 'i/N' 格式的分片参数"""
+    try:
+        index, total = (int(x) for x in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec '{spec}', expected 'i/N'")
+    if total <= 0 or not 0 <= index < total:
+        raise ValueError(f"Invalid shard spec '{spec}', expected 0 <= i < N")
+    return index, total
+
+
+def shard_of(trace_id: str, num_shards: int) -> int:
+    """稳定哈希分区 (不依赖 Python 进程级随机化的 hash())"""
+    digest = hashlib.md5(str(trace_id).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % num_shards
+
+
+def shard_dir_name(index: int, total: int) -> str:
+    return f"shard-{index:05d}-of-{total:05d}"
+
+
+def run_shard(paths: List[str], shard_index: int, num_shards: int, out_dir: str,
+              scenario_name: str = "default", top_k: int = 100, max_workers: int = 4, lazy_text: bool = True) -> str:
+    """
+    处理属于本分片的轨迹，写出 sink / manifest / metrics / 分布草图 / topk，返回分片目录
+    :param lazy_text: 零拷贝读取 (见 lazytext.py)，跳过的记录只扫描 JSON 结构，不解码其中的大字符串
+    """
+    from .pipeline import TracePipeline
+    from .readers import ConcurrentTraceReader
+
+    shard_dir = os.path.join(out_dir, shard_dir_name(shard_index, num_shards))
+    pipeline = TracePipeline(scenario_name=scenario_name)
+    reader = ConcurrentTraceReader(paths, max_workers=max_workers, lazy_text=lazy_text)
+
+    stats = RunStats()
+    top = TopK(top_k)
+    dists = ScoreDistributions()
+    skipped = 0
+
+    with JsonlDatasetSink(shard_dir) as sink:
+        for record in reader:
+            trace_id = str(record.get('trace_id') or record.get('id', ''))
+            if shard_of(trace_id, num_shards) != shard_index:
+                skipped += 1
+                continue
+            result = pipeline.process_record(record)
+            sink.write(result)
+            stats.update(result)
+            top.push(result)
+            dists.add(result, pipeline.config.name)
+
+    with open(os.path.join(shard_dir, METRICS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(stats.to_dict(), f, ensure_ascii=False, indent=2)
+
+    dists.save(os.path.join(shard_dir, DISTRIBUTIONS_FILE))
+
+    with open(os.path.join(shard_dir, TOPK_FILE), 'w', encoding='utf-8') as f:
+        for res in top.results():
+            f.write(json.dumps(res.to_dict(), ensure_ascii=False) + "\n")
+
+    manifest = {
+        "shard_index": shard_index,
+        "num_shards": num_shards,
+        "scenario": pipeline.config.name,
+        "inputs": sorted(paths),
+        "processed": stats.total,
+        "skipped_other_shards": skipped,
+        "files": {t: sink.counts[t] for t in sink.counts}
+    }
+    with open(os.path.join(shard_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"🧩 Shard {shard_index}/{num_shards}: processed {stats.total}, skipped {skipped} -> {shard_dir}")
+    return shard_dir
+
+
+def _load_manifests(shard_dirs: Iterable[str]) -> List[Tuple[Dict[str, Any], str]]:
+    manifests = []
+    for d in shard_dirs:
+        with open(os.path.join(d, MANIFEST_FILE), encoding='utf-8') as f:
+            manifests.append((json.load(f), d))
+    manifests.sort(key=lambda x: x[0]['shard_index'])
+
+    if not manifests:
+        raise ValueError("No shard directories to merge")
+
+    # 校验：分片数、场景一致，且 0..N-1 各出现一次
+    num_shards = manifests[0][0]['num_shards']
+    scenario = manifests[0][0]['scenario']
+    for m, d in manifests:
+        if m['num_shards'] != num_shards or m['scenario'] != scenario:
+            raise ValueError(f"Shard {d} does not match num_shards={num_shards}, scenario={scenario}")
+    indices = [m['shard_index'] for m, _ in manifests]
+    if indices != list(range(num_shards)):
+        missing = sorted(set(range(num_shards)) - set(indices))
+        raise ValueError(f"Incomplete or duplicated shards: missing={missing}, got={indices}")
+    return manifests
+
+
+def merge_shards(shard_dirs: List[str], out_dir: str, top_k: int = 100, html_report: bool = False) -> Dict[str, Any]:
+    """合并各分片的 sink、manifest、metrics 与 topk，返回合并后的 manifest"""
+    manifests = _load_manifests(shard_dirs)
+    os.makedirs(out_dir, exist_ok=True)
+
+    # 1. Sink：按分片序拼接，结果确定
+    for ds_type in DatasetType:
+        name = f"{ds_type.value}.jsonl"
+        with open(os.path.join(out_dir, name), 'wb') as out:
+            for _, d in manifests:
+                path = os.path.join(d, name)
+                if os.path.exists(path):
+                    with open(path, 'rb') as f:
+                        shutil.copyfileobj(f, out)
+
+    # 2. Metrics
+    stats = RunStats()
+    for _, d in manifests:
+        with open(os.path.join(d, METRICS_FILE), encoding='utf-8') as f:
+            stats.merge(RunStats.from_dict(json.load(f)))
+    with open(os.path.join(out_dir, METRICS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(stats.to_dict(), f, ensure_ascii=False, indent=2)
+
+    dists = ScoreDistributions()
+    for _, d in manifests:
+        path = os.path.join(d, DISTRIBUTIONS_FILE)
+        if os.path.exists(path):
+            dists.merge(ScoreDistributions.load(path))
+    dists.save(os.path.join(out_dir, DISTRIBUTIONS_FILE))
+
+    # 3. Top-K
+    top = TopK(top_k)
+    for _, d in manifests:
+        with open(os.path.join(d, TOPK_FILE), encoding='utf-8') as f:
+            for line in f:
+                top.push(AnalysisResult.from_dict(json.loads(line)))
+    top_results = top.results()
+    with open(os.path.join(out_dir, TOPK_FILE), 'w', encoding='utf-8') as f:
+        for res in top_results:
+            f.write(json.dumps(res.to_dict(), ensure_ascii=False) + "\n")
+
+    # 4. Manifest
+    merged = {
+        "num_shards": manifests[0][0]['num_shards'],
+        "scenario": manifests[0][0]['scenario'],
+        "processed": sum(m['processed'] for m, _ in manifests),
+        "files": {t.value: sum(m['files'].get(t.value, 0) for m, _ in manifests) for t in DatasetType},
+        "shards": [m for m, _ in manifests]
+    }
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(merged, f, ensure_ascii=False, indent=2)
+
+    if html_report:
+        from .converters import ReportGenerator
+        ReportGenerator.generate_html(top_results, filename=os.path.join(out_dir, "report.html"))
+
+    print(f"🔗 Merged {len(manifests)} shards: {merged['processed']} traces -> {out_dir}")
+    return merged
+
+
+def run_local(paths: List[str], num_shards: int, out_dir: str, scenario_name: str = "default",
+              top_k: int = 100) -> Dict[str, Any]:
+    """本地启动 N 个进程模拟 N 个节点，完成后合并"""
+    procs = []
+    for i in range(num_shards):
+        cmd = [sys.executable, "-m", "analytics.sharding", "run",
+               "--shard", f"{i}/{num_shards}", "--scenario", scenario_name,
+               "--top-k", str(top_k), "--out", out_dir] + list(paths)
+        procs.append(subprocess.Popen(cmd))
+
+    failed = [i for i, p in enumerate(procs) if p.wait() != 0]
+    if failed:
+        raise RuntimeError(f"Shards failed: {failed}")
+
+    shard_dirs = [os.path.join(out_dir, shard_dir_name(i, num_shards)) for i in range(num_shards)]
+    return merge_shards(shard_dirs, os.path.join(out_dir, "merged"), top_k=top_k)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded TrajectoryPrism runs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="process one shard")
+    p_run.add_argument("--shard", required=True,
+                       help="i/N; every node still reads and scans all inputs, only traces of its shard are "
+                            "adapted and scored")
+    p_run.add_argument("--scenario", default="default")
+    p_run.add_argument("--out", required=True)
+    p_run.add_argument("--top-k", type=int, default=100)
+    p_run.add_argument("--workers", type=int, default=4)
+    p_run.add_argument("inputs", nargs="+")
+
+    p_merge = sub.add_parser("merge", help="merge shard outputs")
+    p_merge.add_argument("--out", required=True)
+    p_merge.add_argument("--top-k", type=int, default=100)
+    p_merge.add_argument("--html", action="store_true", help="render report.html from merged top-K")
+    p_merge.add_argument("shard_dirs", nargs="+")
+
+    p_local = sub.add_parser("local", help="simulate N nodes with N local processes")
+    p_local.add_argument("--shards", type=int, required=True)
+    p_local.add_argument("--scenario", default="default")
+    p_local.add_argument("--out", required=True)
+    p_local.add_argument("--top-k", type=int, default=100)
+    p_local.add_argument("inputs", nargs="+")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        index, total = parse_shard(args.shard)
+        run_shard(args.inputs, index, total, args.out, args.scenario, args.top_k, args.workers)
+    elif args.command == "merge":
+        merge_shards(args.shard_dirs, args.out, args.top_k, args.html)
+    else:
+        run_local(args.inputs, args.shards, args.out, args.scenario, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
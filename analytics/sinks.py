@@ -0,0 +1,62 @@
+import json
+import os
+from typing import Dict, Any, Iterable
+
+from .schemas import AnalysisResult, DatasetType
+
+
+class JsonlDatasetSink:
+    """
+    按数据集类型分文件写出分析结果
+    out_dir/sft.jsonl, out_dir/rlhf.jsonl, out_dir/rejected.jsonl
+
+    指定 blob_store (BlobStore) 时，openai_messages 中的大段文本只存一份，样本中写入引用，
+    读取时用 blobstore.iter_expanded 还原。
+    """
+
+    def __init__(self, out_dir: str, include_rejected: bool = True, blob_store=None):
+        self.out_dir = out_dir
+        self.include_rejected = include_rejected
+        self.blob_store = blob_store
+        os.makedirs(out_dir, exist_ok=True)
+
+        self._files: Dict[DatasetType, Any] = {}
+        self.counts: Dict[str, int] = {t.value: 0 for t in DatasetType}
+
+    def path_for(self, ds_type: DatasetType) -> str:
+        return os.path.join(self.out_dir, f"{ds_type.value}.jsonl")
+
+    def serialize(self, result: AnalysisResult) -> Dict[str, Any]:
+        """单条样本的落盘格式，子类可覆盖"""
+        data = result.to_dict()
+        if self.blob_store is not None and data.get('openai_messages'):
+            data['openai_messages'] = self.blob_store.dedupe_messages(data['openai_messages'])
+        return data
+
+    def write(self, result: AnalysisResult):
+        if result.dataset_type == DatasetType.REJECTED and not self.include_rejected:
+            return
+
+        f = self._files.get(result.dataset_type)
+        if f is None:
+            f = self._files[result.dataset_type] = open(self.path_for(result.dataset_type), 'w', encoding='utf-8')
+
+        f.write(json.dumps(self.serialize(result), ensure_ascii=False) + "\n")
+        self.counts[result.dataset_type.value] += 1
+
+    def write_all(self, results: Iterable[AnalysisResult]):
+        for res in results:
+            self.write(res)
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+        if self.blob_store is not None:
+            self.blob_store.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
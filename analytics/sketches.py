@@ -0,0 +1,302 @@
+import json
+import math
+import random
+from typing import List, Dict, Any, Optional, Iterable, Iterator
+
+from .schemas import AnalysisResult, DatasetType
+
+# 默认跟踪分布的关键指标
+KEY_METRICS = [
+    "gemini_cli.lines.changed",
+    "gemini_cli.agent.turns",
+    "gemini_cli.tool.call.count",
+    "gemini_cli.agent.recovery_attempt.count",
+]
+
+SUMMARY_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+class KLLSketch:
+    """
+    KLL 流式分位数草图 (Karnin-Lang-Liberty)
+    空间 O(k log(n/k))，秩误差约为 1/k 量级；可合并，可序列化。
+    """
+
+    def __init__(self, k: int = 200, c: float = 2.0 / 3.0, seed: Optional[int] = None):
+        self.k = k
+        self.c = c
+        self.rng = random.Random(seed)
+        self.compactors: List[List[float]] = [[]]
+        self.n = 0
+        self.size = 0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self._limit = self._max_size()
+
+    def _capacity(self, height: int) -> int:
+        depth = len(self.compactors) - height - 1
+        return int(math.ceil(self.k * self.c ** depth)) + 1
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _compress(self):
+        while self.size >= self._limit:
+            for h in range(len(self.compactors)):
+                if len(self.compactors[h]) >= self._capacity(h):
+                    if h + 1 >= len(self.compactors):
+                        self.compactors.append([])
+                        self._limit = self._max_size()
+                    level = sorted(self.compactors[h])
+                    # 奇数个时留下最后一个，其余随机取奇/偶位晋升 (权重翻倍)
+                    keep = [level.pop()] if len(level) % 2 else []
+                    offset = 1 if self.rng.random() < 0.5 else 0
+                    self.compactors[h + 1].extend(level[offset::2])
+                    self.compactors[h] = keep
+                    self.size = sum(len(c) for c in self.compactors)
+                    break
+
+    def update(self, value: float):
+        value = float(value)
+        self.compactors[0].append(value)
+        self.n += 1
+        self.size += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        if self.size >= self._limit:
+            self._compress()
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        self._limit = self._max_size()
+        for h, level in enumerate(other.compactors):
+            self.compactors[h].extend(level)
+        self.n += other.n
+        self.size = sum(len(c) for c in self.compactors)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _weighted(self) -> List[tuple]:
+        items = [(v, 2 ** h) for h, level in enumerate(self.compactors) for v in level]
+        items.sort()
+        return items
+
+    def quantile(self, q: float) -> Optional[float]:
+        """返回近似 q 分位数 (0 <= q <= 1)"""
+        if self.n == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        items = self._weighted()
+        total = sum(w for _, w in items)
+        target = q * total
+        cum = 0
+        for value, weight in items:
+            cum += weight
+            if cum >= target:
+                return value
+        return self.max
+
+    def rank(self, value: float) -> float:
+        """返回 <= value 的近似比例 (CDF)"""
+        if self.n == 0:
+            return 0.0
+        items = self._weighted()
+        total = sum(w for _, w in items)
+        return sum(w for v, w in items if v <= value) / total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"k": self.k, "c": self.c, "n": self.n, "min": self.min, "max": self.max,
+                "compactors": self.compactors}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "KLLSketch":
+        sketch = cls(k=data['k'], c=data['c'])
+        sketch.compactors = [list(level) for level in data['compactors']] or [[]]
+        sketch.n = data['n']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        sketch.size = sum(len(c) for c in sketch.compactors)
+        sketch._limit = sketch._max_size()
+        return sketch
+
+
+class ScoreDistributions:
+    """
+    按场景跟踪分布：
+    - total                 通过样本的总分
+    - scorer:<ScorerName>   每个 Scorer 的得分贡献
+    - metric:<metric key>   关键 trace.metrics 指标 (全部轨迹)
+    可合并 (跨分片/跨运行)，可用于校准 ScenarioConfig 权重与分位数阈值。
+    """
+
+    def __init__(self, k: int = 200, metrics: Iterable[str] = KEY_METRICS):
+        self.k = k
+        self.metrics = list(metrics)
+        self.sketches: Dict[str, Dict[str, KLLSketch]] = {}
+
+    def _sketch(self, scenario: str, series: str) -> KLLSketch:
+        by_series = self.sketches.setdefault(scenario, {})
+        sketch = by_series.get(series)
+        if sketch is None:
+            sketch = by_series[series] = KLLSketch(k=self.k)
+        return sketch
+
+    def add(self, result: AnalysisResult, scenario: str = "default"):
+        if result.dataset_type != DatasetType.REJECTED:
+            self._sketch(scenario, "total").update(result.score)
+            for name, value in result.score_breakdown.items():
+                self._sketch(scenario, f"scorer:{name}").update(value)
+
+        for key in self.metrics:
+            value = result.metadata.get(key)
+            if isinstance(value, (int, float)):
+                self._sketch(scenario, f"metric:{key}").update(value)
+
+    def observe(self, results: Iterable[AnalysisResult], scenario: str = "default") -> Iterator[AnalysisResult]:
+        """透传结果流，同时更新分布"""
+        for res in results:
+            self.add(res, scenario)
+            yield res
+
+    def quantile(self, scenario: str, q: float, series: str = "total") -> Optional[float]:
+        sketch = self.sketches.get(scenario, {}).get(series)
+        return sketch.quantile(q) if sketch else None
+
+    def top_threshold(self, scenario: str, fraction: float, series: str = "total") -> Optional[float]:
+        """'保留前 fraction' 对应的分数线，如 top_threshold('swe_bench', 0.1)"""
+        return self.quantile(scenario, 1.0 - fraction, series)
+
+    def merge(self, other: "ScoreDistributions") -> "ScoreDistributions":
+        for scenario, by_series in other.sketches.items():
+            for series, sketch in by_series.items():
+                mine = self.sketches.setdefault(scenario, {}).get(series)
+                if mine is None:
+                    self.sketches[scenario][series] = KLLSketch.from_dict(sketch.to_dict())
+                else:
+                    mine.merge(sketch)
+        return self
+
+    def summary(self, quantiles: Iterable[float] = SUMMARY_QUANTILES) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """运行摘要：每个场景、每个序列的计数、极值与分位数"""
+        quantiles = list(quantiles)
+        out = {}
+        for scenario, by_series in sorted(self.sketches.items()):
+            out[scenario] = {}
+            for series, sketch in sorted(by_series.items()):
+                row = {"count": sketch.n, "min": sketch.min, "max": sketch.max}
+                for q in quantiles:
+                    row[f"p{int(round(q * 100))}"] = sketch.quantile(q)
+                out[scenario][series] = row
+        return out
+
+    def print_summary(self):
+        for scenario, by_series in self.summary().items():
+            print(f"📊 Distribution summary [{scenario}]")
+            for series, row in by_series.items():
+                cols = ", ".join(f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}" for k, v in row.items())
+                print(f"   - {series}: {cols}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "k": self.k,
+            "metrics": self.metrics,
+            "sketches": {s: {name: sk.to_dict() for name, sk in by.items()} for s, by in self.sketches.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScoreDistributions":
+        dist = cls(k=data.get('k', 200), metrics=data.get('metrics', KEY_METRICS))
+        for scenario, by_series in data.get('sketches', {}).items():
+            dist.sketches[scenario] = {name: KLLSketch.from_dict(sk) for name, sk in by_series.items()}
+        return dist
+
+    def save(self, filename: str):
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, filename: str) -> "ScoreDistributions":
+        with open(filename, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+class TopPercentileGate:
+    """
+    分位数阈值门：只放行得分位于前 fraction 的样本，无需第二遍扫描
+    - 给定 calibration (历史运行保存的 ScoreDistributions)：阈值固定；
+    - 否则在线学习：前 warmup 条先缓存，之后按当前草图的分位数判定。
+      计算分位数要对整个草图排序，阈值因此缓存，每 refresh_every 次更新或草图新增一层压缩器后才重新计算。
+    """
+
+    def __init__(self, fraction: float, scenario: str = "default",
+                 calibration: Optional[ScoreDistributions] = None, warmup: int = 1000, k: int = 200,
+                 refresh_every: int = 100):
+        self.fraction = fraction
+        self.scenario = scenario
+        self.calibration = calibration
+        self.warmup = warmup
+        self.refresh_every = max(1, refresh_every)
+        self._sketch = KLLSketch(k=k)
+        self._buffer: List[AnalysisResult] = []
+        # 缓存的阈值及其对应的 (草图样本数, 压缩器层数)
+        self._threshold: Optional[float] = None
+        self._threshold_at: Optional[tuple] = None
+        self.passed = 0
+        self.dropped = 0
+
+    def threshold(self) -> Optional[float]:
+        if self.calibration is not None:
+            return self.calibration.top_threshold(self.scenario, self.fraction)
+        return self._sketch.quantile(1.0 - self.fraction)
+
+    def _cached_threshold(self) -> Optional[float]:
+        n, levels = self._sketch.n, len(self._sketch.compactors)
+        at = self._threshold_at
+        if at is None or levels != at[1] or n - at[0] >= self.refresh_every:
+            self._threshold = self.threshold()
+            self._threshold_at = (n, levels)
+        return self._threshold
+
+    def _decide(self, result: AnalysisResult, threshold: Optional[float]) -> bool:
+        keep = threshold is not None and result.score >= threshold
+        if keep:
+            self.passed += 1
+        else:
+            self.dropped += 1
+        return keep
+
+    def filter(self, results: Iterable[AnalysisResult]) -> Iterator[AnalysisResult]:
+        for res in results:
+            if res.dataset_type == DatasetType.REJECTED:
+                self.dropped += 1
+                continue
+
+            if self.calibration is None:
+                self._sketch.update(res.score)
+                if self._sketch.n <= self.warmup:
+                    self._buffer.append(res)
+                    continue
+                if self._buffer:
+                    threshold = self.threshold()
+                    for buffered in self._buffer:
+                        if self._decide(buffered, threshold):
+                            yield buffered
+                    self._buffer = []
+
+            if self._decide(res, self._cached_threshold()):
+                yield res
+
+        # 数据量不足 warmup 时，在结束时按全量草图判定
+        if self._buffer:
+            threshold = self.threshold()
+            for buffered in self._buffer:
+                if self._decide(buffered, threshold):
+                    yield buffered
+            self._buffer = []
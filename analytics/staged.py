@@ -0,0 +1,265 @@
+import queue
+import threading
+import time
+from typing import List, Dict, Any, Optional, Callable, Iterable
+
+from .schemas import AnalysisResult, DatasetType, TraceData
+from .converters import OpenAIConverter
+
+# 阶段之间传递的结束标记
+_STOP = object()
+
+
+class Stage:
+    """
+    一个处理阶段：workers 个线程从 in_q 取任务，fn 处理后放入 out_q。
+    fn 返回 None 表示丢弃 (不向下游传递)。
+    队列有界：下游变慢时 put 阻塞，压力逐级传回上游 (backpressure)，内存不会无限增长。
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int,
+                 in_q: Optional[queue.Queue], out_q: Optional[queue.Queue]):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.in_q = in_q
+        self.out_q = out_q
+        self.downstream_workers = 1
+
+        self.processed = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self._depth_sum = 0
+        self._depth_samples = 0
+        self._alive = self.workers
+        self._lock = threading.Lock()
+
+    def sample_depth(self):
+        if self.in_q is None:
+            return
+        depth = self.in_q.qsize()
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        self._depth_sum += depth
+        self._depth_samples += 1
+
+    def stats(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "queue_depth": self.in_q.qsize() if self.in_q is not None else 0,
+            "queue_capacity": self.in_q.maxsize if self.in_q is not None else 0,
+            "avg_queue_depth": round(self._depth_sum / self._depth_samples, 2) if self._depth_samples else 0.0,
+            "max_queue_depth": self.max_queue_depth,
+            "utilization": round(self.busy_seconds / (self.workers * elapsed), 4) if elapsed > 0 else 0.0
+        }
+
+
+class StagedPipeline:
+    """
+    分阶段并发执行：read/decode -> adapt -> analyze (filter/score) -> convert -> write
+    每个阶段有独立的线程数，阶段之间用有界队列连接。
+    通过 stats() 可以看到每个阶段的队列深度与利用率，定位瓶颈阶段：
+    利用率接近 1 且上游队列常满的阶段就是瓶颈。
+
+    注意：多 worker 时输出顺序不保证与输入一致。
+    """
+
+    STAGES = ("read", "adapt", "analyze", "convert", "write")
+
+    def __init__(self, pipeline, sink=None, workers: Optional[Dict[str, int]] = None,
+                 queue_size: int = 256, on_result: Optional[Callable[[AnalysisResult], None]] = None,
+                 monitor_interval: float = 0.0):
+        """
+        :param pipeline: TracePipeline (提供场景配置与 adapt / evaluate)
+        :param sink: 具有 write(result) 方法的输出 (如 JsonlDatasetSink)
+        :param workers: 每个阶段的线程数，如 {"adapt": 4, "write": 1}；未指定的阶段为 1
+        :param queue_size: 阶段之间队列的容量
+        :param on_result: 在 write 阶段对每个结果调用的回调 (统计、抽样等)
+        :param monitor_interval: > 0 时每隔该秒数打印一次各阶段状态
+        """
+        if getattr(pipeline, 'profiler', None) is not None:
+            # tracemalloc 按进程统计，MemoryProfiler 的组件栈也不是线程安全的；
+            # adapt 与 analyze 阶段总在不同线程中并发执行，归因必然错乱
+            raise ValueError("MemoryProfiler is not supported with StagedPipeline; profile with TracePipeline instead")
+        self.pipeline = pipeline
+        self.sink = sink
+        self.workers = {name: 1 for name in self.STAGES}
+        self.workers.update(workers or {})
+        self.queue_size = queue_size
+        self.on_result = on_result
+        self.monitor_interval = monitor_interval
+
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self.stages: List[Stage] = []
+        self._start_time = 0.0
+        self._end_time = 0.0
+
+    # ---------------- 各阶段的处理函数 ----------------
+
+    def _adapt(self, record: Dict[str, Any]) -> TraceData:
+        return self.pipeline.adapt_record(record)
+
+    def _evaluate(self, trace: TraceData):
+        return trace, self.pipeline.evaluate(trace)
+
+    def _convert(self, item) -> AnalysisResult:
+        trace, result = item
+        if result.dataset_type != DatasetType.REJECTED:
+            result.openai_messages = OpenAIConverter.convert(trace)
+        return result
+
+    def _write(self, result: AnalysisResult):
+        # sink 一般不是线程安全的，多个 write worker 时串行化
+        with self._write_lock:
+            if self.sink is not None:
+                self.sink.write(result)
+            if self.on_result is not None:
+                self.on_result(result)
+        return None
+
+    # ---------------- 执行框架 ----------------
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fail(self, e: BaseException):
+        with self._write_lock:
+            if self._error is None:
+                self._error = e
+        self._stop.set()
+
+    def _finish_worker(self, stage: Stage):
+        with stage._lock:
+            stage._alive -= 1
+            last = stage._alive == 0
+        # 最后一个退出的 worker 负责通知下游所有 worker
+        if last and stage.out_q is not None:
+            for _ in range(stage.downstream_workers):
+                if not self._put(stage.out_q, _STOP):
+                    break
+
+    def _run_worker(self, stage: Stage):
+        try:
+            while not self._stop.is_set():
+                try:
+                    item = stage.in_q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _STOP:
+                    break
+                start = time.perf_counter()
+                out = stage.fn(item)
+                elapsed = time.perf_counter() - start
+                with stage._lock:
+                    stage.busy_seconds += elapsed
+                    stage.processed += 1
+                if out is not None and stage.out_q is not None:
+                    if not self._put(stage.out_q, out):
+                        break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._finish_worker(stage)
+
+    def _run_source(self, stage: Stage, records: Iterable[Dict[str, Any]]):
+        iterator = None
+        try:
+            iterator = iter(records)
+            while not self._stop.is_set():
+                start = time.perf_counter()
+                try:
+                    record = next(iterator)
+                except StopIteration:
+                    break
+                stage.busy_seconds += time.perf_counter() - start
+                stage.processed += 1
+                if not self._put(stage.out_q, record):
+                    break
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            # 提前结束时关闭生成器，让并发读取器的线程退出
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            self._finish_worker(stage)
+
+    def _monitor(self):
+        last_print = time.time()
+        while not self._stop.wait(0.05):
+            for stage in self.stages:
+                stage.sample_depth()
+            if self.monitor_interval > 0 and time.time() - last_print >= self.monitor_interval:
+                self.print_stats()
+                last_print = time.time()
+
+    def run(self, paths: List[str], read_ahead: int = 8) -> Dict[str, Dict[str, Any]]:
+        """读取文件并运行全部阶段，返回各阶段统计"""
+        from .readers import ConcurrentTraceReader
+        reader = ConcurrentTraceReader(paths, max_workers=self.workers["read"], read_ahead=read_ahead)
+        return self.run_records(reader)
+
+    def run_records(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """以任意记录迭代器为数据源运行 (read 阶段为单线程的迭代，内部可以是并发读取器)"""
+        self._stop.clear()
+        self._error = None
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.STAGES) - 1)]
+        fns = [None, self._adapt, self._evaluate, self._convert, self._write]
+        self.stages = []
+        for i, name in enumerate(self.STAGES):
+            # read 阶段的并发在读取器内部，这里只有一个迭代线程
+            workers = 1 if name == "read" else self.workers[name]
+            in_q = queues[i - 1] if i > 0 else None
+            out_q = queues[i] if i < len(queues) else None
+            self.stages.append(Stage(name, fns[i], workers, in_q, out_q))
+        for upstream, downstream in zip(self.stages, self.stages[1:]):
+            upstream.downstream_workers = downstream.workers
+
+        self._start_time = time.perf_counter()
+        threads = [threading.Thread(target=self._run_source, args=(self.stages[0], records),
+                                    name="stage-read", daemon=True)]
+        for stage in self.stages[1:]:
+            for i in range(stage.workers):
+                threads.append(threading.Thread(target=self._run_worker, args=(stage,),
+                                                name=f"stage-{stage.name}-{i}", daemon=True))
+        monitor = threading.Thread(target=self._monitor, name="stage-monitor", daemon=True)
+
+        monitor.start()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self._end_time = time.perf_counter()
+        self._stop.set()
+        monitor.join()
+
+        if self._error is not None:
+            raise self._error
+        return self.stats()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        end = self._end_time if self._end_time > self._start_time else time.perf_counter()
+        elapsed = end - self._start_time
+        return {stage.name: stage.stats(elapsed) for stage in self.stages}
+
+    def bottleneck(self) -> Optional[str]:
+        """利用率最高的阶段"""
+        stats = self.stats()
+        if not stats:
+            return None
+        return max(stats, key=lambda name: stats[name]["utilization"])
+
+    def print_stats(self):
+        print("🚦 Stage stats:")
+        for name, s in self.stats().items():
+            print(f"   - {name:<8} workers={s['workers']} processed={s['processed']} "
+                  f"queue={s['queue_depth']}/{s['queue_capacity']} (avg {s['avg_queue_depth']}, max {s['max_queue_depth']}) "
+                  f"util={s['utilization']:.0%}")
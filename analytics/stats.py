@@ -0,0 +1,90 @@
+import heapq
+from collections import Counter
+from typing import List, Dict, Any, Iterable
+
+from .schemas import AnalysisResult, DatasetType
+
+
+def reason_code(reason: str) -> str:
+    """
+    提取拒绝原因的类别码，去掉附带的数值
+    "PROMPT_TOO_SHORT (len=3)" -> "PROMPT_TOO_SHORT",
+    "MISSING_REQUIRED_FIELD: metric: file.operation.count" -> "MISSING_REQUIRED_FIELD"
+    """
+    return reason.split(' ', 1)[0].split(':', 1)[0]
+
+
+class RunStats:
+    """单次运行的聚合指标快照，可跨分片合并"""
+
+    def __init__(self):
+        self.total = 0
+        self.by_type: Counter = Counter()
+        self.rejection_reasons: Counter = Counter()
+        self.score_sum = 0.0
+        self.scored = 0
+
+    def update(self, result: AnalysisResult):
+        self.total += 1
+        self.by_type[result.dataset_type.value] += 1
+        if result.dataset_type == DatasetType.REJECTED:
+            for r in result.reasons:
+                self.rejection_reasons[reason_code(r)] += 1
+        else:
+            self.score_sum += result.score
+            self.scored += 1
+
+    def merge(self, other: "RunStats") -> "RunStats":
+        self.total += other.total
+        self.by_type.update(other.by_type)
+        self.rejection_reasons.update(other.rejection_reasons)
+        self.score_sum += other.score_sum
+        self.scored += other.scored
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "by_type": dict(self.by_type),
+            "rejection_reasons": dict(self.rejection_reasons),
+            "score_sum": self.score_sum,
+            "scored": self.scored,
+            "mean_score": round(self.score_sum / self.scored, 4) if self.scored else 0.0
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RunStats":
+        stats = cls()
+        stats.total = data.get('total', 0)
+        stats.by_type = Counter(data.get('by_type', {}))
+        stats.rejection_reasons = Counter(data.get('rejection_reasons', {}))
+        stats.score_sum = data.get('score_sum', 0.0)
+        stats.scored = data.get('scored', 0)
+        return stats
+
+
+class TopK:
+    """维护得分最高的 K 条结果 (供排行榜报告使用)，可跨分片合并"""
+
+    def __init__(self, k: int = 100):
+        self.k = k
+        self._heap: List[tuple] = []
+        self._seq = 0  # 同分时保持插入顺序，避免比较 AnalysisResult
+
+    def push(self, result: AnalysisResult):
+        if result.dataset_type == DatasetType.REJECTED:
+            return
+        item = (result.score, -self._seq, result)
+        self._seq += 1
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def push_all(self, results: Iterable[AnalysisResult]):
+        for res in results:
+            self.push(res)
+
+    def results(self) -> List[AnalysisResult]:
+        """按分数降序返回"""
+        return [item[2] for item in sorted(self._heap, key=lambda x: x[:2], reverse=True)]
@@ -0,0 +1,88 @@
+"""在 FeatureStore 上重打分与完整跑一遍 TracePipeline 的结论一致"""
+import io
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from analytics.features import FeatureStoreWriter, rescore
+from analytics.pipeline import TracePipeline
+from analytics.scenarios import SCENARIO_REGISTRY, get_scenario, scenario_from_dict
+from analytics.schemas import TraceData
+
+
+def _prompt(**attrs):
+    return {"name": "gemini_cli.user_prompt", "attributes": attrs}
+
+
+def _response(thoughts, outputs):
+    return {"name": "gemini_cli.api_response",
+            "attributes": {"thoughts_token_count": thoughts, "output_token_count": outputs}}
+
+
+def _tool(name, success):
+    return {"name": "gemini_cli.tool_call", "attributes": {"function_name": name, "success": success}}
+
+
+_TRUNCATED = {"name": "gemini_cli.tool_output_truncated", "attributes": {}}
+
+_METRICS = {"gemini_cli.file.operation.count": 2, "gemini_cli.lines.changed": 30, "gemini_cli.agent.turns": 4}
+_EVENTS = [_prompt(prompt_length=40), _response(120, 300), _tool("read_file", True), _tool("edit", False)]
+
+TRACES = [
+    TraceData("ok", dict(_METRICS), list(_EVENTS)),
+    TraceData("recovery", {**_METRICS, "gemini_cli.agent.recovery_attempt.count": 2}, list(_EVENTS)),
+    TraceData("exit_and_retry_failure", {**_METRICS, "gemini_cli.exit.fail.count": 1,
+                                         "gemini_cli.chat.content_retry_failure.count": 1}, list(_EVENTS)),
+    TraceData("ineffective", {**_METRICS, "gemini_cli.lines.changed": 0}, list(_EVENTS)),
+    TraceData("truncated", dict(_METRICS), _EVENTS + [_TRUNCATED]),
+    TraceData("short_prompt", dict(_METRICS), [_prompt(prompt_length=2)] + _EVENTS[1:]),
+    TraceData("no_events", {"gemini_cli.agent.turns": 1}, []),
+    TraceData("zero_outputs", dict(_METRICS), [_prompt(prompt_length=40), _response(30, 0)]),
+    TraceData("long_run", {**_METRICS, "gemini_cli.agent.turns": 45, "gemini_cli.lines.changed": 900},
+              _EVENTS + [_tool("grep", True), _tool("bash", True), _response(500, 100)]),
+]
+
+_REWEIGHTED = scenario_from_dict({
+    "name": "reweighted",
+    "filters": [{"type": "IntegrityFilter"}, {"type": "ContextTruncationFilter"}],
+    "scorers": [{"type": "CodeProductionScorer", "weight_per_line": 0.25, "max_score": 50},
+                {"type": "ToolSuccessScorer", "max_score": 10},
+                {"type": "TurnEfficiencyScorer", "max_score": 25, "optimal_turns": 6, "penalty_per_turn": 1.5}],
+})
+
+
+def _summary(result):
+    return result.trace_id, result.score, result.dataset_type, result.reasons, result.score_breakdown
+
+
+class RescoreEquivalenceTest(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp(prefix="feature_store_test_")
+        self.addCleanup(shutil.rmtree, self.store_dir, True)
+        # 按 default 场景处理一遍，同时记录特征
+        with redirect_stdout(io.StringIO()):
+            pipeline = TracePipeline("default", feature_store=FeatureStoreWriter(self.store_dir, flush_rows=4))
+        for trace in TRACES:
+            pipeline.evaluate(trace)
+        pipeline.feature_store.close()
+
+    def test_rescore_matches_full_pipeline(self):
+        for config in list(SCENARIO_REGISTRY.values()) + [_REWEIGHTED]:
+            with redirect_stdout(io.StringIO()):
+                pipeline = TracePipeline(config)
+            expected = [_summary(pipeline.evaluate(trace)) for trace in TRACES]
+            with self.subTest(scenario=config.name):
+                self.assertEqual([_summary(r) for r in rescore(self.store_dir, config, chunk_rows=3)], expected)
+
+    def test_scenario_resolution(self):
+        self.assertIs(get_scenario("swe_bench"), SCENARIO_REGISTRY["swe_bench"])
+        self.assertIs(get_scenario(f"{__name__}:_REWEIGHTED"), _REWEIGHTED)
+        with self.assertRaises(ValueError):
+            get_scenario("unknown_scenario")
+        with self.assertRaises(ValueError):
+            get_scenario(f"{__name__}:TRACES")
+
+
+if __name__ == "__main__":
+    unittest.main()
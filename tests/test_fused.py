@@ -0,0 +1,95 @@
+"""融合 evaluate 与逐组件 TracePipeline.evaluate 在边界轨迹上的一致性"""
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from analytics import filters
+from analytics.fused import compile_scenario
+from analytics.pipeline import TracePipeline
+from analytics.scenarios import SCENARIO_REGISTRY, get_scenario, scenario_from_dict
+from analytics.schemas import TraceData
+
+
+def _prompt(**attrs):
+    return {"name": "gemini_cli.user_prompt", "attributes": attrs}
+
+
+def _response(thoughts, outputs):
+    return {"name": "gemini_cli.api_response",
+            "attributes": {"thoughts_token_count": thoughts, "output_token_count": outputs}}
+
+
+def _tool(name, success):
+    return {"name": "gemini_cli.tool_call", "attributes": {"function_name": name, "success": success}}
+
+
+_TRUNCATED = {"name": "gemini_cli.tool_output_truncated", "attributes": {}}
+
+_OK_METRICS = {"gemini_cli.file.operation.count": 2, "gemini_cli.lines.changed": 30, "gemini_cli.agent.turns": 4}
+_OK_EVENTS = [_prompt(prompt_length=40), _response(120, 300), _tool("read_file", True), _tool("edit", True)]
+
+EDGE_CASES = {
+    "ok": (_OK_METRICS, _OK_EVENTS),
+    # 两个完整性失败同时出现时只报告第一个
+    "exit_and_retry_failure": ({**_OK_METRICS, "gemini_cli.exit.fail.count": 1,
+                                "gemini_cli.chat.content_retry_failure.count": 2}, _OK_EVENTS),
+    "retry_failure_only": ({**_OK_METRICS, "gemini_cli.chat.content_retry_failure.count": 1}, _OK_EVENTS),
+    "all_filters_fail": ({"gemini_cli.exit.fail.count": 1, "gemini_cli.file.operation.count": 3,
+                          "gemini_cli.lines.changed": 0}, [_prompt(prompt_length=2), _TRUNCATED]),
+    "ineffective_file_operation": ({**_OK_METRICS, "gemini_cli.lines.changed": 0}, _OK_EVENTS),
+    "missing_file_operation_metric": ({"gemini_cli.agent.turns": 3}, _OK_EVENTS),
+    "truncated": (_OK_METRICS, _OK_EVENTS + [_TRUNCATED]),
+    "no_prompt_event": (_OK_METRICS, _OK_EVENTS[1:]),
+    "prompt_text_only": (_OK_METRICS, [_prompt(prompt="fix the failing test in utils please")] + _OK_EVENTS[1:]),
+    "prompt_without_length": (_OK_METRICS, [_prompt()] + _OK_EVENTS[1:]),
+    "two_prompts": (_OK_METRICS, [_prompt(prompt_length=3), _prompt(prompt_length=50)] + _OK_EVENTS[1:]),
+    "no_events": (_OK_METRICS, []),
+    "zero_outputs": (_OK_METRICS, [_prompt(prompt_length=40), _response(50, 0)]),
+    "failed_tools": (_OK_METRICS, [_prompt(prompt_length=40), _tool("bash", False), _tool("bash", False)]),
+    "one_turn": ({**_OK_METRICS, "gemini_cli.agent.turns": 1}, _OK_EVENTS),
+    "long_run": ({**_OK_METRICS, "gemini_cli.agent.turns": 60, "gemini_cli.lines.changed": 5000}, _OK_EVENTS),
+    "recovery": ({**_OK_METRICS, "gemini_cli.agent.recovery_attempt.count": 1}, _OK_EVENTS),
+}
+
+
+def _traces():
+    return [TraceData(trace_id=name, metrics=dict(metrics), events=list(events))
+            for name, (metrics, events) in EDGE_CASES.items()]
+
+
+class FusedEquivalenceTest(unittest.TestCase):
+    def assert_equivalent(self, config):
+        with redirect_stdout(io.StringIO()):
+            pipeline = TracePipeline(config)
+        fused = compile_scenario(config)
+        for trace in _traces():
+            with self.subTest(scenario=config.name, trace=trace.trace_id):
+                self.assertEqual(fused(trace).to_dict(), pipeline.evaluate(trace).to_dict())
+
+    def test_registry_scenarios(self):
+        for config in SCENARIO_REGISTRY.values():
+            self.assert_equivalent(config)
+
+    def test_strict_missing_fields(self):
+        with mock.patch.object(filters, "IGNORE_MISSING_FIELDS", False):
+            for config in SCENARIO_REGISTRY.values():
+                self.assert_equivalent(config)
+
+    def test_non_finite_constants(self):
+        self.assert_equivalent(scenario_from_dict({
+            "name": "unbounded",
+            "filters": [{"type": "IntegrityFilter"}],
+            "scorers": [{"type": "CodeProductionScorer", "weight_per_line": 1.0, "max_score": float("inf")},
+                        {"type": "TurnEfficiencyScorer", "max_score": 10, "penalty_per_turn": float("inf")}],
+        }))
+
+    def test_unknown_scenario_name_raises(self):
+        with self.assertRaises(ValueError):
+            get_scenario("swe_bnech")
+        with self.assertRaises(FileNotFoundError):
+            get_scenario("missing_scenario.json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""IncrementalMonitor 逐事件更新后的结论与对同一前缀做批处理 TracePipeline 的结论一致"""
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+from analytics import filters
+from analytics.adapters import OpenAIAdapter
+from analytics.incremental import IncrementalMonitor
+from analytics.pipeline import TracePipeline
+from analytics.scenarios import SCENARIO_REGISTRY
+from analytics.schemas import TraceData
+
+
+def _prompt(**attrs):
+    return {"name": "gemini_cli.user_prompt", "attributes": attrs}
+
+
+def _response(thoughts, outputs):
+    return {"name": "gemini_cli.api_response",
+            "attributes": {"thoughts_token_count": thoughts, "output_token_count": outputs}}
+
+
+def _tool(name, success):
+    return {"name": "gemini_cli.tool_call", "attributes": {"function_name": name, "success": success}}
+
+
+_TRUNCATED = {"name": "gemini_cli.tool_output_truncated", "attributes": {}}
+
+_METRICS = {"gemini_cli.file.operation.count": 2, "gemini_cli.lines.changed": 30, "gemini_cli.agent.turns": 4}
+
+# (metrics, events, 在第几个事件之后更新的指标)
+CASES = {
+    "clean": (_METRICS, [_prompt(prompt_length=40), _response(120, 300), _tool("read_file", True),
+                         _response(80, 200), _tool("edit", True)], {}),
+    "truncated_midway": (_METRICS, [_prompt(prompt_length=40), _tool("read_file", True), _TRUNCATED,
+                                    _response(10, 50)], {}),
+    "failed_tools": (_METRICS, [_prompt(prompt_length=40), _tool("bash", False), _response(0, 40),
+                                _tool("bash", False), _tool("bash", True)], {}),
+    "short_then_long_prompt": (_METRICS, [_response(5, 5), _prompt(prompt_length=3), _prompt(prompt_length=60)], {}),
+    "prompt_text_only": (_METRICS, [_prompt(prompt="fix the failing test in utils please"), _response(3, 0)], {}),
+    "metrics_arrive_late": ({}, [_prompt(prompt_length=40), _response(50, 100), _tool("write_file", True),
+                                 _response(20, 60)],
+                            {1: {"gemini_cli.agent.turns": 1},
+                             2: {"gemini_cli.file.operation.count": 1, "gemini_cli.lines.changed": 0},
+                             3: {"gemini_cli.lines.changed": 12, "gemini_cli.agent.turns": 2,
+                                 "gemini_cli.agent.recovery_attempt.count": 1}}),
+    "exit_failure_late": (_METRICS, [_prompt(prompt_length=40), _response(10, 10), _tool("edit", True)],
+                          {2: {"gemini_cli.exit.fail.count": 1, "gemini_cli.chat.content_retry_failure.count": 1}}),
+}
+
+_CONVERSATION = [
+    {"role": "user", "content": "Please fix the off-by-one error in the pagination helper."},
+    {"role": "assistant", "content": "Let me look at the file first.",
+     "tool_calls": [{"id": "c1", "function": {"name": "read_file", "arguments": '{"path": "pager.py"}'}}]},
+    {"role": "tool", "tool_call_id": "c1", "content": "def page(items, n):\n    return items[:n + 1]"},
+    {"role": "assistant", "content": "Writing the fix.",
+     "tool_calls": [{"id": "c2", "function": {"name": "write_file",
+                                              "arguments": '{"path": "pager.py", "content": "a\\nb\\nc"}'}}]},
+    {"role": "tool", "tool_call_id": "c2", "content": "Error: permission denied"},
+    {"role": "assistant", "content": "Retrying with the right permissions."},
+]
+
+
+class IncrementalEquivalenceTest(unittest.TestCase):
+    def _pipeline(self, scenario: str) -> TracePipeline:
+        with redirect_stdout(io.StringIO()):
+            return TracePipeline(scenario)
+
+    def assert_prefixes_match(self, scenario: str, trace_id: str, metrics, events, metric_updates):
+        pipeline = self._pipeline(scenario)
+        monitor = IncrementalMonitor(scenario)
+        current = dict(metrics)
+        monitor.update_metrics(trace_id, current)
+        for n in range(len(events) + 1):
+            if n:
+                monitor.add_event(trace_id, events[n - 1])
+            if n in metric_updates:
+                current.update(metric_updates[n])
+                monitor.update_metrics(trace_id, metric_updates[n])
+            with self.subTest(scenario=scenario, trace=trace_id, prefix=n):
+                expected = pipeline.evaluate(TraceData(trace_id=trace_id, metrics=dict(current), events=events[:n]))
+                self.assertEqual(monitor.snapshot(trace_id).to_dict(), expected.to_dict())
+
+        final = monitor.finish(trace_id)
+        expected = pipeline._analyze(TraceData(trace_id=trace_id, metrics=dict(current), events=list(events)))
+        self.assertEqual(final.to_dict(), expected.to_dict())
+        self.assertEqual(len(monitor), 0)
+
+    def test_edge_case_prefixes(self):
+        for scenario in SCENARIO_REGISTRY:
+            for trace_id, (metrics, events, updates) in CASES.items():
+                self.assert_prefixes_match(scenario, trace_id, metrics, events, updates)
+
+    def test_strict_missing_fields(self):
+        with mock.patch.object(filters, "IGNORE_MISSING_FIELDS", False):
+            for scenario in SCENARIO_REGISTRY:
+                for trace_id, (metrics, events, updates) in CASES.items():
+                    self.assert_prefixes_match(scenario, trace_id, metrics, events, updates)
+
+    def test_adapted_conversation(self):
+        trace = OpenAIAdapter.to_trace_data("conv", _CONVERSATION)
+        for scenario in SCENARIO_REGISTRY:
+            self.assert_prefixes_match(scenario, "conv", trace.metrics, trace.events, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
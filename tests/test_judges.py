@@ -0,0 +1,148 @@
+"""HttpJudgeScorer 对本地 HTTP 服务的端到端测试 (ThreadingHTTPServer 作为模型服务替身)"""
+import json
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from analytics.judges import HttpJudgeScorer
+from analytics.schemas import TraceData
+
+
+class _JudgeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        n = len(json.loads(body)["traces"])
+        server = self.server
+        server.requests += 1
+        mode = server.mode
+
+        self.served = getattr(self, 'served', 0) + 1
+        if mode == "drop_reused" and self.served > 1:
+            # 复用的 keep-alive 连接上不回复直接关闭 (服务端空闲超时关闭连接的情形)
+            self.close_connection = True
+            return
+        if mode == "slow":
+            time.sleep(0.5)
+        if mode == "error":
+            self._send(500, b'{"error": "overloaded"}')
+            return
+
+        data = json.dumps({"scores": [0.5] * n}).encode('utf-8')
+        if mode == "eof":
+            # 既没有 Content-Length 也不是 chunked：body 以关闭连接结束
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(data)
+            self.close_connection = True
+        elif mode == "close":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(data)
+        elif mode == "chunked":
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(data), 7):
+                chunk = data[i:i + 7]
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self._send(200, data)
+
+    def _send(self, status: int, data: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _traces(n: int):
+    return [TraceData(trace_id=f"t{i}", metrics={}, events=[]) for i in range(n)]
+
+
+class HttpJudgeScorerTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _JudgeHandler)
+        self.server.mode = "ok"
+        self.server.requests = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/judge"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _scorer(self, **kwargs) -> HttpJudgeScorer:
+        scorer = HttpJudgeScorer(self.url, max_score=20.0, **kwargs)
+        self.addCleanup(scorer.close)
+        return scorer
+
+    def test_batches_reuse_one_connection(self):
+        scorer = self._scorer(batch_size=2, max_concurrency=1)
+        self.assertEqual(scorer.score_traces(_traces(5)), [10.0] * 5)
+        self.assertEqual(scorer.batches, 3)
+        self.assertEqual(self.server.requests, 3)
+        self.assertEqual(scorer._pool.opened, 1)
+        self.assertEqual(scorer.errors, 0)
+
+    def test_chunked_body(self):
+        self.server.mode = "chunked"
+        scorer = self._scorer(batch_size=4)
+        self.assertEqual(scorer.score_traces(_traces(3)), [10.0] * 3)
+        self.assertEqual(scorer.errors, 0)
+
+    def test_unframed_or_closed_responses_are_not_reused(self):
+        for mode in ("eof", "close"):
+            with self.subTest(mode=mode):
+                self.server.mode = mode
+                self.server.requests = 0
+                scorer = self._scorer(batch_size=2, max_concurrency=1)
+                self.assertEqual(scorer.score_traces(_traces(5)), [10.0] * 5)
+                self.assertEqual(scorer.errors, 0)
+                self.assertEqual(self.server.requests, 3)
+                # 每个请求都用新连接，没有把已关闭的连接放回池中
+                self.assertEqual(scorer._pool.opened, 3)
+                self.assertEqual(scorer._pool._idle, [])
+
+    def test_non_200_falls_back(self):
+        self.server.mode = "error"
+        scorer = self._scorer(batch_size=2, fallback_score=-1.0)
+        self.assertEqual(scorer.score_traces(_traces(3)), [-1.0] * 3)
+        self.assertEqual(scorer.errors, 2)
+
+    def test_timeout_falls_back(self):
+        self.server.mode = "slow"
+        scorer = self._scorer(batch_size=2, timeout=0.1, fallback_score=-1.0)
+        self.assertEqual(scorer.score_traces(_traces(2)), [-1.0] * 2)
+        self.assertEqual(scorer.timeouts, 1)
+
+        # 超时的连接不能再复用，服务恢复后换新连接
+        self.server.mode = "ok"
+        time.sleep(0.5)
+        self.assertEqual(scorer.score_traces(_traces(2)), [10.0] * 2)
+        self.assertEqual(scorer._pool.opened, 2)
+
+    def test_server_closed_keepalive_is_retried(self):
+        self.server.mode = "drop_reused"
+        scorer = self._scorer(batch_size=1, max_concurrency=1)
+        self.assertEqual(scorer.score_traces(_traces(1)), [10.0])
+        # 第二次复用空闲连接，服务端直接关闭，客户端换新连接重试一次
+        self.assertEqual(scorer.score_traces(_traces(1)), [10.0])
+        self.assertEqual(scorer.errors, 0)
+        self.assertEqual(scorer._pool.opened, 2)
+        self.assertEqual(self.server.requests, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()